@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线批量分类工具
+对图像目录或视频文件进行分类，使用进程池（每个进程一个解释器）并行推理，
+结果以JSONL格式逐条输出，内存占用与数据集大小无关
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from classifier_engine import ClassifierEngine, DEFAULT_MODEL_PATH
+from frame_sources import VideoFrameSource, iter_image_paths
+
+# 每个工作进程中的分类引擎
+_engine = None
+
+
+def _init_worker(model_path, top_k, num_threads):
+    """工作进程初始化：加载一个解释器"""
+    global _engine
+    _engine = ClassifierEngine(model_path, top_k=top_k, num_threads=num_threads)
+
+
+def _to_record(predictions, elapsed):
+    return {
+        'top_k': [{'label': label, 'confidence': round(confidence, 6)} for label, confidence in predictions],
+        'ms': round(elapsed * 1000, 3),
+    }
+
+
+def _classify_paths(paths):
+    """工作进程：读取、预处理并分类一组图像文件"""
+    records = []
+    for path in paths:
+        start = time.perf_counter()
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            records.append({'path': path, 'error': "无法读取图像"})
+            continue
+        predictions = _engine.process_frame(image)
+        record = {'path': path}
+        record.update(_to_record(predictions, time.perf_counter() - start))
+        records.append(record)
+    return records
+
+
+def _classify_frames(items):
+    """工作进程：分类一组已在主进程中缩放好的视频帧"""
+    records = []
+    for index, timestamp, resized in items:
+        start = time.perf_counter()
+        predictions = _engine.classify_image(resized)
+        record = {'frame': index, 'timestamp': round(timestamp, 3)}
+        record.update(_to_record(predictions, time.perf_counter() - start))
+        records.append(record)
+    return records
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_video_items(path, engine):
+    """
+    在主进程中解码视频并缩放到模型输入尺寸，只把小图发送给工作进程，
+    避免在进程间传输全分辨率帧
+    """
+    with VideoFrameSource(path) as source:
+        for frame in source:
+            yield frame.index, frame.timestamp, engine.preprocess_image(frame.image, out=engine.allocate_resize_buffer())
+
+
+def run_batch(tasks, worker, executor, output, max_inflight, progress_every=1000):
+    """
+    按顺序提交任务块并写出结果，同时在途的任务块不超过 max_inflight，
+    返回 (处理数量, 失败数量, 用时)
+    """
+    inflight = collections.deque()
+    count = 0
+    failed = 0
+    start = time.perf_counter()
+    next_report = progress_every
+
+    def drain(limit):
+        nonlocal count, failed, next_report
+        while len(inflight) > limit:
+            for record in inflight.popleft().result():
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+                failed += 'error' in record
+            if count >= next_report:
+                elapsed = time.perf_counter() - start
+                print(f"已处理 {count} 条, {count / elapsed:.1f} 张/秒", file=sys.stderr)
+                next_report += progress_every
+
+    for task in tasks:
+        inflight.append(executor.submit(worker, task))
+        drain(max_inflight)
+    drain(0)
+    output.flush()
+    return count, failed, time.perf_counter() - start
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="离线批量图像分类，结果输出为JSONL")
+    parser.add_argument("input", help="图像目录或视频文件")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="TFLite模型路径")
+    parser.add_argument("--output", "-o", default="-", help="JSONL输出文件，默认输出到标准输出")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="工作进程数")
+    parser.add_argument("--threads", type=int, default=1, help="每个解释器的线程数")
+    parser.add_argument("--top-k", type=int, default=3, help="每张图像输出的结果数量")
+    parser.add_argument("--chunk-size", type=int, default=32, help="每个任务包含的图像数量")
+    parser.add_argument("--no-recursive", action="store_true", help="不遍历子目录")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input):
+        tasks = _chunks(iter_image_paths(args.input, recursive=not args.no_recursive), args.chunk_size)
+        worker = _classify_paths
+    elif os.path.isfile(args.input):
+        engine = ClassifierEngine(args.model, top_k=args.top_k)
+        tasks = _chunks(iter_video_items(args.input, engine), args.chunk_size)
+        worker = _classify_frames
+    else:
+        print(f"❌ 输入不存在: {args.input}", file=sys.stderr)
+        sys.exit(1)
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        # 使用spawn启动工作进程：视频输入时主进程已经创建了解释器，在此之后fork不安全
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(args.model, args.top_k, args.threads)) as executor:
+            count, failed, elapsed = run_batch(tasks, worker, executor, output, max_inflight=args.workers * 2)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"✅ 完成: {count} 条, 失败 {failed} 条, 用时 {elapsed:.2f}s, {rate:.1f} 张/秒", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+截图方式基准
+对比 PIL.ImageGrab 与 X11共享内存截图 在 400x300、1080p、4K 区域下的帧率，
+分别测量只截图，以及截图后缩放到模型输入尺寸（224x224）的耗时
+
+需要X服务器，例如在无显示环境下使用Xvfb:
+  Xvfb :99 -screen 0 3840x2160x24 &
+  DISPLAY=:99 python benchmarks/bench_capture.py [每种区域的帧数]
+超出屏幕尺寸的区域会被跳过
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifier_engine import resize_into
+from x11_capture import XShmGrabber
+
+REGIONS = [("400x300", 400, 300), ("1080p", 1920, 1080), ("4K", 3840, 2160)]
+
+
+def grab_imagegrab(bbox):
+    from PIL import ImageGrab
+    return np.asarray(ImageGrab.grab(bbox=bbox))
+
+
+def measure(grab, bbox, frames, resize_out=None):
+    """返回每秒帧数"""
+    for _ in range(3):
+        grab(bbox)
+    start = time.perf_counter()
+    for _ in range(frames):
+        image = grab(bbox)
+        if resize_out is not None:
+            resize_into(image, resize_out)
+    return frames / (time.perf_counter() - start)
+
+
+def main():
+    """主函数"""
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    grabber = XShmGrabber()
+    screen_width, screen_height = grabber.screen_size
+    resize_out = np.empty((224, 224, 3), dtype=np.uint8)
+    print(f"屏幕: {screen_width}x{screen_height}, 每种区域 {frames} 帧")
+    print()
+    print(f"{'区域':<10}{'方式':<12}{'截图FPS':>10}{'截图+缩放FPS':>16}{'加速比':>10}")
+
+    try:
+        for name, width, height in REGIONS:
+            if width > screen_width or height > screen_height:
+                print(f"{name:<10}屏幕尺寸不足，跳过")
+                continue
+            # 区域放在屏幕中央
+            left = (screen_width - width) // 2
+            top = (screen_height - height) // 2
+            bbox = (left, top, left + width, top + height)
+
+            imagegrab_fps = measure(grab_imagegrab, bbox, frames)
+            imagegrab_resize_fps = measure(grab_imagegrab, bbox, frames, resize_out)
+            xshm_fps = measure(grabber.grab, bbox, frames)
+            xshm_resize_fps = measure(grabber.grab, bbox, frames, resize_out)
+
+            print(f"{name:<10}{'ImageGrab':<12}{imagegrab_fps:>10.1f}{imagegrab_resize_fps:>16.1f}{1.0:>10.2f}")
+            print(f"{name:<10}{'XShm':<12}{xshm_fps:>10.1f}{xshm_resize_fps:>16.1f}"
+                  f"{xshm_resize_fps / imagegrab_resize_fps:>10.2f}")
+    finally:
+        grabber.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预处理微基准
+对比旧的逐步预处理（全分辨率颜色转换→缩放→astype→expand_dims→set_tensor）
+与融合预处理（先缩放，再一次性完成通道顺序和归一化并写入解释器输入张量）
+在1080p和4K全屏输入下的单帧耗时和内存分配
+
+用法: python benchmarks/bench_preprocess.py [模型路径] [每种尺寸的帧数]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifier_engine import ClassifierEngine, DEFAULT_MODEL_PATH
+
+RESOLUTIONS = {
+    '1080p': (1080, 1920),
+    '4K': (2160, 3840),
+}
+
+
+def legacy_preprocess(engine, rgb_image):
+    """旧版 capture_loop + preprocess_image + set_tensor 的预处理路径"""
+    img = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR)
+    target_size = (engine.input_shape[1], engine.input_shape[2])
+    resized = cv2.resize(img, target_size)
+    normalized = resized.astype(np.float32) / 255.0
+    batched = np.expand_dims(normalized, axis=0)
+    engine.interpreter.set_tensor(engine.input_details[0]['index'], batched)
+
+
+def fused_preprocess(engine, rgb_image):
+    """融合预处理路径，写入预分配缓冲区和解释器输入张量"""
+    resized = engine.preprocess_image(rgb_image)
+    engine._load_input(resized, "RGB")
+
+
+def measure(func, engine, image, frames):
+    """返回 (平均每帧耗时ms, 每帧峰值临时分配字节数)"""
+    # 预热
+    for _ in range(3):
+        func(engine, image)
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        func(engine, image)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / frames
+
+    # 单独测量分配，避免 tracemalloc 的开销影响计时
+    # numpy 的数组内存会上报给 tracemalloc；融合路径剩余的约32KB是 ufunc 类型转换的内部缓冲区
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    func(engine, image)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak - base
+
+
+def main():
+    """主函数"""
+    model_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL_PATH
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    engine = ClassifierEngine(model_path)
+    print(f"模型: {model_path}, 输入形状: {engine.input_shape}, 每种尺寸 {frames} 帧")
+    print()
+    print(f"{'分辨率':<8}{'路径':<8}{'耗时/帧(ms)':>14}{'峰值分配':>14}")
+
+    rng = np.random.default_rng(0)
+    for name, (height, width) in RESOLUTIONS.items():
+        image = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        for label, func in (('旧版', legacy_preprocess), ('融合', fused_preprocess)):
+            elapsed_ms, peak = measure(func, engine, image, frames)
+            print(f"{name:<8}{label:<8}{elapsed_ms:>14.3f}{peak / 1024:>12.1f}KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+线程流水线与多进程流水线对比
+在相同的帧源和模型上分别运行 FramePipeline（所有阶段在本进程的线程中）和 ProcessPipeline
+（捕获和推理在独立进程中，帧通过共享内存传递），同时在主线程中模拟Tk事件循环：
+每隔 --tick-ms 毫秒醒来一次，记录实际醒来时间比预定时间晚了多少（界面响应延迟），
+显示回调与界面相同，生成400x300的预览图
+
+用法:
+  python benchmarks/bench_processes.py --model model/model.tflite --source synthetic:1920x1080 --duration 10
+  python benchmarks/bench_processes.py --source replay:frames.ring --fps 30
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classifier_engine import DEFAULT_MODEL_PATH, ClassifierEngine, resize_into
+from frame_sources import create_frame_source
+from pipeline import FramePipeline
+from process_pipeline import ProcessPipeline
+from scheduler import FrameScheduler
+
+DISPLAY_SIZE = (400, 300)
+
+
+class DisplaySink:
+    """与界面相同的显示回调：在显示线程中缩放并转换颜色，只保留最新的预览图"""
+
+    def __init__(self):
+        self._resized = np.empty((DISPLAY_SIZE[1], DISPLAY_SIZE[0], 3), dtype=np.uint8)
+        self._rgb = np.empty_like(self._resized)
+        self.frames = 0
+
+    def __call__(self, frame, prediction):
+        resized = resize_into(frame.image, self._resized)
+        if frame.channel_order == "BGR":
+            cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        self.frames += 1
+
+
+def measure_ticks(duration, tick):
+    """模拟界面事件循环：按固定间隔醒来，返回每次醒来的延迟（秒）"""
+    lateness = []
+    deadline = time.perf_counter() + tick
+    end = time.perf_counter() + duration
+    while deadline < end:
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        lateness.append(max(0.0, time.perf_counter() - deadline))
+        deadline += tick
+    return np.array(lateness)
+
+
+def run_mode(mode, args, engine, frame_bytes):
+    sink = DisplaySink()
+    if mode == "threads":
+        source = create_frame_source(args.source, loop=True, replay_speed=args.replay_speed)
+        scheduler = FrameScheduler(args.fps) if args.fps else None
+        pipeline = FramePipeline(engine, source, on_result=sink, scheduler=scheduler)
+    else:
+        source = None
+        scheduler_args = (args.fps,) if args.fps else None
+        pipeline = ProcessPipeline(engine.model_path, engine.labels, create_frame_source,
+                                   (args.source, True, args.replay_speed), frame_bytes,
+                                   on_result=sink, scheduler_args=scheduler_args, num_threads=args.threads)
+    pipeline.start()
+    # 跳过启动阶段（进程启动和模型加载），从第一帧显示之后开始计时
+    while sink.frames == 0:
+        time.sleep(0.01)
+    frames_before = sink.frames
+    cpu_before = time.process_time()
+    start = time.perf_counter()
+    lateness = measure_ticks(args.duration, args.tick_ms / 1000)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_before
+    frames = sink.frames - frames_before
+    pipeline.stop()
+    if source is not None:
+        source.close()
+    return {
+        'fps': frames / elapsed,
+        'lateness_ms': lateness * 1000,
+        'main_cpu': cpu / elapsed,
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="线程流水线与多进程流水线对比")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="TFLite模型路径")
+    parser.add_argument("--source", default="synthetic:1920x1080", help="帧源（与 headless.py 相同的格式）")
+    parser.add_argument("--replay-speed", type=float, default=0, help="回放帧录制文件的速度，0为尽可能快")
+    parser.add_argument("--fps", type=float, default=None, help="目标捕获帧率，默认不限制")
+    parser.add_argument("--threads", type=int, default=None, help="解释器线程数")
+    parser.add_argument("--duration", type=float, default=10.0, help="每种方式的计时时长（秒）")
+    parser.add_argument("--tick-ms", type=float, default=10.0, help="模拟界面事件循环的间隔（毫秒）")
+    parser.add_argument("--modes", default="threads,processes", help="依次测试的运行方式")
+    args = parser.parse_args()
+
+    engine = ClassifierEngine(args.model, num_threads=args.threads)
+    with create_frame_source(args.source, replay_speed=0) as source:
+        frame_bytes = source.read().image.nbytes
+    print(f"帧源 {args.source}, 模型 {args.model}, 每种方式 {args.duration:.0f}s, CPU核心 {os.cpu_count()}")
+    print()
+    print(f"{'方式':<12}{'吞吐(FPS)':>10}{'主进程CPU':>10}{'延迟p50':>10}{'p95':>8}{'p99':>8}{'最大':>8}  (界面事件循环延迟, ms)")
+    for mode in args.modes.split(","):
+        result = run_mode(mode, args, engine, frame_bytes)
+        lateness = result['lateness_ms']
+        print(f"{mode:<12}{result['fps']:>10.1f}{result['main_cpu']:>10.0%}{np.percentile(lateness, 50):>10.2f}"
+              f"{np.percentile(lateness, 95):>8.2f}{np.percentile(lateness, 99):>8.2f}{lateness.max():>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
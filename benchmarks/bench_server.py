@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理服务负载生成器
+用多个并发客户端（每个线程一个连接）向推理服务发送分类请求，报告吞吐量和延迟分位数；
+未指定 --address 时，对 --max-batch 中的每个值启动一个服务子进程分别测试，便于比较微批处理的效果
+
+用法:
+  python benchmarks/bench_server.py --model model/model.tflite --concurrency 16 --requests 2000 --max-batch 1,4,8
+  python benchmarks/bench_server.py --address 127.0.0.1:8500 --format npy
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classifier_engine import DEFAULT_MODEL_PATH
+from inference_server import InferenceClient
+
+
+def make_payload(image_path, size, fmt):
+    """生成请求内容：样例图像或合成图像，fmt 为 jpeg（编码后的字节）或 npy（uint8数组）"""
+    if image_path:
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"无法读取样例图像: {image_path}")
+    else:
+        width, height = size
+        image = np.random.default_rng(0).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    if fmt == "npy":
+        return image
+    ok, encoded = cv2.imencode(".jpg", image)
+    return encoded.tobytes()
+
+
+def wait_until_ready(address, timeout=60.0):
+    client = InferenceClient(address, timeout=2)
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            return client.health()
+        except (OSError, RuntimeError):
+            if time.perf_counter() > deadline:
+                raise
+            time.sleep(0.1)
+        finally:
+            client.close()
+
+
+def run_load(address, payload, concurrency, total_requests, warmup):
+    """并发发送请求，返回客户端测得的延迟（秒）、总耗时和错误数"""
+    counter = iter(range(total_requests))
+    counter_lock = threading.Lock()
+    latencies = []
+    errors = []
+
+    def worker():
+        client = InferenceClient(address)
+        local = []
+        try:
+            try:
+                for _ in range(warmup):
+                    client.classify(payload)
+            finally:
+                barrier.wait()
+            while True:
+                with counter_lock:
+                    if next(counter, None) is None:
+                        break
+                start = time.perf_counter()
+                try:
+                    client.classify(payload)
+                except Exception as e:
+                    errors.append(str(e))
+                    continue
+                local.append(time.perf_counter() - start)
+        finally:
+            client.close()
+            with counter_lock:
+                latencies.extend(local)
+
+    # 所有客户端预热完成后同时开始计时
+    barrier = threading.Barrier(concurrency + 1)
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), time.perf_counter() - start, errors
+
+
+def report(name, latencies, elapsed, errors, server_stats=None):
+    latencies_ms = latencies * 1000
+    line = (f"{name:<22}{len(latencies) / elapsed:>10.1f}{np.percentile(latencies_ms, 50):>9.2f}"
+            f"{np.percentile(latencies_ms, 95):>9.2f}{np.percentile(latencies_ms, 99):>9.2f}")
+    if server_stats is not None:
+        line += f"{server_stats['mean_batch_size']:>10.2f}"
+    if errors:
+        line += f"  错误 {len(errors)} 次: {errors[0]}"
+    print(line)
+
+
+def start_server(args, max_batch, unix_socket):
+    command = [sys.executable, os.path.join(ROOT, "inference_server.py"), "--model", args.model,
+               "--max-batch", str(max_batch), "--max-wait-ms", str(args.max_wait_ms)]
+    if args.threads:
+        command += ["--threads", str(args.threads)]
+    if unix_socket:
+        command += ["--unix", unix_socket]
+        address = f"unix:{unix_socket}"
+    else:
+        command += ["--port", str(args.port)]
+        address = f"127.0.0.1:{args.port}"
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return proc, address
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="推理服务负载生成器")
+    parser.add_argument("--address", default=None, help="已运行的服务地址（host:port 或 unix:路径）")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="启动服务子进程时使用的模型")
+    parser.add_argument("--max-batch", default="1,4,8", help="依次测试的最大批量，逗号分隔")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="组批最长等待时间（毫秒）")
+    parser.add_argument("--threads", type=int, default=None, help="服务端解释器线程数")
+    parser.add_argument("--port", type=int, default=8517, help="服务子进程的端口")
+    parser.add_argument("--unix", action="store_true", help="服务子进程监听Unix套接字")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=2000, help="计时的请求总数")
+    parser.add_argument("--warmup", type=int, default=5, help="每个客户端的预热请求数")
+    parser.add_argument("--format", choices=("jpeg", "npy"), default="jpeg", help="请求内容格式")
+    parser.add_argument("--image", default=None, help="样例图像，默认使用合成图像")
+    parser.add_argument("--size", default="640x480", help="合成图像尺寸 WxH")
+    args = parser.parse_args()
+
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    payload = make_payload(args.image, size, args.format)
+    print(f"并发客户端 {args.concurrency}, 请求 {args.requests} 次, 格式 {args.format}, "
+          f"组批等待 {args.max_wait_ms}ms")
+    print()
+    print(f"{'配置':<22}{'吞吐(张/秒)':>10}{'p50(ms)':>9}{'p95(ms)':>9}{'p99(ms)':>9}{'平均批量':>10}")
+
+    if args.address:
+        wait_until_ready(args.address)
+        latencies, elapsed, errors = run_load(args.address, payload, args.concurrency, args.requests, args.warmup)
+        client = InferenceClient(args.address)
+        report(args.address, latencies, elapsed, errors, client.stats())
+        client.close()
+        return
+
+    for max_batch in (int(v) for v in args.max_batch.split(",")):
+        unix_socket = os.path.join(tempfile.gettempdir(), f"classifier-bench-{os.getpid()}.sock") if args.unix else None
+        proc, address = start_server(args, max_batch, unix_socket)
+        try:
+            wait_until_ready(address)
+            latencies, elapsed, errors = run_load(address, payload, args.concurrency, args.requests, args.warmup)
+            client = InferenceClient(address)
+            # 服务端统计包含预热请求，平均批量仍可用于比较
+            server_stats = client.stats()
+            client.close()
+        finally:
+            proc.terminate()
+            proc.wait()
+        report(f"max_batch={max_batch}", latencies, elapsed, errors, server_stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时和内存基准
+在独立的子进程中分别测量每种TFLite运行时的 导入耗时、创建解释器到第一次推理的耗时 和 进程常驻内存，
+另外测量不加载运行时时导入界面模块（main.py）的耗时
+
+用法: python benchmarks/bench_startup.py [模型路径]
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classifier_engine import DEFAULT_MODEL_PATH
+from tflite_backend import BACKENDS
+
+# 在子进程中执行，结果以一行JSON输出
+CHILD_CODE = r"""
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, ROOT)
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        return None
+
+result = {}
+if BACKEND == "gui":
+    import main
+    result['import_s'] = time.perf_counter() - start
+    result['tensorflow_loaded'] = 'tensorflow' in sys.modules
+else:
+    import numpy as np
+    import tflite_backend
+    backend = tflite_backend.load_backend(BACKEND)
+    result['import_s'] = time.perf_counter() - start
+    interpreter = tflite_backend.create_interpreter(MODEL, backend=backend)
+    interpreter.allocate_tensors()
+    detail = interpreter.get_input_details()[0]
+    interpreter.set_tensor(detail['index'], np.zeros(detail['shape'], dtype=detail['dtype']))
+    interpreter.invoke()
+    result['first_invoke_s'] = time.perf_counter() - start
+result['rss_mb'] = rss_mb()
+print("RESULT " + json.dumps(result))
+"""
+
+
+def run_child(backend, model_path):
+    code = f"ROOT = {ROOT!r}\nBACKEND = {backend!r}\nMODEL = {model_path!r}\n" + CHILD_CODE
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    # 导入失败等情况，返回最后一行错误信息
+    lines = (proc.stderr or proc.stdout).strip().splitlines()
+    return {'error': lines[-1] if lines else f"退出码 {proc.returncode}"}
+
+
+def main():
+    """主函数"""
+    model_path = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL_PATH)
+    print(f"模型: {model_path}")
+    print()
+    print(f"{'运行时':<18}{'导入(s)':>10}{'首次推理(s)':>14}{'RSS(MB)':>10}")
+
+    for backend in ("gui",) + BACKENDS:
+        result = run_child(backend, model_path)
+        name = "main.py (无运行时)" if backend == "gui" else backend
+        if 'error' in result:
+            print(f"{name:<18}不可用: {result['error']}")
+            continue
+        first = f"{result['first_invoke_s']:.2f}" if 'first_invoke_s' in result else "-"
+        rss = f"{result['rss_mb']:.0f}" if result['rss_mb'] is not None else "-"
+        print(f"{name:<18}{result['import_s']:>10.2f}{first:>14}{rss:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分块推理基准
+对比同一帧切块后 一次批量 invoke 与 逐块 invoke 的耗时和吞吐量
+
+用法: python benchmarks/bench_tiles.py [模型路径] [每种网格的帧数]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifier_engine import ClassifierEngine, DEFAULT_MODEL_PATH
+
+GRIDS = [(2, 2), (3, 3), (4, 4)]
+OVERLAP = 0.1
+
+
+def run_batch(engine, image, grid):
+    boxes, batch = engine.preprocess_tiles(image, grid, OVERLAP)
+    engine.summarize_tiles(boxes, engine.classify_batch(batch, "RGB"))
+
+
+def run_sequential(engine, image, grid):
+    boxes, batch = engine.preprocess_tiles(image, grid, OVERLAP)
+    for tile in batch:
+        engine.classify_image(tile, "RGB")
+
+
+def measure(func, engine, image, grid, frames):
+    """返回平均每帧耗时（毫秒）"""
+    # 预热（包括批量解释器的创建）
+    for _ in range(3):
+        func(engine, image, grid)
+    start = time.perf_counter()
+    for _ in range(frames):
+        func(engine, image, grid)
+    return (time.perf_counter() - start) * 1000 / frames
+
+
+def main():
+    """主函数"""
+    model_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL_PATH
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+
+    engine = ClassifierEngine(model_path)
+    image = np.random.default_rng(0).integers(0, 256, size=(1080, 1920, 3), dtype=np.uint8)
+    print(f"模型: {model_path}, 1080p输入, 每种网格 {frames} 帧")
+    print()
+    print(f"{'网格':<8}{'方式':<8}{'耗时/帧(ms)':>14}{'块/秒':>12}{'加速比':>10}")
+
+    for grid in GRIDS:
+        tiles = grid[0] * grid[1]
+        sequential_ms = measure(run_sequential, engine, image, grid, frames)
+        batch_ms = measure(run_batch, engine, image, grid, frames)
+        name = f"{grid[0]}x{grid[1]}"
+        print(f"{name:<8}{'逐块':<8}{sequential_ms:>14.2f}{tiles * 1000 / sequential_ms:>12.1f}{1.0:>10.2f}")
+        print(f"{name:<8}{'批量':<8}{batch_ms:>14.2f}{tiles * 1000 / batch_ms:>12.1f}{sequential_ms / batch_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
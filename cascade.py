@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+置信度门控的模型级联
+按推理耗时从快到慢排列多个模型，每帧先由最快的模型分类，只有top-1置信度低于阈值
+或top-1与top-2之差过小时，才交给下一级更慢（通常更准确）的模型；
+统计每一级最终给出结果的比例，以及平均耗时与始终使用最后一级（最大的）模型时的对比
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from classifier_engine import BufferPool, resize_into
+
+
+def measure_invoke_time(engine, runs=5):
+    """用全零输入测量引擎单帧分类的平均耗时（秒），第一次调用作为预热不计时"""
+    image = np.zeros(engine.resized_shape, dtype=np.uint8)
+    engine.classify_image(image)
+    start = time.perf_counter()
+    for _ in range(runs):
+        engine.classify_image(image)
+    return (time.perf_counter() - start) / runs
+
+
+class CascadeClassifier:
+    """
+    模型级联，接口与 MultiModelClassifier 相同（preprocess / classify / process_frame），
+    可以直接交给 FramePipeline 的 fanout 参数；每帧返回的记录包含最终预测和经过的各级
+    """
+
+    def __init__(self, engines, threshold=0.6, margin=0.1, sort_by_speed=True, calibrate_runs=5, max_buffers=4):
+        """
+        engines: {模型名称: ClassifierEngine}；sort_by_speed 为 True 时按测得的推理耗时从快到慢排列，
+        否则保持给定的顺序
+        threshold: top-1置信度低于该值时升级到下一级
+        margin: top-1与top-2置信度之差低于该值时升级到下一级
+        """
+        if not engines:
+            raise ValueError("级联至少需要一个模型")
+        self.threshold = threshold
+        self.margin = margin
+
+        timings = {name: measure_invoke_time(engine, calibrate_runs) for name, engine in engines.items()}
+        self.stage_names = sorted(engines, key=timings.get) if sort_by_speed else list(engines)
+        self.engines = {name: engines[name] for name in self.stage_names}
+        # 各级的校准耗时；最后一级（最大的模型）的耗时作为"始终使用大模型"的基准
+        self.calibrated = {name: timings[name] for name in self.stage_names}
+
+        # 第一级的缩放缓冲区在 classify 之后由调用方 release() 归还
+        self._buffers = BufferPool(max_buffers)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.frames = 0
+            self.total_time = 0.0
+            # 每一级最终给出结果的帧数、被执行的次数和累计耗时
+            self.hits = dict.fromkeys(self.stage_names, 0)
+            self.runs = dict.fromkeys(self.stage_names, 0)
+            self.stage_time = dict.fromkeys(self.stage_names, 0.0)
+            # 升级后最终top-1与第一级top-1不同的帧数
+            self.changed = 0
+
+    def is_confident(self, prediction):
+        """top-1置信度不低于阈值，且与top-2之差不小于 margin"""
+        if not prediction:
+            return False
+        top1 = prediction[0][1]
+        top2 = prediction[1][1] if len(prediction) > 1 else 0.0
+        return top1 >= self.threshold and top1 - top2 >= self.margin
+
+    def preprocess(self, image):
+        """
+        只为第一级缩放，返回 (原图, 缩放结果)；升级时才按后续模型的输入尺寸缩放原图。
+        用完后交给 release() 归还缓冲区
+        """
+        first = self.engines[self.stage_names[0]]
+        return image, resize_into(image, self._buffers.acquire(first.resized_shape))
+
+    def release(self, data):
+        """归还 preprocess() 返回的缩放缓冲区"""
+        self._buffers.release(data[1])
+
+    def classify(self, data, channel_order="BGR"):
+        """逐级分类直到结果足够可信，返回记录 {'predictions', 'stage', 'level', 'stages', 'elapsed'}"""
+        image, resized = data
+        start = time.perf_counter()
+        stages = []
+        prediction = None
+        for level, name in enumerate(self.stage_names):
+            engine = self.engines[name]
+            stage_input = resized if engine.resized_shape == resized.shape else engine.preprocess_image(image)
+            stage_start = time.perf_counter()
+            prediction = engine.classify_image(stage_input, channel_order)
+            stage_elapsed = time.perf_counter() - stage_start
+            stages.append({'name': name, 'predictions': prediction, 'elapsed': stage_elapsed})
+            if self.is_confident(prediction):
+                break
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.frames += 1
+            self.total_time += elapsed
+            self.hits[name] += 1
+            for stage in stages:
+                self.runs[stage['name']] += 1
+                self.stage_time[stage['name']] += stage['elapsed']
+            if len(stages) > 1 and stages[0]['predictions'] and prediction \
+                    and stages[0]['predictions'][0][0] != prediction[0][0]:
+                self.changed += 1
+
+        return {
+            'predictions': prediction,
+            'stage': name,
+            'level': level,
+            'stages': stages,
+            'elapsed': elapsed,
+        }
+
+    def process_frame(self, image, channel_order="BGR"):
+        """对一帧图像完成级联分类"""
+        data = self.preprocess(image)
+        try:
+            return self.classify(data, channel_order)
+        finally:
+            self.release(data)
+
+    def _stage_mean(self, name):
+        """某一级的平均耗时：有实际运行记录时使用实测值，否则使用校准值"""
+        if self.runs[name]:
+            return self.stage_time[name] / self.runs[name]
+        return self.calibrated[name]
+
+    def get_stats(self):
+        """返回各级命中率、平均耗时，以及与始终使用最后一级模型相比的耗时"""
+        with self._lock:
+            frames = self.frames
+            stages = []
+            for name in self.stage_names:
+                stages.append({
+                    'name': name,
+                    'hits': self.hits[name],
+                    'hit_rate': self.hits[name] / frames if frames else 0.0,
+                    'runs': self.runs[name],
+                    'mean_ms': self._stage_mean(name) * 1000,
+                })
+            mean_ms = self.total_time / frames * 1000 if frames else 0.0
+            baseline_ms = self._stage_mean(self.stage_names[-1]) * 1000
+            escalated = frames - self.hits[self.stage_names[0]]
+            changed = self.changed
+        return {
+            'frames': frames,
+            'threshold': self.threshold,
+            'margin': self.margin,
+            'stages': stages,
+            'mean_ms': mean_ms,
+            'baseline_ms': baseline_ms,
+            'speedup': baseline_ms / mean_ms if mean_ms > 0 else 0.0,
+            'escalated': escalated,
+            'changed': changed,
+        }
+
+    def format_stats(self):
+        """生成一行简短的级联统计文本"""
+        stats = self.get_stats()
+        hits = " / ".join(f"{stage['name']} {stage['hit_rate']:.0%}" for stage in stats['stages'])
+        return f"级联: {hits} | 平均 {stats['mean_ms']:.1f}ms (只用最后一级 {stats['baseline_ms']:.1f}ms)"
+
+    def close(self):
+        pass
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+画面变化检测
+在很小的灰度缩略图上比较当前帧与上一次分类的帧，画面基本不变时复用上一次的预测结果
+"""
+
+import threading
+import time
+
+import numpy as np
+import cv2
+
+
+class ChangeDetector:
+    """
+    mode="diff"  : 缩略图平均绝对差（0-255），超过 threshold 视为变化
+    mode="dhash" : 差值感知哈希的汉明距离（0-64），超过 threshold 视为变化
+    refresh_interval 秒内至少重新分类一次，防止缓慢变化被一直忽略
+    """
+
+    def __init__(self, threshold=2.0, refresh_interval=2.0, mode="diff", thumb_size=(32, 18)):
+        if mode not in ("diff", "dhash"):
+            raise ValueError(f"未知的变化检测模式: {mode}")
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self.mode = mode
+        self.thumb_size = (9, 8) if mode == "dhash" else thumb_size
+
+        self._reference = None
+        self._reference_key = None
+        self._reference_time = 0.0
+        # 参考帧编号，每次提交新的参考帧加一
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _thumbnail(self, image):
+        """计算灰度缩略图；先按步长取样，避免在全分辨率上做区域平均"""
+        height, width = image.shape[:2]
+        step = max(1, min(height // (self.thumb_size[1] * 4), width // (self.thumb_size[0] * 4)))
+        sampled = image[::step, ::step]
+        thumb = cv2.resize(sampled, self.thumb_size, interpolation=cv2.INTER_AREA)
+        if thumb.ndim == 3:
+            # 各通道取平均作为亮度，与通道顺序无关；4通道图像忽略第4通道（填充）
+            thumb = thumb[:, :, :3].mean(axis=2, dtype=np.float32)
+        return thumb.astype(np.float32)
+
+    def _distance(self, a, b):
+        if self.mode == "dhash":
+            return int(np.count_nonzero((a[:, 1:] > a[:, :-1]) != (b[:, 1:] > b[:, :-1])))
+        return float(np.abs(a - b).mean())
+
+    def check(self, image, key=None):
+        """
+        与当前参考帧比较但不更新参考帧，返回 (是否需要重新分类, reference):
+          需要重新分类时 reference 为待提交的新参考帧，这一帧实际分类之后再调用 commit(reference)；
+          可以复用时 reference 为所匹配的参考帧的编号，只有上一次结果正是该参考帧分类得到的才应复用
+        用于帧可能在分类之前被丢弃的场合（流水线的最新帧优先队列）
+        """
+        thumb = self._thumbnail(image)
+        now = time.monotonic()
+
+        with self._lock:
+            changed = (
+                self._reference is None or
+                key != self._reference_key or
+                now - self._reference_time >= self.refresh_interval or
+                self._distance(thumb, self._reference) > self.threshold
+            )
+            if changed:
+                return True, (thumb, key, now)
+            self.hits += 1
+            return False, self._generation
+
+    def commit(self, reference):
+        """把 check() 返回的待提交参考帧设为新的参考帧（这一帧已经分类），返回参考帧编号"""
+        thumb, key, now = reference
+        with self._lock:
+            self._reference = thumb
+            self._reference_key = key
+            self._reference_time = now
+            self._generation += 1
+            self.misses += 1
+            return self._generation
+
+    def should_classify(self, image, key=None):
+        """
+        返回 True 表示需要重新分类（并立即把当前帧作为新的参考帧），
+        返回 False 表示可以复用上一次的结果；key 变化（例如切换了模型）时总是重新分类。
+        只适用于每一帧都会被分类的顺序处理
+        """
+        changed, reference = self.check(image, key)
+        if changed:
+            self.commit(reference)
+        return changed
+
+    def reset(self):
+        with self._lock:
+            self._reference = None
+            self._reference_key = None
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
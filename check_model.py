@@ -5,31 +5,62 @@
 用于验证TFLite模型的兼容性和基本信息
 """
 
-import tensorflow as tf
 import numpy as np
+import argparse
+import csv
+import io
+import json
+import multiprocessing
 import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
 
-def check_model(model_path):
-    """检查TFLite模型的基本信息"""
+import tflite_backend
+from model_index import describe_tensor
+from model_memory import process_memory
+
+# 退出码：全部通过 / 有模型加载失败或不兼容 / 没有找到模型
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_NO_MODELS = 2
+
+# 兼容性判定
+VERDICT_OK = "compatible"
+VERDICT_WARNING = "warning"
+VERDICT_INCOMPATIBLE = "incompatible"
+VERDICT_ERROR = "error"
+
+EXPECTED_INPUT_SIZES = [224, 299, 512]
+
+def check_model(model_path, record=None):
+    """
+    检查TFLite模型的基本信息
+    传入 record 字典时，把签名、类别数量、量化、加载耗时和兼容性判定写入其中
+    """
     print(f"正在检查模型: {model_path}")
     print("=" * 50)
     
     # 检查文件是否存在
     if not os.path.exists(model_path):
         print(f"❌ 错误: 模型文件不存在: {model_path}")
+        if record is not None:
+            record.update({'verdict': VERDICT_ERROR, 'error': "模型文件不存在"})
         return False
     
     try:
-        # 加载模型
-        interpreter = tf.lite.Interpreter(model_path=model_path)
+        # 加载模型，计时包括解析模型和分配张量
+        start = time.perf_counter()
+        interpreter = tflite_backend.create_interpreter(model_path)
         interpreter.allocate_tensors()
+        load_seconds = time.perf_counter() - start
         
         # 获取输入输出信息
         input_details = interpreter.get_input_details()
         output_details = interpreter.get_output_details()
         
-        print("✅ 模型加载成功!")
+        print(f"✅ 模型加载成功! (耗时 {load_seconds * 1000:.1f} ms)")
         print()
         
         # 显示输入信息
@@ -58,10 +89,26 @@ def check_model(model_path):
         # 检查兼容性
         check_compatibility(input_details, output_details)
         
+        if record is not None:
+            verdict, issues = evaluate_compatibility(input_details, output_details)
+            inputs = [describe_tensor(detail) for detail in input_details]
+            outputs = [describe_tensor(detail) for detail in output_details]
+            record.update({
+                'verdict': verdict,
+                'issues': issues,
+                'load_ms': load_seconds * 1000,
+                'num_classes': outputs[0]['shape'][-1] if outputs else None,
+                'quantized': any(tensor['quantization'] is not None for tensor in inputs + outputs),
+                'inputs': inputs,
+                'outputs': outputs,
+            })
+        
         return True
         
     except Exception as e:
         print(f"❌ 模型检查失败: {e}")
+        if record is not None:
+            record.update({'verdict': VERDICT_ERROR, 'error': str(e)})
         return False
 
 def analyze_model_type(input_details, output_details):
@@ -97,31 +144,63 @@ def check_compatibility(input_details, output_details):
     
     # 检查输入尺寸
     input_shape = input_details[0]['shape']
-    expected_sizes = [224, 299, 512]
     input_size = input_shape[1]  # 假设是正方形输入
     
-    if input_size in expected_sizes:
+    if input_size in EXPECTED_INPUT_SIZES:
         print(f"   ✅ 输入尺寸 {input_size}x{input_size} 是常见尺寸")
     else:
         print(f"   ⚠️  输入尺寸 {input_size}x{input_size} 不是常见尺寸")
-        print(f"      常见尺寸: {expected_sizes}")
+        print(f"      常见尺寸: {EXPECTED_INPUT_SIZES}")
     
     # 检查数据类型
     input_dtype = input_details[0]['dtype']
     if input_dtype == np.float32:
         print("   ✅ 输入数据类型: float32 (标准)")
+    elif input_dtype in (np.uint8, np.int8):
+        print(f"   ✅ 输入数据类型: {np.dtype(input_dtype).name} (量化输入，直接输入整数像素)")
     else:
-        print(f"   ⚠️  输入数据类型: {input_dtype} (可能需要特殊处理)")
+        print(f"   ⚠️  输入数据类型: {input_dtype} (不支持，需要特殊处理)")
     
-    # 检查量化
-    input_quant = input_details[0].get('quantization', None)
-    if input_quant:
-        print("   ⚠️  模型已量化，可能需要特殊处理")
+    # 检查量化，scale 为 0 表示未量化
+    input_scale, input_zero_point = input_details[0].get('quantization', (0.0, 0))
+    output_scale, output_zero_point = output_details[0].get('quantization', (0.0, 0))
+    if input_scale:
+        print(f"   ✅ 输入已量化 (scale={input_scale:.6g}, zero_point={input_zero_point})，使用量化输入路径")
     else:
-        print("   ✅ 模型未量化，使用标准处理")
+        print("   ✅ 输入未量化，使用标准处理")
+    if output_scale:
+        print(f"   ✅ 输出已量化 (scale={output_scale:.6g}, zero_point={output_zero_point})，只对top-k结果反量化")
     
     print()
 
+def evaluate_compatibility(input_details, output_details):
+    """
+    返回兼容性判定和问题列表：
+    无法按图像分类使用的模型为 incompatible，可以使用但不常见的为 warning
+    """
+    errors = []
+    warnings = []
+    
+    input_shape = [int(v) for v in input_details[0]['shape']]
+    if len(input_shape) != 4 or input_shape[3] != 3:
+        errors.append(f"非标准图像输入 {input_shape}")
+    elif input_shape[1] not in EXPECTED_INPUT_SIZES:
+        warnings.append(f"输入尺寸 {input_shape[1]}x{input_shape[2]} 不是常见尺寸")
+    
+    input_dtype = input_details[0]['dtype']
+    if input_dtype not in (np.float32, np.uint8, np.int8):
+        errors.append(f"不支持的输入数据类型 {np.dtype(input_dtype).name}")
+    
+    output_shape = [int(v) for v in output_details[0]['shape']]
+    if len(output_shape) != 2 or output_shape[0] != 1:
+        errors.append(f"非标准分类输出 {output_shape}")
+    
+    if errors:
+        return VERDICT_INCOMPATIBLE, errors + warnings
+    if warnings:
+        return VERDICT_WARNING, warnings
+    return VERDICT_OK, []
+
 def suggest_labels(num_classes):
     """根据类别数量建议标签"""
     print("🏷️  标签建议:")
@@ -141,11 +220,63 @@ def suggest_labels(num_classes):
     
     print()
 
-def auto_check_all_models():
-    """自动检查指定目录下的所有模型"""
-    import glob
-    
+def inspect_model_for_report(model_path, backend_name=None):
+    """
+    在工作进程中检查一个模型：捕获控制台输出，返回结构化的检查结果
+    输出随结果一起返回，由主进程按完成顺序打印，避免多个进程的输出交错
+    """
+    record = {'model': os.path.basename(model_path), 'path': os.path.abspath(model_path)}
+    buffer = io.StringIO()
+    with redirect_stdout(buffer):
+        try:
+            record['backend'] = tflite_backend.load_backend(backend_name).name
+            record['size_bytes'] = os.path.getsize(model_path)
+            record['ok'] = check_model(model_path, record)
+        except Exception as e:
+            print(f"❌ 模型检查失败: {e}")
+            record.update({'ok': False, 'verdict': VERDICT_ERROR, 'error': str(e)})
+    record['output'] = buffer.getvalue()
+    return record
+
+def find_default_model_dir():
+    """查找默认模型目录，找不到时返回 None"""
     model_dir = r"C:\Users\AI_LAB_Student\image_classifier - Copy\model"
+    for path in (model_dir, "model"):
+        if os.path.isdir(path):
+            return path
+    return None
+
+def write_report(report, path):
+    """写入检查报告：扩展名为 .csv 时每个模型一行，否则写入JSON（'-' 表示标准输出）"""
+    if not path.lower().endswith(".csv"):
+        write_json(report, path)
+        return
+    
+    columns = ['model', 'verdict', 'load_ms', 'num_classes', 'quantized', 'input_shape', 'input_dtype',
+               'output_shape', 'output_dtype', 'size_bytes', 'backend', 'issues', 'error']
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for record in report['models']:
+            row = {key: record.get(key) for key in columns}
+            if record.get('load_ms') is not None:
+                row['load_ms'] = f"{record['load_ms']:.2f}"
+            for prefix, key in (('input', 'inputs'), ('output', 'outputs')):
+                if record.get(key):
+                    tensor = record[key][0]
+                    row[f'{prefix}_shape'] = "x".join(str(v) for v in tensor['shape'])
+                    row[f'{prefix}_dtype'] = tensor['dtype']
+            row['issues'] = "; ".join(record.get('issues') or [])
+            writer.writerow(row)
+    print(f"📄 报告已写入: {path}")
+
+def auto_check_all_models(model_dir=None, workers=None, report_path=None, backend_name=None, strict=False):
+    """
+    并行检查目录下的所有模型，每个模型在独立的进程中加载
+    返回退出码：全部通过为 EXIT_OK，有模型加载失败或不兼容为 EXIT_FAILED
+    （strict 为 True 时 warning 也视为失败），目录中没有模型为 EXIT_NO_MODELS
+    """
+    model_dir = model_dir or find_default_model_dir()
     
     print("🔍 自动检查所有模型")
     print("=" * 50)
@@ -153,106 +284,316 @@ def auto_check_all_models():
     print()
     
     # 检查目录是否存在
-    if not os.path.exists(model_dir):
+    if model_dir is None or not os.path.isdir(model_dir):
         print(f"❌ 目录不存在: {model_dir}")
-        return False
+        return EXIT_NO_MODELS
     
     # 搜索所有.tflite文件
-    tflite_files = glob.glob(os.path.join(model_dir, "*.tflite"))
+    with os.scandir(model_dir) as scan:
+        tflite_files = sorted(entry.path for entry in scan
+                              if entry.is_file() and entry.name.lower().endswith(".tflite"))
     
     if not tflite_files:
         print("❌ 在指定目录中未找到.tflite文件")
-        return False
+        return EXIT_NO_MODELS
     
-    print(f"✅ 找到 {len(tflite_files)} 个模型文件:")
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tflite_files)))
+    print(f"✅ 找到 {len(tflite_files)} 个模型文件，使用 {workers} 个进程检查:")
     for i, model_file in enumerate(tflite_files, 1):
         print(f"   {i}. {os.path.basename(model_file)}")
     print()
     
-    # 检查每个模型
-    results = {}
-    for i, model_file in enumerate(tflite_files):
-        print(f"📋 检查模型 {i+1}/{len(tflite_files)}: {os.path.basename(model_file)}")
+    # 检查每个模型，按完成顺序打印各自的输出
+    start = time.perf_counter()
+    records = []
+    
+    def report_progress(record):
+        records.append(record)
+        print(f"📋 [{len(records)}/{len(tflite_files)}] {record['model']}")
         print("-" * 40)
-        
-        success = check_model(model_file)
-        results[model_file] = success
-        
-        if i < len(tflite_files) - 1:  # 不是最后一个模型
-            print("\n" + "=" * 60 + "\n")
+        print(record.pop('output'), end="")
+        print("=" * 60)
+        print()
+    
+    if workers == 1:
+        for model_file in tflite_files:
+            report_progress(inspect_model_for_report(model_file, backend_name))
+    else:
+        # 使用spawn启动工作进程，各平台行为一致，也不会继承主进程中已加载的运行时
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = {executor.submit(inspect_model_for_report, model_file, backend_name): model_file
+                       for model_file in tflite_files}
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # 工作进程崩溃（例如运行时段错误）时记录为加载失败
+                    model_file = futures[future]
+                    record = {'model': os.path.basename(model_file), 'path': os.path.abspath(model_file),
+                              'ok': False, 'verdict': VERDICT_ERROR, 'error': f"工作进程异常: {e}",
+                              'output': f"❌ 工作进程异常: {e}\n"}
+                report_progress(record)
+    elapsed = time.perf_counter() - start
+    records.sort(key=lambda record: record['model'])
     
     # 生成检查报告
+    failing = {VERDICT_ERROR, VERDICT_INCOMPATIBLE} | ({VERDICT_WARNING} if strict else set())
+    counts = {verdict: sum(record['verdict'] == verdict for record in records)
+              for verdict in (VERDICT_OK, VERDICT_WARNING, VERDICT_INCOMPATIBLE, VERDICT_ERROR)}
+    failed_models = [record for record in records if record['verdict'] in failing]
+    
     print("📊 检查报告")
     print("=" * 50)
+    print(f"   {'模型':<40} {'判定':<13} {'加载(ms)':>9} {'类别':>5} {'量化':>4}")
+    for record in records:
+        load_ms = f"{record['load_ms']:.1f}" if record.get('load_ms') is not None else "-"
+        num_classes = record.get('num_classes') if record.get('num_classes') is not None else "-"
+        quantized = ("是" if record['quantized'] else "否") if 'quantized' in record else "-"
+        print(f"   {record['model']:<40} {record['verdict']:<13} {load_ms:>9} {num_classes:>5} {quantized:>4}")
+        for issue in record.get('issues') or []:
+            print(f"      ⚠️  {issue}")
+        if record.get('error'):
+            print(f"      ❌ {record['error']}")
+    print()
+    print(f"✅ 兼容: {counts[VERDICT_OK]} 个, ⚠️  警告: {counts[VERDICT_WARNING]} 个, "
+          f"❌ 不兼容: {counts[VERDICT_INCOMPATIBLE]} 个, ❌ 加载失败: {counts[VERDICT_ERROR]} 个")
+    print(f"⏱️  总耗时 {elapsed:.2f}s ({workers} 个进程)")
+    print()
     
-    successful_models = [path for path, success in results.items() if success]
-    failed_models = [path for path, success in results.items() if not success]
+    if report_path:
+        write_report({
+            'model_dir': os.path.abspath(model_dir),
+            'workers': workers,
+            'strict': strict,
+            'elapsed_s': elapsed,
+            'summary': dict(counts, total=len(records), failed=len(failed_models)),
+            'models': records,
+        }, report_path)
     
-    print(f"✅ 成功检查: {len(successful_models)} 个模型")
-    for model_path in successful_models:
-        print(f"   - {os.path.basename(model_path)}")
+    print("💡 建议:")
+    if counts[VERDICT_OK] or counts[VERDICT_WARNING]:
+        print("1. 兼容的模型可以直接使用")
+        print("2. 建议使用类别数量匹配的模型")
+    if counts[VERDICT_ERROR]:
+        print("3. 加载失败的模型需要检查文件完整性")
     
-    if failed_models:
-        print(f"❌ 检查失败: {len(failed_models)} 个模型")
-        for model_path in failed_models:
-            print(f"   - {os.path.basename(model_path)}")
+    return EXIT_FAILED if failed_models else EXIT_OK
+
+def get_rss_mb():
+    """返回进程当前的常驻内存（MB），无法获取时返回 None"""
+    rss = process_memory()['rss']
+    return rss / 1024 / 1024 if rss is not None else None
+
+def make_bench_input(input_detail, batch_size, image_path=None):
+    """生成基准测试输入：样例图像或合成图像，按模型的数据类型和量化参数转换"""
+    shape = (batch_size,) + tuple(int(v) for v in input_detail['shape'][1:])
     
+    if image_path:
+        import cv2
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"无法读取样例图像: {image_path}")
+        image = cv2.resize(image, (shape[2], shape[1]))
+        pixels = np.broadcast_to(image, shape).astype(np.float64)
+    else:
+        pixels = np.random.default_rng(0).integers(0, 256, size=shape).astype(np.float64)
+    
+    dtype = input_detail['dtype']
+    scale, zero_point = input_detail.get('quantization', (0.0, 0))
+    if np.issubdtype(dtype, np.integer):
+        if scale:
+            pixels = np.round(pixels / 255.0 / scale + zero_point)
+        info = np.iinfo(dtype)
+        return np.clip(pixels, info.min, info.max).astype(dtype)
+    return (pixels / 255.0).astype(dtype)
+
+def bench_config(model_path, num_threads, batch_size, runs, warmup, image_path=None):
+    """
+    测量一种 num_threads / 批量大小 组合下的 invoke 延迟，以及创建解释器和推理之后常驻内存的增量；
+    应在新进程中调用（见 bench_config_isolated），增量才不受之前测量的组合影响
+    """
+    rss_before = get_rss_mb()
+    interpreter = tflite_backend.create_interpreter(model_path, num_threads=num_threads)
+    input_detail = interpreter.get_input_details()[0]
+    if batch_size != input_detail['shape'][0]:
+        new_shape = (batch_size,) + tuple(int(v) for v in input_detail['shape'][1:])
+        interpreter.resize_tensor_input(input_detail['index'], new_shape)
+    interpreter.allocate_tensors()
+    input_detail = interpreter.get_input_details()[0]
+    
+    interpreter.set_tensor(input_detail['index'], make_bench_input(input_detail, batch_size, image_path))
+    
+    # 预热
+    for _ in range(warmup):
+        interpreter.invoke()
+    
+    latencies = np.empty(runs)
+    for i in range(runs):
+        start = time.perf_counter()
+        interpreter.invoke()
+        latencies[i] = time.perf_counter() - start
+    latencies_ms = latencies * 1000
+    rss = get_rss_mb()
+    
+    return {
+        'num_threads': num_threads,
+        'batch_size': batch_size,
+        'runs': runs,
+        'mean_ms': float(latencies_ms.mean()),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'throughput': float(batch_size * runs / latencies.sum()),
+        'rss_mb': rss,
+        'rss_increase_mb': rss - rss_before if rss is not None and rss_before is not None else None,
+    }
+
+def _bench_worker(model_path, num_threads, batch_size, runs, warmup, image_path, backend_name):
+    """工作进程：加载运行时后测量一种组合，运行时的提示输出被丢弃"""
+    with redirect_stdout(io.StringIO()):
+        tflite_backend.load_backend(backend_name)
+    return bench_config(model_path, num_threads, batch_size, runs, warmup, image_path)
+
+def bench_config_isolated(model_path, num_threads, batch_size, runs, warmup, image_path=None, backend_name=None):
+    """
+    在新的spawn进程中测量一种组合，内存只反映这一组合（加上运行时本身）；
+    不使用 ru_maxrss：Linux 下峰值在 fork/exec 之后保留父进程的值
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(_bench_worker, model_path, num_threads, batch_size, runs, warmup,
+                               image_path, backend_name).result()
+
+def bench_model(model_path, threads_list=(1, 2, 4), batch_list=(1,), runs=100, warmup=10, image_path=None,
+                backend_name=None):
+    """对 num_threads 和批量大小做扫描（每种组合在独立进程中测量），打印表格并返回结果字典"""
+    print(f"⏱️  基准测试: {model_path}")
+    print(f"   预热 {warmup} 次, 计时 {runs} 次, 输入: {image_path or '合成图像'}, 每种组合在独立进程中测量")
     print()
-    print("💡 建议:")
-    if successful_models:
-        print("1. 成功的模型可以直接使用")
-        print("2. 建议使用类别数量匹配的模型")
-    if failed_models:
-        print("3. 失败的模型需要检查文件完整性")
+    print(f"   {'线程':>4} {'批量':>4} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'吞吐(张/秒)':>12} "
+          f"{'RSS(MB)':>9} {'增量(MB)':>9}")
+    
+    results = []
+    for num_threads in threads_list:
+        for batch_size in batch_list:
+            try:
+                result = bench_config_isolated(model_path, num_threads, batch_size, runs, warmup, image_path,
+                                               backend_name)
+            except Exception as e:
+                print(f"   {num_threads:>4} {batch_size:>4} ❌ {e}")
+                results.append({'num_threads': num_threads, 'batch_size': batch_size, 'error': str(e)})
+                continue
+            rss = f"{result['rss_mb']:.1f}" if result['rss_mb'] is not None else "-"
+            increase = f"{result['rss_increase_mb']:.1f}" if result['rss_increase_mb'] is not None else "-"
+            print(f"   {num_threads:>4} {batch_size:>4} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                  f"{result['p99_ms']:>9.2f} {result['throughput']:>12.1f} {rss:>9} {increase:>9}")
+            results.append(result)
+    print()
+    
+    return {
+        'model': model_path,
+        'backend': tflite_backend.load_backend().name,
+        'model_size_bytes': os.path.getsize(model_path),
+        'runs': runs,
+        'warmup': warmup,
+        'input': image_path or 'synthetic',
+        'results': results,
+    }
+
+def write_json(data, path, stdout=None):
+    """把结果写入JSON文件，path 为 '-' 时输出到 stdout（默认为标准输出）"""
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    if path == "-":
+        print(text, file=stdout or sys.stdout)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"📄 结果已写入: {path}")
+
+def find_default_model():
+    """查找默认模型路径，找不到时返回 None"""
+    # 默认模型路径
+    model_path = r"C:\Users\AI_LAB_Student\image_classifier\model\exported_model__animals_40_2_10 _True__20250808_001555__model.tflite"
     
-    return len(successful_models) > 0
+    # 如果默认路径不存在，尝试其他常见路径
+    if not os.path.exists(model_path):
+        possible_paths = [
+            "model/model.tflite",
+            "model.tflite",
+            "./model.tflite"
+        ]
+        
+        for path in possible_paths:
+            if os.path.exists(path):
+                return path
+        return None
+    return model_path
+
+def parse_int_list(text):
+    return [int(v) for v in text.split(",") if v.strip()]
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="TFLite模型检查工具")
+    parser.add_argument("model_path", nargs="?", help="模型文件路径（--all 时为模型目录）")
+    parser.add_argument("--all", "-a", action="store_true", help="并行检查模型目录中的所有模型")
+    parser.add_argument("--workers", type=int, default=None, help="--all 使用的进程数，默认为CPU核心数")
+    parser.add_argument("--report", default=None,
+                        help="--all 的检查报告文件，.csv 输出表格，其他扩展名输出JSON，'-' 表示标准输出")
+    parser.add_argument("--strict", action="store_true", help="--all 时有警告的模型也视为失败")
+    parser.add_argument("--bench", action="store_true", help="测量推理延迟、吞吐量和内存")
+    parser.add_argument("--runs", type=int, default=100, help="基准测试计时次数")
+    parser.add_argument("--warmup", type=int, default=10, help="基准测试预热次数")
+    parser.add_argument("--threads", default="1,2,4", help="扫描的num_threads，逗号分隔")
+    parser.add_argument("--batch", default="1", help="扫描的批量大小，逗号分隔")
+    parser.add_argument("--input", default=None, help="基准测试使用的样例图像，默认使用合成输入")
+    parser.add_argument("--json", default=None, help="基准测试结果的JSON输出文件，'-' 表示标准输出")
+    parser.add_argument("--backend", choices=tflite_backend.BACKENDS, default=None,
+                        help="指定TFLite运行时，默认自动选择")
+    args = parser.parse_args()
+    
+    # JSON输出到标准输出时，其余输出（表格和提示）改为输出到标准错误，标准输出只包含JSON
+    stdout = sys.stdout
+    if args.json == "-":
+        sys.stdout = sys.stderr
+    
+    if args.backend:
+        tflite_backend.load_backend(args.backend)
+    
     print("🔍 TFLite模型检查工具")
     print("=" * 50)
     
-    # 检查命令行参数
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "--all" or sys.argv[1] == "-a":
-            # 自动检查所有模型
-            success = auto_check_all_models()
-            if success:
-                print("✅ 所有模型检查完成!")
-            else:
-                print("❌ 模型检查过程中发现问题")
-            return
+    if args.all:
+        # 自动检查所有模型
+        exit_code = auto_check_all_models(args.model_path, args.workers, args.report, args.backend, args.strict)
+        if exit_code == EXIT_OK:
+            print("✅ 所有模型检查完成!")
         else:
-            # 检查指定模型
-            model_path = sys.argv[1]
-    else:
-        # 默认模型路径
-        model_path = r"C:\Users\AI_LAB_Student\image_classifier\model\exported_model__animals_40_2_10 _True__20250808_001555__model.tflite"
-        
-        # 如果默认路径不存在，尝试其他常见路径
-        if not os.path.exists(model_path):
-            possible_paths = [
-                "model/model.tflite",
-                "model.tflite",
-                "./model.tflite"
-            ]
-            
-            for path in possible_paths:
-                if os.path.exists(path):
-                    model_path = path
-                    break
-            else:
-                print("❌ 未找到模型文件")
-                print()
-                print("💡 使用说明:")
-                print("1. 检查单个模型: python check_model.py <模型文件路径>")
-                print("2. 检查所有模型: python check_model.py --all")
-                print("3. 检查所有模型: python check_model.py -a")
-                return
+            print("❌ 模型检查过程中发现问题")
+        return exit_code
+    
+    # 检查指定模型，未指定时使用默认模型
+    model_path = args.model_path or find_default_model()
+    if model_path is None:
+        print("❌ 未找到模型文件")
+        print()
+        print("💡 使用说明:")
+        print("1. 检查单个模型: python check_model.py <模型文件路径>")
+        print("2. 检查所有模型: python check_model.py --all")
+        print("3. 检查指定目录并输出报告: python check_model.py --all <模型目录> --report report.csv")
+        print("4. 基准测试: python check_model.py <模型文件路径> --bench")
+        return EXIT_NO_MODELS
     
     # 检查单个模型
     success = check_model(model_path)
     
+    if success and args.bench:
+        data = bench_model(model_path, parse_int_list(args.threads), parse_int_list(args.batch),
+                           args.runs, args.warmup, args.input, args.backend)
+        if args.json:
+            write_json(data, args.json, stdout)
+    
     if success:
         print("✅ 模型检查完成!")
         print()
@@ -262,6 +603,8 @@ def main():
         print("3. 确保更新main.py中的类别标签")
     else:
         print("❌ 模型检查失败，请检查模型文件")
+    
+    return EXIT_OK if success else EXIT_FAILED
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分类引擎
+不依赖GUI的模型加载、预处理和推理逻辑，Tk窗口和无界面运行器都通过它完成分类
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+import cv2
+
+import model_memory
+import tflite_backend
+from model_index import ModelIndex
+
+# 默认模型目录
+MODEL_DIR = r"C:\Users\AI_LAB_Student\image_classifier - Copy\model"
+DEFAULT_MODEL_PATH = "model/model.tflite"
+
+
+def auto_discover_models(model_dir=MODEL_DIR):
+    """
+    自动发现模型目录中的模型文件
+    模型信息来自目录中的持久化索引（model_index.py），只有新增或修改过的模型才会被重新解析
+    """
+    models = {}
+
+    try:
+        # 检查模型目录是否存在
+        if not os.path.exists(model_dir):
+            print(f"模型目录不存在: {model_dir}")
+            # 尝试使用相对路径
+            model_dir = "model"
+            if not os.path.exists(model_dir):
+                print(f"相对路径也不存在: {model_dir}")
+                return {}
+
+        # 刷新模型索引，得到所有.tflite文件的信息
+        index = ModelIndex(model_dir)
+        entries = index.refresh()
+
+        if not entries:
+            print(f"在目录 {model_dir} 中未找到.tflite文件")
+            return {}
+
+        refresh = index.last_refresh
+        print(f"找到 {len(entries)} 个模型文件 (新解析 {refresh['inspected']} 个, 沿用索引 "
+              f"{refresh['reused'] + refresh['rehashed']} 个):")
+
+        for model_file, entry in entries.items():
+            # 获取文件名（不含扩展名）作为模型键
+            model_name = os.path.splitext(os.path.basename(model_file))[0]
+
+            # 标签优先使用模型元数据或同名标签文件，其次按文件名生成
+            labels = entry.get('labels') or generate_labels_for_model(model_name, entry.get('num_classes'))
+
+            # 使用相对路径存储
+            relative_path = os.path.relpath(model_file, os.getcwd())
+
+            models[model_name] = {
+                'path': relative_path,
+                'labels': labels,
+                'name': f'{model_name}模型',
+                'full_path': model_file,
+                'num_classes': entry.get('num_classes'),
+                'input_shape': entry['inputs'][0]['shape'] if entry.get('inputs') else None,
+                'quantized': entry.get('quantized', False),
+            }
+            models[model_name].update(get_runtime_config(model_name))
+
+            if entry.get('num_classes') is not None and len(labels) != entry['num_classes']:
+                print(f"  ⚠️ {model_name}: 标签数量 {len(labels)} 与模型类别数量 {entry['num_classes']} 不一致")
+            print(f"  - {model_name}: {relative_path} (标签: {len(labels)}个)")
+
+        return models
+
+    except Exception as e:
+        print(f"自动发现模型时出错: {e}")
+        return {}
+
+
+def get_runtime_config(model_name):
+    """根据模型名称返回运行参数：解释器池大小和每个解释器的线程数"""
+    # 预定义的运行参数，未列出的模型使用默认值
+    runtime_mappings = {
+        'model': {'pool_size': 2, 'num_threads': 2},
+        'model1': {'pool_size': 2, 'num_threads': 2},
+    }
+
+    config = {'pool_size': max(1, (os.cpu_count() or 1) // 2), 'num_threads': 2}
+    config.update(runtime_mappings.get(model_name, {}))
+    return config
+
+
+def get_model_runtime_config(model_path):
+    """按模型文件返回运行参数，模型名称与 auto_discover_models 的模型键相同（文件名去掉扩展名）"""
+    return get_runtime_config(os.path.splitext(os.path.basename(model_path))[0])
+
+
+def generate_labels_for_model(model_name, num_classes=None):
+    """根据模型名称生成标签；没有预定义标签时按 num_classes（未知时为5）生成通用标签"""
+    # 预定义的标签映射
+    label_mappings = {
+        'model': ['daisy', 'dandelion', 'roses', 'sunflowers', 'tulips'],  # 花朵
+        'model1': ['cats', 'chicken', 'cow', 'dogs', 'elephant'],  # 动物
+    }
+
+    # 如果找到预定义的标签，使用它
+    if model_name in label_mappings:
+        return label_mappings[model_name]
+
+    # 否则生成通用标签
+    print(f"模型 {model_name} 没有预定义标签，使用通用标签")
+    return [f'类别{i}' for i in range(num_classes or 5)]  # 默认5个类别
+
+
+def compute_tile_boxes(width, height, grid=(2, 2), overlap=0.1):
+    """把 width x height 的画面切成 行 x 列 个互相重叠的块，返回 (x0, y0, x1, y1) 列表"""
+    rows, cols = grid
+
+    def spans(length, count):
+        if count <= 1:
+            return [(0, length)]
+        # 块大小满足 count 个块、相邻重叠 overlap 比例时正好覆盖整个长度
+        size = min(length, int(np.ceil(length / (count - (count - 1) * overlap))))
+        stride = (length - size) / (count - 1)
+        return [(int(round(i * stride)), int(round(i * stride)) + size) for i in range(count)]
+
+    return [(x0, y0, x1, y1)
+            for y0, y1 in spans(height, rows)
+            for x0, x1 in spans(width, cols)]
+
+
+def resize_into(image, out, interpolation=cv2.INTER_LINEAR):
+    """
+    把 image 缩放到 out 的尺寸并写入 out；
+    4通道图像（例如X11共享内存截图的 BGRX）先在小尺寸上缩放，再丢弃第4通道写入3通道的 out
+    """
+    # cv2.resize 的目标尺寸为 (宽, 高)
+    size = (out.shape[1], out.shape[0])
+    if image.ndim == 3 and image.shape[2] == 4 and out.shape[2] == 3:
+        return cv2.cvtColor(cv2.resize(image, size, interpolation=interpolation), cv2.COLOR_BGRA2BGR, dst=out)
+    return cv2.resize(image, size, dst=out, interpolation=interpolation)
+
+
+class BufferPool:
+    """
+    预处理结果缓冲区的空闲列表：acquire() 取出一个指定形状的空闲uint8缓冲区（没有空闲的时新分配），
+    使用方读完之后 release() 归还，缓冲区只有归还之后才会再被取出；每种形状最多保留 max_free 个空闲缓冲区
+    """
+
+    def __init__(self, max_free=4):
+        self.max_free = max_free
+        self._free = {}
+        self._lock = threading.Lock()
+        self.allocated = 0
+
+    def acquire(self, shape):
+        shape = tuple(int(n) for n in shape)
+        with self._lock:
+            free = self._free.get(shape)
+            if free:
+                return free.pop()
+            self.allocated += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, buffer):
+        if buffer is None:
+            return
+        with self._lock:
+            free = self._free.setdefault(buffer.shape, [])
+            if len(free) < self.max_free and not any(item is buffer for item in free):
+                free.append(buffer)
+
+
+class ClassifierEngine:
+    """持有TFLite解释器，负责预处理和分类，不涉及任何GUI操作"""
+
+    # 模型期望的输入通道顺序
+    channel_order = "BGR"
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, labels=None, top_k=3,
+                 num_threads=None, use_xnnpack=True, model_loading=None):
+        self.top_k = top_k
+        self.num_threads = num_threads
+        self.use_xnnpack = use_xnnpack
+        # 模型加载方式：mmap（按路径，运行时映射文件）或 content（进程内共用一份模型内容），见 model_memory
+        self.model_loading = model_loading or model_memory.default_loading()
+        self._model_buffer = None
+        self.interpreter = None
+        # 分类与释放解释器（低内存模式）互斥
+        self._lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.load_model(model_path, labels)
+
+    def create_interpreter(self, model_path):
+        """按线程数、XNNPACK设置和模型加载方式创建解释器（第一次调用时才导入TFLite运行时）"""
+        # 默认算子解析器会自动启用XNNPACK委托
+        if self.model_loading == model_memory.LOAD_CONTENT:
+            # 同一进程中同一模型的所有解释器（批量解释器、解释器池、模型缓存）共用一份模型内容
+            self._model_buffer = model_memory.get_model_buffer(model_path)
+            return tflite_backend.create_interpreter(model_content=self._model_buffer.data,
+                                                     num_threads=self.num_threads, use_xnnpack=self.use_xnnpack)
+        return tflite_backend.create_interpreter(model_path, num_threads=self.num_threads,
+                                                 use_xnnpack=self.use_xnnpack)
+
+    def load_model(self, model_path, labels=None):
+        """加载模型并更新输入输出信息"""
+        interpreter = self.create_interpreter(model_path)
+        interpreter.allocate_tensors()
+
+        self.model_path = model_path
+
+        # 获取模型输入输出信息
+        self.input_details = interpreter.get_input_details()
+        self.output_details = interpreter.get_output_details()
+        self.input_shape = self.input_details[0]['shape']
+
+        # 预分配缩放缓冲区
+        self.resized_shape = (int(self.input_shape[1]), int(self.input_shape[2]), 3)
+        self._resize_buffer = self.allocate_resize_buffer()
+        self._scale = np.float32(1.0 / 255.0)
+        self._batch_supported = True
+        self._attach_interpreter(interpreter)
+
+        # 检测量化参数：整数输入通过查找表直接由像素值得到量化值，跳过浮点转换
+        self.input_dtype = self.input_details[0]['dtype']
+        self.output_dtype = self.output_details[0]['dtype']
+        self.input_quantization = self._quantization(self.input_details[0])
+        self.output_quantization = self._quantization(self.output_details[0])
+        self._input_lut = None
+        if self.input_quantization is not None:
+            self._input_lut = self._build_input_lut(self.input_quantization, self.input_dtype)
+
+        if labels is None:
+            model_name = os.path.splitext(os.path.basename(model_path))[0]
+            labels = generate_labels_for_model(model_name)
+        self.labels = labels
+
+    def _attach_interpreter(self, interpreter):
+        """使用新的单帧解释器，并取得其输入张量的访问函数（不持有视图）"""
+        self.interpreter = interpreter
+        self._input_tensor = interpreter.tensor(self.input_details[0]['index'])
+        # 批量推理使用单独的解释器，每种批量大小一个，避免反复调整输入尺寸；
+        # 批量大小等于模型原始批量时直接使用单帧解释器
+        self._batch_interpreters = {int(self.input_shape[0]): (interpreter, self._input_tensor)}
+
+    def _ensure_interpreter(self):
+        """调用方持有 _lock；解释器已被释放时按同一模型重新创建"""
+        self.last_used = time.monotonic()
+        if self.interpreter is None:
+            interpreter = self.create_interpreter(self.model_path)
+            interpreter.allocate_tensors()
+            self._attach_interpreter(interpreter)
+
+    @property
+    def is_released(self):
+        return self.interpreter is None
+
+    def release(self, idle_timeout=None):
+        """
+        释放所有解释器（包括批量解释器）及其张量内存和XNNPACK打包的权重，保留模型信息和标签，
+        下次分类时自动重新创建；idle_timeout 不为 None 时只在超过该时间（秒）未使用时释放。返回是否释放
+        """
+        with self._lock:
+            if self.interpreter is None:
+                return False
+            if idle_timeout is not None and time.monotonic() - self.last_used < idle_timeout:
+                return False
+            self.interpreter = None
+            self._input_tensor = None
+            self._batch_interpreters = {}
+            self._model_buffer = None
+            return True
+
+    @property
+    def is_quantized(self):
+        return self.input_quantization is not None
+
+    @staticmethod
+    def _quantization(detail):
+        """返回 (scale, zero_point)，未量化的张量返回 None"""
+        scale, zero_point = detail.get('quantization', (0.0, 0))
+        if scale == 0 or not np.issubdtype(detail['dtype'], np.integer):
+            return None
+        return float(scale), int(zero_point)
+
+    @staticmethod
+    def _build_input_lut(quantization, dtype):
+        """
+        构建像素值→量化输入值的256项查找表
+        浮点路径的输入为 像素/255，量化值 = 像素/255/scale + zero_point
+        """
+        scale, zero_point = quantization
+        info = np.iinfo(dtype)
+        pixels = np.arange(256, dtype=np.float64)
+        quantized = np.round(pixels / 255.0 / scale + zero_point)
+        return np.clip(quantized, info.min, info.max).astype(dtype)
+
+    def allocate_resize_buffer(self):
+        """分配一个与模型输入尺寸相同的uint8缓冲区"""
+        return np.empty(self.resized_shape, dtype=np.uint8)
+
+    def preprocess_image(self, image, out=None):
+        """
+        先缩放到模型输入尺寸，结果写入预分配的 out 缓冲区；
+        通道顺序和归一化推迟到 classify_image 中写入输入张量时一次完成
+        """
+        if out is None or out.shape != self.resized_shape:
+            out = self._resize_buffer
+        return resize_into(image, out)
+
+    def _write_input(self, out, image, channel_order):
+        """按模型通道顺序和数据类型，一次性把uint8图像写入 out（输入张量视图）"""
+        if channel_order != self.channel_order:
+            image = image[..., ::-1]
+        if self._input_lut is not None:
+            np.take(self._input_lut, image, out=out, mode='clip')
+        else:
+            np.multiply(image, self._scale, out=out, casting='unsafe')
+
+    def _load_input(self, image, channel_order):
+        """将缩放后的uint8图像按模型通道顺序归一化，直接写入解释器输入张量（整批输入使用 classify_batch）"""
+        # 输入张量视图必须在 invoke 之前释放
+        input_view = self._input_tensor()
+        self._write_input(input_view[0], image, channel_order)
+        del input_view
+
+    def _top_k(self, output):
+        """取top-k结果；量化输出只对这k个值反量化"""
+        top_indices = np.argsort(output)[-self.top_k:][::-1]
+        scores = output[top_indices].astype(np.float32)
+        if self.output_quantization is not None:
+            scale, zero_point = self.output_quantization
+            scores = (scores - zero_point) * scale
+        return top_indices, scores
+
+    def classify_image(self, image, channel_order="BGR"):
+        with self._lock:
+            try:
+                self._ensure_interpreter()
+
+                # 设置输入张量
+                self._load_input(image, channel_order)
+
+                # 运行推理
+                self.interpreter.invoke()
+
+                # 获取输出
+                output_data = self.interpreter.get_tensor(self.output_details[0]['index'])
+
+                # 获取top-k预测结果
+                return self._format_predictions(*self._top_k(output_data[0]))
+
+            except Exception as e:
+                print(f"推理错误: {e}")
+                return [("错误", 0.0)]
+
+    def _format_predictions(self, indices, scores):
+        """把类别索引和置信度转换为 [(标签, 置信度), ...]"""
+        predictions = []
+        for idx, score in zip(indices, scores):
+            confidence = float(score)
+            label = self.labels[idx] if idx < len(self.labels) else f"类别{idx}"
+            predictions.append((label, confidence))
+        return predictions
+
+    def process_frame(self, image, channel_order="BGR"):
+        """对一帧图像完成预处理和分类"""
+        return self.classify_image(self.preprocess_image(image), channel_order)
+
+    def allocate_batch_buffer(self, batch_size):
+        """分配一个 batch_size 张模型输入尺寸的uint8缓冲区"""
+        return np.empty((batch_size,) + self.resized_shape, dtype=np.uint8)
+
+    def preprocess_boxes(self, image, boxes, out=None):
+        """
+        按 boxes [(x0, y0, x1, y1), ...] 裁剪图像（视图）并逐个缩放写入批量缓冲区，返回批量缓冲区；
+        超出图像的部分被裁掉，完全在图像之外的区域填充为黑色
+        """
+        if out is None or out.shape != (len(boxes),) + self.resized_shape:
+            out = self.allocate_batch_buffer(len(boxes))
+        height, width = image.shape[:2]
+        for i, (x0, y0, x1, y1) in enumerate(boxes):
+            x0, x1 = max(0, x0), min(width, x1)
+            y0, y1 = max(0, y0), min(height, y1)
+            if x1 <= x0 or y1 <= y0:
+                out[i] = 0
+                continue
+            self.preprocess_image(image[y0:y1, x0:x1], out=out[i])
+        return out
+
+    def preprocess_tiles(self, image, grid=(2, 2), overlap=0.1, out=None):
+        """把图像切块并逐块缩放写入批量缓冲区，返回 (块坐标列表, 批量缓冲区)"""
+        height, width = image.shape[:2]
+        boxes = compute_tile_boxes(width, height, grid, overlap)
+        return boxes, self.preprocess_boxes(image, boxes, out)
+
+    def _get_batch_interpreter(self, batch_size):
+        """返回 (解释器, 输入张量访问函数)，输入批量大小为 batch_size；不支持调整批量大小时返回 None"""
+        entry = self._batch_interpreters.get(batch_size)
+        if entry is None:
+            if not self._batch_supported:
+                return None
+            try:
+                interpreter = self.create_interpreter(self.model_path)
+                index = self.input_details[0]['index']
+                interpreter.resize_tensor_input(index, (batch_size,) + self.resized_shape)
+                interpreter.allocate_tensors()
+            except Exception as e:
+                print(f"模型不支持批量输入，改为逐张推理: {e}")
+                self._batch_supported = False
+                return None
+            entry = (interpreter, interpreter.tensor(index))
+            self._batch_interpreters[batch_size] = entry
+        return entry
+
+    def _dequantize(self, output):
+        """把完整的输出张量转换为浮点置信度"""
+        if self.output_quantization is None:
+            return output.astype(np.float32, copy=False)
+        scale, zero_point = self.output_quantization
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def classify_batch(self, batch, channel_order="BGR"):
+        """
+        一次 invoke 分类整批缩放后的图像，返回每张图像的浮点置信度 (N, 类别数)；
+        模型不支持批量输入时退化为逐张推理
+        """
+        with self._lock:
+            self._ensure_interpreter()
+            entry = self._get_batch_interpreter(len(batch))
+            if entry is None:
+                rows = []
+                for image in batch:
+                    self._load_input(image, channel_order)
+                    self.interpreter.invoke()
+                    rows.append(self.interpreter.get_tensor(self.output_details[0]['index'])[0])
+                return self._dequantize(np.stack(rows))
+
+            # 输入张量视图必须在 invoke 之前释放
+            interpreter, input_tensor = entry
+            input_view = input_tensor()
+            self._write_input(input_view, batch, channel_order)
+            del input_view
+
+            interpreter.invoke()
+            return self._dequantize(interpreter.get_tensor(self.output_details[0]['index']))
+
+    def top_k_predictions(self, scores):
+        """把一行浮点置信度（classify_batch 的输出）转换为top-k预测列表"""
+        indices = np.argsort(scores)[-self.top_k:][::-1]
+        return self._format_predictions(indices, scores[indices])
+
+    def summarize_tiles(self, boxes, scores, aggregate="max"):
+        """
+        生成分块结果：每块的top-k，以及整幅画面的汇总top-k
+        aggregate="max" 取各块中每个类别的最高置信度（适合小目标），"mean" 取平均
+        """
+        tiles = [{'box': box, 'predictions': self.top_k_predictions(row)} for box, row in zip(boxes, scores)]
+        combined = scores.max(axis=0) if aggregate == "max" else scores.mean(axis=0)
+        return {
+            'tiles': tiles,
+            'aggregate': self.top_k_predictions(combined),
+        }
+
+    def summarize_regions(self, regions, scores):
+        """生成多区域结果：regions 为 [(名称, 区域坐标), ...]，与 scores 的行一一对应"""
+        return {
+            'regions': [{'name': name, 'box': box, 'predictions': self.top_k_predictions(row)}
+                        for (name, box), row in zip(regions, scores)],
+        }
+
+    def classify_regions(self, image, regions, channel_order="BGR"):
+        """裁剪各命名区域后一次批量推理，返回每个区域的top-k"""
+        batch = self.preprocess_boxes(image, [box for _, box in regions])
+        return self.summarize_regions(regions, self.classify_batch(batch, channel_order))
+
+    def classify_tiles(self, image, grid=(2, 2), overlap=0.1, channel_order="BGR", aggregate="max"):
+        """把整幅画面切块后一次批量推理，返回每块的top-k和汇总结果"""
+        boxes, batch = self.preprocess_tiles(image, grid, overlap)
+        return self.summarize_tiles(boxes, self.classify_batch(batch, channel_order), aggregate)
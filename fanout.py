@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多模型并行分类
+同一帧只捕获一次，每种输入尺寸只缩放一次，然后并发分发给所有选中的模型，
+结果合并为一条按帧的记录
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from classifier_engine import BufferPool, resize_into
+
+
+class MultiModelClassifier:
+    """把一帧图像同时交给多个 ClassifierEngine 分类"""
+
+    def __init__(self, engines, max_buffers=4):
+        """engines: {模型名称: ClassifierEngine}；max_buffers 为每种输入尺寸保留的空闲缩放缓冲区数量"""
+        self.engines = dict(engines)
+        # 缩放缓冲区在 classify 之后由调用方 release() 归还，归还之前不会被下一帧覆盖
+        self._buffers = BufferPool(max_buffers)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.engines)),
+                                            thread_name_prefix="fanout")
+
+    def input_shapes(self):
+        """所有模型中不同输入尺寸的集合"""
+        return {engine.resized_shape for engine in self.engines.values()}
+
+    def preprocess(self, image):
+        """每种输入尺寸只缩放一次，返回 {输入尺寸: 缩放后的uint8图像}；用完后交给 release() 归还缓冲区"""
+        resized = {}
+        for shape in self.input_shapes():
+            resized[shape] = resize_into(image, self._buffers.acquire(shape))
+        return resized
+
+    def release(self, resized):
+        """归还 preprocess() 返回的缩放缓冲区"""
+        for buffer in resized.values():
+            self._buffers.release(buffer)
+
+    def _classify_one(self, engine, image, channel_order):
+        start = time.perf_counter()
+        prediction = engine.classify_image(image, channel_order)
+        return prediction, time.perf_counter() - start
+
+    def classify(self, resized, channel_order="BGR"):
+        """把缩放结果并发交给各模型分类，返回合并后的记录"""
+        futures = {}
+        for name, engine in self.engines.items():
+            image = resized.get(engine.resized_shape)
+            if image is None:
+                # 预处理之后新增了输入尺寸（例如更换了模型集合），跳过该模型
+                continue
+            try:
+                futures[name] = self._executor.submit(self._classify_one, engine, image, channel_order)
+            except RuntimeError:
+                # 已经 close()（例如界面切换了多模型模式而流水线中还有这一帧），在当前线程中依次分类
+                futures[name] = None
+
+        record = {'models': {}, 'timings': {}}
+        for name, future in futures.items():
+            if future is None:
+                prediction, elapsed = self._classify_one(self.engines[name], resized[self.engines[name].resized_shape],
+                                                         channel_order)
+            else:
+                prediction, elapsed = future.result()
+            record['models'][name] = prediction
+            record['timings'][name] = elapsed
+        return record
+
+    def process_frame(self, image, channel_order="BGR"):
+        """对一帧图像完成共享预处理和多模型分类"""
+        resized = self.preprocess(image)
+        try:
+            return self.classify(resized, channel_order)
+        finally:
+            self.release(resized)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+帧源模块
+为分类引擎提供可替换的图像输入：屏幕截图、图像目录、视频文件、合成图像和帧录制文件的回放
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import cv2
+
+from frame_store import FrameRingReader
+
+# 图像目录帧源支持的文件扩展名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+
+
+def iter_image_paths(directory, recursive=True):
+    """按目录逐个产生图像路径，不在内存中保存完整列表，适合非常大的数据集"""
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = sorted(os.scandir(current), key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"无法读取目录，已跳过: {current} ({e})")
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    subdirs.append(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield entry.path
+        # 逆序入栈，保证按名称顺序遍历子目录
+        stack.extend(reversed(subdirs))
+
+
+class Frame:
+    """单帧图像及其元数据；timings 为流水线记录的各阶段耗时 {阶段: 秒}（需要时才创建）"""
+    __slots__ = ('image', 'index', 'timestamp', 'channel_order', 'source', 'timings')
+
+    def __init__(self, image, index, timestamp=None, channel_order="BGR", source=None):
+        self.image = image
+        self.index = index
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.channel_order = channel_order
+        self.source = source
+        self.timings = None
+
+
+class FrameSource:
+    """帧源基类，read() 返回 Frame，没有更多帧时返回 None"""
+    channel_order = "BGR"
+
+    def __init__(self):
+        self.frame_count = 0
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def _make_frame(self, image, timestamp=None, source=None):
+        frame = Frame(image, self.frame_count, timestamp, self.channel_order, source)
+        self.frame_count += 1
+        return frame
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ScreenFrameSource(FrameSource):
+    """屏幕截图帧源，bbox 为 None 时捕获全屏；输出保持RGB，通道转换推迟到缩放之后"""
+    channel_order = "RGB"
+
+    def __init__(self, bbox=None):
+        super().__init__()
+        self.bbox = bbox
+
+    def set_bbox(self, bbox):
+        """设置捕获区域 (left, top, right, bottom)，None 表示全屏"""
+        self.bbox = bbox
+
+    def read(self):
+        from PIL import ImageGrab
+
+        screenshot = ImageGrab.grab(bbox=self.bbox)
+
+        # 转换为numpy数组
+        img = np.asarray(screenshot)
+        return self._make_frame(img)
+
+
+class XShmScreenFrameSource(ScreenFrameSource):
+    """
+    Linux X11共享内存截图帧源：保持与X服务器的连接和共享内存段，只抓取 bbox 区域，
+    输出直接引用共享内存的4通道图像（第4通道为填充）；
+    共享内存段轮转使用，每帧在之后 buffers-1 次抓取内有效，buffers 应大于流水线中同时在途的帧数
+    """
+
+    def __init__(self, bbox=None, buffers=4, display=None):
+        super().__init__(bbox)
+        from x11_capture import XShmGrabber
+
+        self.grabber = XShmGrabber(display, buffers)
+        self.channel_order = self.grabber.channel_order
+
+    def ensure_buffers(self, count):
+        """由流水线在启动时调用，保证共享内存段数量多于同时在途的帧数"""
+        self.grabber.ensure_buffers(count)
+
+    def read(self):
+        return self._make_frame(self.grabber.grab(self.bbox))
+
+    def close(self):
+        self.grabber.close()
+
+
+def create_screen_source(backend="imagegrab", bbox=None):
+    """
+    创建屏幕截图帧源：backend 为 imagegrab（PIL.ImageGrab）、xshm（X11共享内存）
+    或 auto（Linux X11下优先使用共享内存，不可用时回退到 ImageGrab）
+    """
+    if backend == "imagegrab":
+        return ScreenFrameSource(bbox)
+    if backend == "xshm":
+        return XShmScreenFrameSource(bbox)
+    if backend == "auto":
+        if sys.platform.startswith("linux") and os.environ.get("DISPLAY"):
+            try:
+                return XShmScreenFrameSource(bbox)
+            except (OSError, RuntimeError) as e:
+                print(f"X11共享内存截图不可用，改用ImageGrab: {e}")
+        return ScreenFrameSource(bbox)
+    raise ValueError(f"未知的截图方式: {backend}")
+
+
+class ImageDirectoryFrameSource(FrameSource):
+    """按文件名顺序读取目录中的图像"""
+
+    def __init__(self, directory, recursive=False, loop=False):
+        super().__init__()
+        self.directory = directory
+        self.loop = loop
+        self.paths = self._scan(directory, recursive)
+        self._position = 0
+
+    @staticmethod
+    def _scan(directory, recursive):
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"图像目录不存在: {directory}")
+
+        paths = []
+        if recursive:
+            for root, _, files in os.walk(directory):
+                paths.extend(os.path.join(root, name) for name in files)
+        else:
+            paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+        return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS))
+
+    def read(self):
+        skipped = 0
+        while skipped < len(self.paths):
+            if self._position >= len(self.paths):
+                if not self.loop:
+                    return None
+                self._position = 0
+
+            path = self.paths[self._position]
+            self._position += 1
+
+            img = cv2.imread(path, cv2.IMREAD_COLOR)
+            if img is None:
+                print(f"无法读取图像，已跳过: {path}")
+                skipped += 1
+                continue
+            return self._make_frame(img, source=path)
+        return None
+
+
+class VideoFrameSource(FrameSource):
+    """使用 cv2.VideoCapture 逐帧解码视频文件"""
+
+    def __init__(self, path, loop=False):
+        super().__init__()
+        self.path = path
+        self.loop = loop
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError(f"无法打开视频文件: {path}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 0.0
+
+    def read(self):
+        ok, img = self.capture.read()
+        if not ok and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, img = self.capture.read()
+        if not ok:
+            return None
+
+        # 使用视频自身的时间轴作为时间戳（秒）
+        timestamp = self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        return self._make_frame(img, timestamp=timestamp, source=self.path)
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class SyntheticFrameSource(FrameSource):
+    """生成合成图像，用于无显示环境下的性能测试"""
+
+    def __init__(self, width=1920, height=1080, count=None, seed=0):
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.count = count
+        rng = np.random.default_rng(seed)
+        # 预先生成噪声底图，每帧只做平移，避免生成开销干扰测量
+        self._base = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+    def read(self):
+        if self.count is not None and self.frame_count >= self.count:
+            return None
+        shift = (self.frame_count * 16) % self.width
+        img = np.roll(self._base, shift, axis=1)
+        return self._make_frame(img, source="synthetic")
+
+
+class ReplayFrameSource(FrameSource):
+    """
+    回放帧录制文件（frame_store.FrameRingWriter 写入）：speed 为 1.0 时按录制时的帧间隔回放，
+    2.0 为两倍速，0 表示尽可能快；每次回放的帧和顺序完全相同，用于可重复的性能测试和模型对比
+    """
+
+    def __init__(self, path, speed=1.0, loop=False):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.reader = FrameRingReader(path)
+        if not len(self.reader):
+            raise ValueError(f"帧录制文件中没有帧: {path}")
+        self._position = 0
+        self._start = None
+
+    def read(self):
+        if self._position >= len(self.reader):
+            if not self.loop:
+                return None
+            self._position = 0
+            self._start = None
+        image, timestamp, channel_order = self.reader.read(self._position)
+        self._position += 1
+
+        if self.speed > 0:
+            # 按截止时间回放：第一帧的时刻作为基准，之后每帧在 基准 + 录制时间差 / speed 时返回
+            now = time.perf_counter()
+            if self._start is None:
+                self._start = (now, timestamp)
+            deadline = self._start[0] + (timestamp - self._start[1]) / self.speed
+            if deadline > now:
+                time.sleep(deadline - now)
+        frame = self._make_frame(image, timestamp, source=self.path)
+        frame.channel_order = channel_order
+        return frame
+
+    def close(self):
+        self.reader.close()
+
+
+class RecordingFrameSource(FrameSource):
+    """
+    包装另一个帧源，把读到的每一帧写入帧录制文件（FrameRingWriter）后原样返回；
+    其他属性和方法（set_bbox、ensure_buffers 等）转发给被包装的帧源
+    """
+
+    def __init__(self, source, writer):
+        super().__init__()
+        self.source = source
+        self.writer = writer
+        self.channel_order = source.channel_order
+
+    def read(self):
+        frame = self.source.read()
+        if frame is not None:
+            self.writer.write(frame)
+        return frame
+
+    def close(self):
+        self.source.close()
+
+    def __getattr__(self, name):
+        # 只在常规属性查找失败时调用；source 尚未设置时（例如复制对象）不再转发，避免无限递归
+        if name == 'source':
+            raise AttributeError(name)
+        return getattr(self.source, name)
+
+
+def create_frame_source(spec, loop=False, replay_speed=1.0):
+    """
+    根据描述字符串创建帧源:
+      screen                  全屏截图
+      screen:x,y,w,h          自定义区域截图
+      xshm / xshm:x,y,w,h     X11共享内存截图（Linux）
+      dir:PATH                图像目录
+      video:PATH              视频文件
+      synthetic[:WxH[:N]]     合成图像
+      replay:PATH             回放帧录制文件，replay_speed 为回放速度（0 表示尽可能快）
+    """
+    kind, _, arg = spec.partition(":")
+
+    if kind in ("screen", "xshm"):
+        bbox = None
+        if arg:
+            x, y, width, height = (int(v) for v in arg.split(","))
+            bbox = (x, y, x + width, y + height)
+        return create_screen_source("imagegrab" if kind == "screen" else "xshm", bbox)
+    if kind == "dir":
+        return ImageDirectoryFrameSource(arg, loop=loop)
+    if kind == "video":
+        return VideoFrameSource(arg, loop=loop)
+    if kind == "synthetic":
+        size, _, count = arg.partition(":")
+        width, height = (1920, 1080)
+        if size:
+            width, height = (int(v) for v in size.lower().split("x"))
+        return SyntheticFrameSource(width, height, count=int(count) if count else None)
+    if kind == "replay":
+        return ReplayFrameSource(arg, speed=replay_speed, loop=loop)
+
+    raise ValueError(f"未知的帧源类型: {spec}")
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+帧录制文件
+把捕获到的帧追加到一个内存映射的环形文件中，用于之后按原始节奏或尽可能快地回放，
+让性能调优和模型对比可以在完全相同的输入上重复进行
+
+文件结构（固定大小，创建时一次分配）:
+  头部      HEADER_SIZE 字节：魔数、版本、索引和数据区容量、已写入帧数、数据区写入位置、编码方式
+  索引区    index_capacity 个定长条目（帧序号、时间戳、数据位置和长度、宽高通道、通道顺序），按帧序号循环使用
+  数据区    data_capacity 字节的环形缓冲区，每帧连续存放，放不下时从头开始覆盖最旧的帧
+
+写入顺序为 先在头部预留数据区位置 → 写帧数据 → 写索引条目 → 更新头部帧数，
+录制中途中断时只丢失最后一帧，已提交的帧不会指向被部分覆盖的数据
+
+用法（查看录制文件）:
+  python frame_store.py frames.ring
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import threading
+
+import cv2
+import numpy as np
+
+FRAME_STORE_MAGIC = b"SCFRAMES"
+FRAME_STORE_VERSION = 1
+HEADER_SIZE = 4096
+
+# 头部：魔数、版本、索引容量、数据区容量、已写入帧数、数据区写入位置（逻辑偏移，单调递增）、编码方式
+_HEADER = struct.Struct("<8sIQQQQ8s")
+_COUNT_OFFSET = struct.calcsize("<8sIQQ")
+_HEAD_OFFSET = _COUNT_OFFSET + 8
+
+# 索引条目：帧序号、时间戳、数据逻辑偏移、数据长度、高、宽、通道数、通道顺序
+_ENTRY = struct.Struct("<qdqiiiii")
+INDEX_DTYPE = np.dtype([('seq', '<i8'), ('timestamp', '<f8'), ('offset', '<i8'), ('length', '<i4'),
+                        ('height', '<i4'), ('width', '<i4'), ('channels', '<i4'), ('order', '<i4')])
+
+CODECS = ('raw', 'png', 'jpeg')
+CHANNEL_ORDERS = ('BGR', 'RGB')
+
+
+def encode_frame(image, codec, quality=90):
+    """按编码方式把图像转换为字节；png/jpeg 不区分通道顺序，按原样编码和解码"""
+    if codec == 'raw':
+        return np.ascontiguousarray(image).reshape(-1).data
+    if codec == 'jpeg':
+        # JPEG不支持第4通道（X11截图的填充通道），只保留前三个通道
+        if image.ndim == 3 and image.shape[2] == 4:
+            image = image[:, :, :3]
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    else:
+        ok, encoded = cv2.imencode(".png", image, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    if not ok:
+        raise ValueError(f"图像编码失败: {codec}")
+    return encoded.reshape(-1).data
+
+
+class FrameRingWriter:
+    """
+    帧录制器：每帧写入内存映射文件（只是内存复制，由操作系统在后台写回磁盘），
+    数据区写满后覆盖最旧的帧，文件大小保持不变；write() 可以在捕获线程中直接调用
+    """
+
+    def __init__(self, path, capacity_mb=512, index_capacity=65536, codec='raw', quality=90):
+        if codec not in CODECS:
+            raise ValueError(f"未知的编码方式: {codec}（可选: {', '.join(CODECS)}）")
+        self.path = path
+        self.codec = codec
+        self.quality = quality
+        self.index_capacity = index_capacity
+        self.data_capacity = int(capacity_mb * 1024 * 1024)
+        self._data_offset = HEADER_SIZE + index_capacity * _ENTRY.size
+        self.count = 0
+        self.head = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+        # 文件按总大小一次分配（稀疏文件，未写入的部分不占磁盘）
+        with open(path, "wb") as f:
+            f.truncate(self._data_offset + self.data_capacity)
+        self._file = open(path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        self._mm[:_HEADER.size] = _HEADER.pack(FRAME_STORE_MAGIC, FRAME_STORE_VERSION, index_capacity,
+                                               self.data_capacity, 0, 0, codec.encode("ascii"))
+
+    def write(self, frame):
+        """追加一帧，返回是否写入；编码后大于整个数据区的帧被丢弃并计数"""
+        image = frame.image
+        data = encode_frame(image, self.codec, self.quality)
+        length = data.nbytes
+        height, width = image.shape[:2]
+        channels = image.shape[2] if image.ndim == 3 else 1
+        if self.codec == 'jpeg':
+            channels = min(channels, 3)
+        order = CHANNEL_ORDERS.index(frame.channel_order) if frame.channel_order in CHANNEL_ORDERS else 0
+
+        with self._lock:
+            if self._mm is None:
+                return False
+            if length > self.data_capacity:
+                self.dropped += 1
+                return False
+            # 帧数据在数据区中连续存放，末尾放不下时跳到开头
+            position = self.head % self.data_capacity
+            start = self.head if position + length <= self.data_capacity else self.head + self.data_capacity - position
+            end = start + length
+            physical = self._data_offset + start % self.data_capacity
+
+            self._mm[_HEAD_OFFSET:_HEAD_OFFSET + 8] = struct.pack("<Q", end)
+            self._mm[physical:physical + length] = data
+            entry_offset = HEADER_SIZE + (self.count % self.index_capacity) * _ENTRY.size
+            _ENTRY.pack_into(self._mm, entry_offset, self.count, frame.timestamp, start, length,
+                             height, width, channels, order)
+            self.count += 1
+            self.head = end
+            self.bytes_written += length
+            self._mm[_COUNT_OFFSET:_COUNT_OFFSET + 8] = struct.pack("<Q", self.count)
+        return True
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'path': self.path,
+                'codec': self.codec,
+                'frames': self.count,
+                'dropped': self.dropped,
+                'bytes_written': self.bytes_written,
+                'capacity_mb': self.data_capacity / (1024 * 1024),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._mm is None:
+                return
+            self._mm.flush()
+            self._mm.close()
+            self._mm = None
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class FrameRingReader:
+    """
+    读取帧录制文件：打开时映射整个文件并读取索引，只保留仍然完整的帧（没有被后来的帧覆盖），
+    按帧序号排列；raw 编码的帧直接引用映射的内存，不复制
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_capacity, data_capacity, count, head, codec = _HEADER.unpack_from(self._mm, 0)
+        if magic != FRAME_STORE_MAGIC:
+            raise ValueError(f"不是帧录制文件: {path}")
+        if version != FRAME_STORE_VERSION:
+            raise ValueError(f"不支持的帧录制文件版本: {version}")
+        self.codec = codec.rstrip(b"\0").decode("ascii")
+        self.data_capacity = data_capacity
+        self._data_offset = HEADER_SIZE + index_capacity * _ENTRY.size
+
+        # 索引条目按帧序号循环使用，写入的帧数少于容量时只有前 count 个条目有效
+        used = min(count, index_capacity)
+        index = np.frombuffer(self._mm, dtype=INDEX_DTYPE, count=used, offset=HEADER_SIZE).copy()
+        # 数据已被覆盖的帧：起始位置早于 写入位置 - 数据区容量
+        index = index[index['offset'] >= head - data_capacity]
+        self.index = np.sort(index, order='seq')
+        self.total_written = count
+
+    def __len__(self):
+        return len(self.index)
+
+    def duration(self):
+        """录制时长（秒）"""
+        if len(self.index) < 2:
+            return 0.0
+        return float(self.index['timestamp'][-1] - self.index['timestamp'][0])
+
+    def read(self, i):
+        """读取第 i 帧（按保留的帧顺序），返回 (图像, 时间戳, 通道顺序)"""
+        entry = self.index[i]
+        start = self._data_offset + int(entry['offset']) % self.data_capacity
+        length = int(entry['length'])
+        channels = int(entry['channels'])
+        if self.codec == 'raw':
+            image = np.frombuffer(self._mm, dtype=np.uint8, count=length, offset=start)
+            shape = (int(entry['height']), int(entry['width'])) + ((channels,) if channels > 1 else ())
+            image = image.reshape(shape)
+        else:
+            encoded = np.frombuffer(self._mm, dtype=np.uint8, count=length, offset=start)
+            image = cv2.imdecode(encoded, cv2.IMREAD_UNCHANGED)
+        return image, float(entry['timestamp']), CHANNEL_ORDERS[int(entry['order'])]
+
+    def close(self):
+        # raw 帧引用映射的内存，仍有帧在使用时由垃圾回收释放映射
+        try:
+            self._mm.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main():
+    """主函数：打印帧录制文件的概况"""
+    parser = argparse.ArgumentParser(description="查看帧录制文件")
+    parser.add_argument("path", help="帧录制文件")
+    args = parser.parse_args()
+
+    with FrameRingReader(args.path) as reader:
+        print(f"文件: {args.path} ({os.path.getsize(args.path) / (1024 * 1024):.1f}MB), 编码: {reader.codec}")
+        print(f"共写入 {reader.total_written} 帧, 保留 {len(reader)} 帧, 时长 {reader.duration():.2f}s")
+        if len(reader):
+            index = reader.index
+            sizes = sorted({(int(h), int(w), int(c)) for h, w, c in zip(index['height'], index['width'], index['channels'])})
+            print(f"尺寸: {', '.join(f'{w}x{h}x{c}' for h, w, c in sizes)}, "
+                  f"平均每帧 {index['length'].mean() / 1024:.1f}KB")
+            if len(reader) > 1:
+                print(f"平均帧率: {(len(reader) - 1) / max(reader.duration(), 1e-9):.1f} FPS")
+
+
+if __name__ == "__main__":
+    main()
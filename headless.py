@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+无界面运行器
+不创建Tk窗口，直接从帧源读取图像并分类，用于在无显示环境下测量吞吐量
+"""
+
+import argparse
+import collections
+import os
+import time
+
+from cascade import CascadeClassifier
+from change_detector import ChangeDetector
+from classifier_engine import ClassifierEngine, DEFAULT_MODEL_PATH, get_model_runtime_config
+from fanout import MultiModelClassifier
+from frame_sources import RecordingFrameSource, create_frame_source
+from frame_store import CODECS, FrameRingWriter
+from interpreter_pool import InterpreterPool
+from metrics import MetricsServer, PipelineMetrics
+from pipeline import FramePipeline
+from process_pipeline import ProcessPipeline
+from recorder import PredictionRecorder
+from regions import capture_bbox, parse_regions, relative_boxes
+from scheduler import FrameScheduler
+
+
+def open_source(args, frame_writer=None):
+    """按命令行参数创建帧源，需要录制帧时包装为 RecordingFrameSource"""
+    source = create_frame_source(args.source, loop=args.loop, replay_speed=args.replay_speed)
+    if frame_writer is not None:
+        source = RecordingFrameSource(source, frame_writer)
+    return source
+
+
+def run_headless(engine, source, max_frames=None, on_result=None, change_detector=None):
+    """逐帧运行 捕获→预处理→分类，返回统计信息"""
+    frames = 0
+    prediction = None
+    start = time.perf_counter()
+
+    for frame in source:
+        changed = change_detector is None or change_detector.should_classify(frame.image)
+        if changed or prediction is None:
+            prediction = engine.process_frame(frame.image, frame.channel_order)
+        frames += 1
+
+        if on_result is not None:
+            on_result(frame, prediction)
+
+        if max_frames is not None and frames >= max_frames:
+            break
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'frames': frames,
+        'elapsed': elapsed,
+        'fps': frames / elapsed if elapsed > 0 else 0.0,
+    }
+    if change_detector is not None:
+        stats['change_detection'] = change_detector.get_stats()
+    return stats
+
+
+def run_pipelined(engine, source, max_frames=None, on_result=None, queue_size=2,
+                  change_detector=None, tile_grid=None, tile_overlap=0.1, fanout=None,
+                  metrics=None, metrics_port=None, scheduler=None, regions=None, recorder=None):
+    """
+    以流水线方式运行，各阶段并发执行；离线数据不丢帧，返回流水线统计信息。
+    metrics_port 不为 None 时在本地端口提供 /metrics 端点
+    """
+    pipeline = FramePipeline(engine, source, on_result=on_result,
+                             queue_size=queue_size, drop_stale=False, max_frames=max_frames,
+                             change_detector=change_detector,
+                             tile_grid=tile_grid, tile_overlap=tile_overlap, fanout=fanout,
+                             metrics=metrics, scheduler=scheduler, regions=regions, recorder=recorder)
+    server = None
+    if metrics_port is not None:
+        server = MetricsServer(pipeline.prometheus_text, pipeline.get_stats, port=metrics_port)
+        print(f"指标端点: http://127.0.0.1:{server.port}/metrics")
+    pipeline.start()
+    try:
+        pipeline.wait()
+    except KeyboardInterrupt:
+        pipeline.stop()
+    finally:
+        if server is not None:
+            server.close()
+    return pipeline.get_stats()
+
+
+def probe_frame_bytes(args):
+    """读取帧源的第一帧，得到多进程模式下共享内存槽位的大小"""
+    with create_frame_source(args.source, loop=False, replay_speed=0) as source:
+        frame = source.read()
+    if frame is None:
+        raise ValueError(f"帧源没有可读取的帧: {args.source}")
+    return frame.image.nbytes
+
+
+def run_processes(engine, args, on_result=None, change_detection=None, tile_grid=None, metrics=None,
+                  scheduler_args=None, regions=None, bbox=None, recorder=None, frame_writer=None):
+    """
+    捕获和推理各自在独立进程中运行，帧通过共享内存槽位传递；离线数据不丢帧，返回流水线统计信息
+    """
+    frame_bytes = int(args.slot_mb * 1024 * 1024) if args.slot_mb else probe_frame_bytes(args)
+    pipeline = ProcessPipeline(engine.model_path, engine.labels, create_frame_source,
+                               (args.source, args.loop, args.replay_speed), frame_bytes=frame_bytes,
+                               on_result=on_result, drop_stale=False, max_frames=args.frames,
+                               scheduler_args=scheduler_args, change_detection=change_detection,
+                               tile_grid=tile_grid, tile_overlap=args.tile_overlap, regions=regions,
+                               num_threads=engine.num_threads, use_xnnpack=not args.no_xnnpack,
+                               metrics=metrics, recorder=recorder, frame_writer=frame_writer)
+    pipeline.set_bbox(bbox)
+    pipeline.start()
+    try:
+        pipeline.wait()
+    except KeyboardInterrupt:
+        pipeline.stop()
+    return pipeline.get_stats()
+
+
+def run_pooled(pool, source, max_frames=None, on_result=None):
+    """将帧提交给解释器池并行分类，按帧顺序输出结果，返回池的统计信息"""
+    # 限制同时在途的帧数，避免读取速度快于推理时占用过多内存
+    max_inflight = pool.size * 2
+    inflight = collections.deque()
+    frames = 0
+
+    def drain(limit):
+        while len(inflight) > limit:
+            frame, future = inflight.popleft()
+            prediction = future.result()
+            if on_result is not None:
+                on_result(frame, prediction)
+
+    pool.reset_stats()
+    for frame in source:
+        inflight.append((frame, pool.submit(frame.image, frame.channel_order)))
+        frames += 1
+        drain(max_inflight)
+        if max_frames is not None and frames >= max_frames:
+            break
+    drain(0)
+    return pool.get_stats()
+
+
+def print_pool_stats(stats):
+    """打印每个解释器处理的帧数和利用率"""
+    print(f"解释器池: {stats['size']} 个解释器 x {stats['num_threads']} 线程")
+    for i, interpreter in enumerate(stats['interpreters']):
+        print(f"  解释器 {i}: {interpreter['frames']} 帧, 利用率 {interpreter['utilization']:.1%}")
+
+
+def print_pipeline_stats(stats):
+    """打印各阶段的处理帧数、队列深度和丢帧数"""
+    print(f"{'阶段':<12}{'处理':>8}{'队列':>8}{'丢帧':>8}{'错误':>8}")
+    for name, stage in stats['stages'].items():
+        depth = f"{stage['depth']}/{stage['maxsize']}" if 'depth' in stage else "-"
+        dropped = stage.get('dropped', "-")
+        print(f"{name:<12}{stage['processed']:>8}{depth:>8}{dropped:>8}{stage['errors']:>8}")
+    reused = stats['stages']['inference'].get('reused')
+    if reused:
+        print(f"复用上一次结果: {reused} 帧（不计入推理阶段的处理数和耗时）, 实际推理 {stats['inference_fps']:.1f} FPS")
+    if 'latency' in stats:
+        print_latency_stats(stats['latency'])
+    if 'scheduler' in stats:
+        scheduler = stats['scheduler']
+        print(f"帧率调度: 目标 {scheduler['target_fps']:.1f} FPS, 当前设定 {scheduler['current_fps']:.1f} FPS, "
+              f"实际 {scheduler['achieved_fps']:.1f} FPS, 模式 {scheduler['mode']}")
+
+
+def print_latency_stats(latency):
+    """打印各阶段耗时分位数"""
+    print(f"{'阶段':<12}{'次数':>8}{'平均ms':>10}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}{'最大ms':>10}")
+    for name, stage in latency.items():
+        print(f"{name:<12}{stage['count']:>8}{stage['mean_ms']:>10.2f}{stage['p50_ms']:>10.2f}"
+              f"{stage['p95_ms']:>10.2f}{stage['p99_ms']:>10.2f}{stage['max_ms']:>10.2f}")
+
+
+def print_cascade_stats(stats):
+    """打印级联各级的命中率、平均耗时，以及与始终使用最后一级模型的对比"""
+    print(f"模型级联: 阈值 {stats['threshold']:.2f}, 最小差值 {stats['margin']:.2f}, 共 {stats['frames']} 帧")
+    print(f"{'级':<4}{'模型':<24}{'命中':>8}{'命中率':>9}{'执行':>8}{'平均ms':>10}")
+    for level, stage in enumerate(stats['stages'], 1):
+        print(f"{level:<4}{stage['name']:<24}{stage['hits']:>8}{stage['hit_rate']:>9.1%}"
+              f"{stage['runs']:>8}{stage['mean_ms']:>10.2f}")
+    print(f"每帧平均 {stats['mean_ms']:.2f}ms, 始终使用最后一级模型 {stats['baseline_ms']:.2f}ms, "
+          f"加速 {stats['speedup']:.2f}x; 升级 {stats['escalated']} 帧, 其中 {stats['changed']} 帧结果改变")
+
+
+def close_frame_writer(writer):
+    writer.close()
+    stats = writer.get_stats()
+    print(f"帧录制: {stats['path']}, 写入 {stats['frames']} 帧 ({stats['codec']}, "
+          f"{stats['bytes_written'] / (1024 * 1024):.1f}MB), 丢弃 {stats['dropped']} 帧")
+
+
+def print_result(frame, prediction):
+    """打印单帧的top-1结果"""
+    source = frame.source or "-"
+    if isinstance(prediction, dict) and 'models' in prediction:
+        # 多模型模式打印每个模型的top-1
+        parts = [f"{name}={preds[0][0]} {preds[0][1]:.2%}" for name, preds in prediction['models'].items()]
+        print(f"[{frame.index}] {source}: {', '.join(parts)}")
+        return
+    if isinstance(prediction, dict) and 'regions' in prediction:
+        # 多区域模式打印每个区域的top-1
+        parts = [f"{region['name']}={region['predictions'][0][0]} {region['predictions'][0][1]:.2%}"
+                 for region in prediction['regions']]
+        print(f"[{frame.index}] {source}: {', '.join(parts)}")
+        return
+    if isinstance(prediction, dict) and 'stage' in prediction:
+        # 级联模式同时打印给出结果的模型
+        label, confidence = prediction['predictions'][0]
+        print(f"[{frame.index}] {source}: {label} {confidence:.2%} ({prediction['stage']})")
+        return
+    if isinstance(prediction, dict):
+        # 分块模式打印汇总结果
+        prediction = prediction['aggregate']
+    label, confidence = prediction[0]
+    print(f"[{frame.index}] {source}: {label} {confidence:.2%}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="无界面实时图像分类")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH,
+                        help="TFLite模型路径；用逗号分隔多个模型时，每帧共享捕获和预处理并发分发给所有模型")
+    parser.add_argument("--cascade", action="store_true",
+                        help="多个模型组成级联：最快的模型先分类，置信度不足时才交给更慢的模型")
+    parser.add_argument("--cascade-threshold", type=float, default=0.6, help="级联中top-1置信度低于该值时升级")
+    parser.add_argument("--cascade-margin", type=float, default=0.1, help="级联中top-1与top-2之差低于该值时升级")
+    parser.add_argument("--cascade-keep-order", action="store_true",
+                        help="级联按 --model 给定的顺序执行，默认按测得的推理耗时从快到慢排列")
+    parser.add_argument("--source", default="synthetic",
+                        help="帧源: screen | screen:x,y,w,h | xshm[:x,y,w,h] | dir:PATH | video:PATH | synthetic[:WxH[:N]] "
+                             "| replay:PATH（回放帧录制文件）")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="回放帧录制文件的速度：1为按录制时的帧间隔，0为尽可能快")
+    parser.add_argument("--record-frames", default=None, metavar="FILE",
+                        help="把捕获到的每一帧写入帧录制文件（内存映射的环形文件），之后可用 --source replay:FILE 回放")
+    parser.add_argument("--record-codec", choices=CODECS, default="raw", help="帧录制的编码方式")
+    parser.add_argument("--record-size", type=float, default=512, help="帧录制文件数据区大小（MB），写满后覆盖最旧的帧")
+    parser.add_argument("--frames", type=int, default=None, help="最多处理的帧数")
+    parser.add_argument("--loop", action="store_true", help="目录或视频读完后从头循环")
+    parser.add_argument("--quiet", action="store_true", help="不打印逐帧结果")
+    parser.add_argument("--pipeline", action="store_true", help="捕获、预处理、推理分阶段并发执行")
+    parser.add_argument("--processes", action="store_true",
+                        help="捕获和推理各自在独立进程中运行，帧通过共享内存传递（不支持多模型和解释器池）")
+    parser.add_argument("--slot-mb", type=float, default=None,
+                        help="多进程模式下每个共享内存槽位的大小（MB），默认按帧源第一帧的大小")
+    parser.add_argument("--pool", nargs="?", type=int, const=0, default=None, metavar="N",
+                        help="使用解释器池并行分类；不指定N时使用模型的运行参数（get_runtime_config 中的 pool_size）")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="每个解释器的线程数，默认使用模型的运行参数（get_runtime_config 中的 num_threads）")
+    parser.add_argument("--no-xnnpack", action="store_true", help="禁用XNNPACK委托")
+    parser.add_argument("--skip-unchanged", type=float, default=None, metavar="THRESHOLD",
+                        help="画面变化小于阈值时复用上一次结果（diff模式为0-255的平均差）")
+    parser.add_argument("--change-mode", choices=("diff", "dhash"), default="diff", help="变化检测方式")
+    parser.add_argument("--refresh-interval", type=float, default=2.0, help="复用结果时强制重新分类的间隔（秒）")
+    parser.add_argument("--tiles", default=None, metavar="RxC", help="分块模式，例如 2x2，所有块一次批量推理（使用流水线运行）")
+    parser.add_argument("--tile-overlap", type=float, default=0.1, help="相邻块的重叠比例")
+    parser.add_argument("--regions", default=None, metavar="SPEC",
+                        help="多区域模式：区域JSON文件，或 \"名称=x,y,w,h;名称=x,y,w,h\"；"
+                             "屏幕帧源每帧只截取包含所有区域的矩形，所有区域一次批量推理（使用流水线运行）")
+    parser.add_argument("--metrics", action="store_true", help="记录各阶段耗时直方图（使用流水线运行）")
+    parser.add_argument("--metrics-port", type=int, default=None, help="在本地端口提供Prometheus格式的 /metrics 端点")
+    parser.add_argument("--metrics-file", default=None, help="结束时把流水线统计和耗时分位数写入JSON文件")
+    parser.add_argument("--record", default=None, metavar="DIR",
+                        help="在DIR下新建会话目录，异步记录每帧的预测和各阶段耗时（使用流水线运行）")
+    parser.add_argument("--fps", type=float, default=None, help="目标捕获帧率（按截止时间调度，使用流水线运行）")
+    parser.add_argument("--min-fps", type=float, default=1.0, help="CPU预算模式下的最低帧率")
+    parser.add_argument("--cpu-budget", type=float, default=None,
+                        help="CPU占用上限（0-1），超出时自动降低帧率")
+    parser.add_argument("--idle-after", type=float, default=None,
+                        help="预测结果稳定多少秒后进入空闲模式")
+    parser.add_argument("--idle-fps", type=float, default=2.0, help="空闲模式下的帧率")
+    args = parser.parse_args()
+
+    tile_grid = None
+    if args.tiles:
+        tile_grid = tuple(int(v) for v in args.tiles.lower().split("x"))
+        args.pipeline = True
+    regions = None
+    if args.regions:
+        regions = parse_regions(args.regions)
+        args.pipeline = True
+    metrics = None
+    if args.metrics or args.metrics_port is not None or args.metrics_file:
+        metrics = PipelineMetrics()
+        args.pipeline = True
+    recorder = None
+    if args.record:
+        recorder = PredictionRecorder.create_session(args.record)
+        args.pipeline = True
+    scheduler = None
+    if args.fps is not None:
+        scheduler = FrameScheduler(args.fps, args.min_fps, args.cpu_budget, args.idle_after, args.idle_fps)
+        args.pipeline = True
+
+    frame_writer = None
+    if args.record_frames:
+        frame_writer = FrameRingWriter(args.record_frames, args.record_size, codec=args.record_codec)
+
+    on_result = None if args.quiet else print_result
+    use_xnnpack = not args.no_xnnpack
+    change_detector = None
+    if args.skip_unchanged is not None:
+        change_detector = ChangeDetector(args.skip_unchanged, args.refresh_interval, args.change_mode)
+    if args.pool is not None:
+        # 池大小和线程数默认来自模型的运行参数，命令行参数优先
+        model_config = dict(get_model_runtime_config(args.model), path=args.model, labels=None)
+        pool_args = {'use_xnnpack': use_xnnpack}
+        if args.pool:
+            pool_args['size'] = args.pool
+        if args.threads:
+            pool_args['num_threads'] = args.threads
+        with InterpreterPool.from_model_config(model_config, **pool_args) as pool, \
+                open_source(args, frame_writer) as source:
+            stats = run_pooled(pool, source, args.frames, on_result)
+        if frame_writer is not None:
+            close_frame_writer(frame_writer)
+        print_pool_stats(stats)
+        print(f"处理帧数: {stats['frames']}, 用时: {stats['elapsed']:.2f}s, 吞吐量: {stats['fps']:.1f} FPS")
+        return
+
+    model_paths = args.model.split(",")
+    engines = {path: ClassifierEngine(path, num_threads=args.threads or get_model_runtime_config(path)['num_threads'],
+                                      use_xnnpack=use_xnnpack)
+               for path in model_paths}
+    engine = engines[model_paths[0]]
+    fanout = None
+    if args.cascade:
+        fanout = CascadeClassifier({os.path.basename(path): engine for path, engine in engines.items()},
+                                   args.cascade_threshold, args.cascade_margin,
+                                   sort_by_speed=not args.cascade_keep_order)
+        print(f"级联顺序: {' → '.join(fanout.stage_names)}")
+    elif len(engines) > 1:
+        fanout = MultiModelClassifier(engines)
+    if args.processes:
+        if fanout is not None:
+            print("多进程模式只使用第一个模型，多模型并行和级联请使用 --pipeline")
+            fanout = None
+            args.cascade = False
+        bbox = None
+        region_boxes = None
+        if regions:
+            if args.source.startswith(("screen", "xshm")):
+                # 屏幕帧源只截取包含所有区域的矩形，区域坐标换算为相对于该矩形
+                bbox = capture_bbox(regions)
+                region_boxes = relative_boxes(regions, bbox[:2])
+            else:
+                region_boxes = relative_boxes(regions)
+        change_detection = None
+        if args.skip_unchanged is not None:
+            change_detection = (args.skip_unchanged, args.refresh_interval, args.change_mode)
+        scheduler_args = None
+        if args.fps is not None:
+            scheduler_args = (args.fps, args.min_fps, args.cpu_budget, args.idle_after, args.idle_fps)
+        stats = run_processes(engine, args, on_result, change_detection, tile_grid, metrics, scheduler_args,
+                              region_boxes, bbox, recorder, frame_writer)
+        print_pipeline_stats(stats)
+        if args.metrics_file:
+            metrics.write_json(args.metrics_file, {'pipeline': stats})
+            print(f"统计已写入: {args.metrics_file}")
+        stats['frames'] = stats['stages']['display']['processed']
+    else:
+        with open_source(args, frame_writer) as source:
+            region_boxes = None
+            if regions:
+                if hasattr(source, 'set_bbox'):
+                    # 屏幕帧源只截取包含所有区域的矩形，区域坐标换算为相对于该矩形
+                    bbox = capture_bbox(regions)
+                    source.set_bbox(bbox)
+                    region_boxes = relative_boxes(regions, bbox[:2])
+                else:
+                    region_boxes = relative_boxes(regions)
+                print(f"多区域: {len(regions)} 个区域 ({', '.join(region.name for region in regions)})")
+            if args.pipeline:
+                stats = run_pipelined(engine, source, args.frames, on_result, change_detector=change_detector,
+                                      tile_grid=tile_grid, tile_overlap=args.tile_overlap, fanout=fanout,
+                                      metrics=metrics, metrics_port=args.metrics_port, scheduler=scheduler,
+                                      regions=region_boxes, recorder=recorder)
+                print_pipeline_stats(stats)
+                if args.metrics_file:
+                    metrics.write_json(args.metrics_file, {'pipeline': stats})
+                    print(f"统计已写入: {args.metrics_file}")
+                stats['frames'] = stats['stages']['display']['processed']
+            else:
+                stats = run_headless(fanout or engine, source, args.frames, on_result, change_detector)
+
+    if frame_writer is not None:
+        close_frame_writer(frame_writer)
+    if recorder is not None:
+        recorder.close()
+        record = recorder.get_stats()
+        print(f"预测记录: {record['directory']}, 写入 {record['rows_written']} 行, 丢弃 {record['dropped']} 行, "
+              f"批量写入 {record['flushes']} 次 (平均 {record['mean_flush_ms']:.2f}ms)")
+    if args.cascade:
+        print_cascade_stats(fanout.get_stats())
+    if 'change_detection' in stats:
+        change = stats['change_detection']
+        print(f"变化检测: 复用 {change['hits']} 次, 重新分类 {change['misses']} 次, 命中率 {change['hit_rate']:.1%}")
+
+    print(f"处理帧数: {stats['frames']}, 用时: {stats['elapsed']:.2f}s, 吞吐量: {stats['fps']:.1f} FPS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地推理服务
+通过本地HTTP端口或Unix套接字提供分类接口，供其他程序使用与界面相同的分类结果；
+并发请求在解码和缩放后进入队列，由单个推理线程合并为批量 invoke（动态微批处理）：
+一批最多 max_batch 个请求，第一个请求最多等待 max_wait 秒
+
+接口:
+  POST /classify   请求体为编码后的图像（JPEG/PNG等），或 Content-Type 为 application/x-npy 的
+                   numpy数组（HxWx3/4 的uint8，或 HxW 灰度图）；查询参数 channel_order=RGB 表示数组为RGB顺序
+  GET  /health     模型信息和批处理参数
+  GET  /stats      批量大小分布、排队和推理耗时（JSON）
+  GET  /metrics    Prometheus文本格式
+
+用法:
+  python inference_server.py --model model/model.tflite --port 8500 --max-batch 8 --max-wait-ms 5
+  python inference_server.py --unix /tmp/classifier.sock
+"""
+
+import argparse
+import collections
+import http.client
+import io
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from classifier_engine import ClassifierEngine, DEFAULT_MODEL_PATH
+from metrics import PipelineMetrics
+
+NPY_CONTENT_TYPE = "application/x-npy"
+
+
+def batch_buckets(max_batch):
+    """可用的批量大小：不超过 max_batch 的2的幂以及 max_batch 本身，每种大小对应一个解释器"""
+    sizes = set()
+    size = 1
+    while size < max_batch:
+        sizes.add(size)
+        size *= 2
+    sizes.add(max_batch)
+    return sorted(sizes)
+
+
+class _Request:
+    __slots__ = ('image', 'channel_order', 'future', 'enqueued')
+
+    def __init__(self, image, channel_order):
+        self.image = image
+        self.channel_order = channel_order
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    把并发的分类请求合并为批量推理
+    预处理（缩放）在调用方线程中完成，推理线程只负责组批、invoke 和取top-k，
+    因此引擎只被推理线程使用；批量大小向上取到 batch_buckets 中的值，多出的行不参与结果
+    """
+
+    def __init__(self, engine, max_batch=8, max_wait=0.005, metrics=None):
+        self.engine = engine
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.metrics = metrics
+        self.buckets = batch_buckets(self.max_batch)
+
+        self._queue = queue.Queue()
+        self._batch_buffer = engine.allocate_batch_buffer(self.max_batch)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = collections.Counter()
+        self.start_time = time.perf_counter()
+        self.running = True
+
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image, channel_order="BGR"):
+        """提交一张图像，返回结果为预测列表的 Future；缩放在调用方线程中完成"""
+        if not self.running:
+            raise RuntimeError("推理服务已停止")
+        resized = resize_for_engine(self.engine, image)
+        request = _Request(resized, channel_order)
+        self._queue.put(request)
+        return request.future
+
+    def classify(self, image, channel_order="BGR", timeout=None):
+        """同步分类一张图像，返回 (预测列表, 批信息)"""
+        return self.submit(image, channel_order).result(timeout)
+
+    def _collect(self, first):
+        """以第一个请求的入队时间为起点，最多等待 max_wait 秒凑满一批"""
+        batch = [first]
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # 停止信号放回队列，处理完这一批后退出
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                break
+            batch = self._collect(request)
+            try:
+                self._process(batch)
+            except Exception as e:
+                print(f"批量推理错误: {e}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _process(self, batch):
+        start = time.perf_counter()
+        n = len(batch)
+        size = next(bucket for bucket in self.buckets if bucket >= n)
+        buffer = self._batch_buffer[:size]
+        engine_order = self.engine.channel_order
+        for row, request in zip(buffer, batch):
+            # 把各请求统一为模型的通道顺序
+            np.copyto(row, request.image if request.channel_order == engine_order else request.image[..., ::-1])
+
+        scores = self.engine.classify_batch(buffer, engine_order)
+        done = time.perf_counter()
+
+        batch_info = {'batch_size': n, 'inference_ms': (done - start) * 1000}
+        for request, row in zip(batch, scores):
+            info = dict(batch_info, queue_ms=(start - request.enqueued) * 1000)
+            request.future.set_result((self.engine.top_k_predictions(row), info))
+
+        with self._lock:
+            self.requests += n
+            self.batches += 1
+            self.batch_sizes[n] += 1
+        if self.metrics is not None:
+            self.metrics.observe("batch", done - start, done)
+            for request in batch:
+                self.metrics.observe("queue", start - request.enqueued, done)
+                self.metrics.observe("request", done - request.enqueued, done)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = 0
+            self.batches = 0
+            self.batch_sizes = collections.Counter()
+            self.start_time = time.perf_counter()
+        if self.metrics is not None:
+            self.metrics.reset()
+
+    def get_stats(self):
+        """返回请求数、吞吐量、平均批量大小、批量大小分布和各阶段耗时分位数"""
+        with self._lock:
+            requests, batches = self.requests, self.batches
+            batch_sizes = dict(sorted(self.batch_sizes.items()))
+            elapsed = time.perf_counter() - self.start_time
+        stats = {
+            'requests': requests,
+            'batches': batches,
+            'elapsed': elapsed,
+            'throughput': requests / elapsed if elapsed > 0 else 0.0,
+            'mean_batch_size': requests / batches if batches else 0.0,
+            'batch_sizes': batch_sizes,
+            'queue_depth': self.queue_depth(),
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+        if self.metrics is not None:
+            stats['latency'] = self.metrics.snapshot()
+        return stats
+
+    def prometheus_text(self):
+        stats = self.get_stats()
+        gauges = {
+            ('queue_depth', "queue"): stats['queue_depth'],
+            ('mean_batch_size', "batch"): stats['mean_batch_size'],
+            ('requests_total', "request"): stats['requests'],
+        }
+        return self.metrics.to_prometheus("classifier_server", gauges)
+
+    def close(self):
+        """停止推理线程；队列中已有的请求仍会处理完"""
+        if not self.running:
+            return
+        self.running = False
+        self._queue.put(None)
+        self._thread.join()
+        # 停止信号之后才入队的请求不会再被处理
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.future.set_exception(RuntimeError("推理服务已停止"))
+
+
+def resize_for_engine(engine, image):
+    """把图像缩放到模型输入尺寸，写入新分配的缓冲区（每个请求一个，供推理线程稍后读取）"""
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    return engine.preprocess_image(image, out=engine.allocate_resize_buffer())
+
+
+def decode_image(body, content_type):
+    """把请求体解码为uint8图像：numpy数组（.npy格式）或编码后的图像文件（解码为BGR）"""
+    if content_type.split(";")[0].strip().lower() == NPY_CONTENT_TYPE:
+        image = np.load(io.BytesIO(body), allow_pickle=False)
+        if image.dtype != np.uint8:
+            raise ValueError(f"数组数据类型必须为uint8，收到 {image.dtype}")
+        if not (image.ndim == 2 or (image.ndim == 3 and image.shape[2] in (3, 4))):
+            raise ValueError(f"数组形状必须为 HxW、HxWx3 或 HxWx4，收到 {image.shape}")
+        return image
+    image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("无法解码图像")
+    return image
+
+
+UnixStreamServer = getattr(socketserver, "UnixStreamServer", None)
+
+if UnixStreamServer is not None:
+    class _UnixHTTPServer(socketserver.ThreadingMixIn, UnixStreamServer):
+        daemon_threads = True
+
+
+class InferenceServer:
+    """在本地端口（或Unix套接字）上提供分类接口，请求交给 MicroBatcher 合并推理"""
+
+    def __init__(self, batcher, host="127.0.0.1", port=8500, unix_socket=None):
+        self.batcher = batcher
+        self.unix_socket = unix_socket
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # 保持连接，客户端可以在同一连接上连续发送请求
+            protocol_version = "HTTP/1.1"
+
+            def _send_json(self, data, status=200):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                if path == "/health":
+                    self._send_json(server.health())
+                elif path == "/stats":
+                    self._send_json(server.batcher.get_stats())
+                elif path == "/metrics" and server.batcher.metrics is not None:
+                    body = server.batcher.prometheus_text().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                else:
+                    self._send_json({'error': "未知路径"}, 404)
+
+            def do_POST(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                if url.path != "/classify":
+                    self._send_json({'error': "未知路径"}, 404)
+                    return
+                channel_order = parse_qs(url.query).get("channel_order", ["BGR"])[0].upper()
+                try:
+                    image = decode_image(body, self.headers.get("Content-Type", ""))
+                except ValueError as e:
+                    self._send_json({'error': str(e)}, 400)
+                    return
+                try:
+                    predictions, info = server.batcher.classify(image, channel_order)
+                except RuntimeError as e:
+                    self._send_json({'error': str(e)}, 503)
+                    return
+                except Exception as e:
+                    self._send_json({'error': f"推理错误: {e}"}, 500)
+                    return
+                info['predictions'] = [{'label': label, 'confidence': confidence}
+                                       for label, confidence in predictions]
+                self._send_json(info)
+
+            def log_message(self, format, *args):
+                pass
+
+        if unix_socket:
+            if UnixStreamServer is None:
+                raise OSError("当前平台不支持Unix套接字")
+            if os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+            self.httpd = _UnixHTTPServer(unix_socket, Handler)
+            self.address = f"unix:{unix_socket}"
+        else:
+            self.httpd = ThreadingHTTPServer((host, port), Handler)
+            self.httpd.daemon_threads = True
+            self.address = f"{host}:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="inference-server", daemon=True)
+        self.thread.start()
+
+    def health(self):
+        engine = self.batcher.engine
+        return {
+            'status': "ok" if self.batcher.running else "stopped",
+            'model': os.path.basename(engine.model_path),
+            'input_shape': [int(v) for v in engine.input_shape],
+            'quantized': engine.is_quantized,
+            'labels': list(engine.labels),
+            'max_batch': self.batcher.max_batch,
+            'max_wait_ms': self.batcher.max_wait * 1000,
+        }
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.unix_socket and os.path.exists(self.unix_socket):
+            os.unlink(self.unix_socket)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class InferenceClient:
+    """
+    推理服务的客户端，保持一个连接；address 为 host:port 或 unix:路径
+    每个线程应使用自己的客户端
+    """
+
+    def __init__(self, address="127.0.0.1:8500", timeout=30):
+        self.address = address
+        self.timeout = timeout
+        self._conn = None
+
+    def _connect(self):
+        if self.address.startswith("unix:"):
+            return _UnixHTTPConnection(self.address[len("unix:"):], self.timeout)
+        host, _, port = self.address.rpartition(":")
+        return http.client.HTTPConnection(host or "127.0.0.1", int(port), timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        """发送请求并返回解码后的JSON；连接被服务端关闭时重连一次"""
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = self._connect()
+            try:
+                self._conn.request(method, path, body=body, headers=headers or {})
+                response = self._conn.getresponse()
+                data = json.loads(response.read().decode("utf-8"))
+            except (ConnectionError, http.client.HTTPException):
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if response.status != 200:
+                raise RuntimeError(data.get('error', f"HTTP {response.status}"))
+            return data
+
+    def classify(self, image, channel_order="BGR"):
+        """分类一张图像：image 为编码后的图像字节或uint8数组，返回服务端的JSON结果"""
+        if isinstance(image, np.ndarray):
+            buffer = io.BytesIO()
+            np.save(buffer, image, allow_pickle=False)
+            body, content_type = buffer.getvalue(), NPY_CONTENT_TYPE
+        else:
+            body, content_type = image, "application/octet-stream"
+        return self.request("POST", f"/classify?channel_order={channel_order}", body,
+                            {'Content-Type': content_type})
+
+    def health(self):
+        return self.request("GET", "/health")
+
+    def stats(self):
+        return self.request("GET", "/stats")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def print_server_stats(stats):
+    print(f"请求数: {stats['requests']}, 批次数: {stats['batches']}, 平均批量: {stats['mean_batch_size']:.2f}, "
+          f"吞吐量: {stats['throughput']:.1f} 张/秒")
+    print(f"批量大小分布: {stats['batch_sizes']}")
+    for stage, latency in stats.get('latency', {}).items():
+        print(f"  {stage:<8} p50 {latency['p50_ms']:.2f}ms  p95 {latency['p95_ms']:.2f}ms  "
+              f"p99 {latency['p99_ms']:.2f}ms")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="本地推理服务（动态微批处理）")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="TFLite模型路径")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8500, help="监听端口，0 表示自动选择")
+    parser.add_argument("--unix", default=None, metavar="PATH", help="改为监听Unix套接字")
+    parser.add_argument("--max-batch", type=int, default=8, help="一次 invoke 合并的最多请求数")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="组批时第一个请求的最长等待时间（毫秒）")
+    parser.add_argument("--threads", type=int, default=None, help="解释器线程数")
+    parser.add_argument("--no-xnnpack", action="store_true", help="禁用XNNPACK委托")
+    parser.add_argument("--top-k", type=int, default=3, help="返回的预测数量")
+    args = parser.parse_args()
+
+    engine = ClassifierEngine(args.model, top_k=args.top_k, num_threads=args.threads,
+                              use_xnnpack=not args.no_xnnpack)
+    batcher = MicroBatcher(engine, args.max_batch, args.max_wait_ms / 1000, PipelineMetrics())
+    # 提前创建各批量大小的解释器，第一批请求不承担创建耗时
+    for size in batcher.buckets:
+        engine.classify_batch(engine.allocate_batch_buffer(size))
+    server = InferenceServer(batcher, args.host, args.port, args.unix)
+    print(f"推理服务已启动: {server.address} (模型 {os.path.basename(args.model)}, "
+          f"最大批量 {batcher.max_batch}, 最长等待 {args.max_wait_ms}ms)", flush=True)
+
+    # SIGTERM 与 Ctrl+C 一样正常退出并打印统计
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        batcher.close()
+        print_server_stats(batcher.get_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+解释器池
+同一模型创建多个独立的解释器，通过 submit() 并行分类多帧或多个区域，
+TFLite 的 invoke 和 cv2.resize 执行期间会释放GIL，因此线程即可利用多核
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from classifier_engine import ClassifierEngine
+
+
+class InterpreterPool:
+    """由 size 个 ClassifierEngine 组成的池，每个引擎同一时刻只被一个任务使用"""
+
+    def __init__(self, model_path, labels=None, size=2, num_threads=1, use_xnnpack=True, top_k=3):
+        self.model_path = model_path
+        self.size = size
+        self.num_threads = num_threads
+
+        self.engines = [ClassifierEngine(model_path, labels, top_k=top_k,
+                                         num_threads=num_threads, use_xnnpack=use_xnnpack)
+                        for _ in range(size)]
+        self._idle = queue.Queue()
+        for i in range(size):
+            self._idle.put(i)
+
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="interpreter")
+        self._lock = threading.Lock()
+        self.busy_time = [0.0] * size
+        self.completed = [0] * size
+        self.start_time = time.perf_counter()
+
+    @classmethod
+    def from_model_config(cls, model_config, **kwargs):
+        """使用 auto_discover_models 返回的模型配置（含 pool_size/num_threads）创建池"""
+        kwargs.setdefault('size', model_config.get('pool_size', 2))
+        kwargs.setdefault('num_threads', model_config.get('num_threads', 1))
+        return cls(model_config['path'], model_config['labels'], **kwargs)
+
+    @property
+    def engine(self):
+        """第一个引擎，用于读取输入尺寸、标签等模型信息"""
+        return self.engines[0]
+
+    def submit(self, image, channel_order="BGR"):
+        """提交一帧图像，返回结果为预测列表的 Future"""
+        return self._executor.submit(self._run, image, channel_order)
+
+    def map(self, images, channel_order="BGR"):
+        """并行分类多张图像，按输入顺序返回预测列表"""
+        futures = [self.submit(image, channel_order) for image in images]
+        return [future.result() for future in futures]
+
+    def _run(self, image, channel_order):
+        i = self._idle.get()
+        try:
+            start = time.perf_counter()
+            prediction = self.engines[i].process_frame(image, channel_order)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.busy_time[i] += elapsed
+                self.completed[i] += 1
+            return prediction
+        finally:
+            self._idle.put(i)
+
+    def reset_stats(self):
+        with self._lock:
+            self.busy_time = [0.0] * self.size
+            self.completed = [0] * self.size
+            self.start_time = time.perf_counter()
+
+    def get_stats(self):
+        """返回整体帧率和每个解释器的利用率（忙碌时间 / 总时间）"""
+        with self._lock:
+            elapsed = time.perf_counter() - self.start_time
+            busy_time = list(self.busy_time)
+            completed = list(self.completed)
+        total = sum(completed)
+        return {
+            'size': self.size,
+            'num_threads': self.num_threads,
+            'elapsed': elapsed,
+            'frames': total,
+            'fps': total / elapsed if elapsed > 0 else 0.0,
+            'interpreters': [
+                {'frames': completed[i], 'utilization': busy_time[i] / elapsed if elapsed > 0 else 0.0}
+                for i in range(self.size)
+            ],
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,43 +1,99 @@
 import numpy as np
 import cv2
+import os
 import time
 import tkinter as tk
-from tkinter import ttk, messagebox
-from PIL import Image, ImageTk, ImageGrab
+from tkinter import ttk, messagebox, filedialog, simpledialog
+from PIL import Image, ImageTk
 import threading
-import tensorflow as tf
-from tensorflow.lite.python.interpreter import Interpreter
+
+from cascade import CascadeClassifier
+from change_detector import ChangeDetector
+from classifier_engine import auto_discover_models, generate_labels_for_model, resize_into
+from fanout import MultiModelClassifier
+from frame_sources import RecordingFrameSource, create_screen_source
+from frame_store import FrameRingWriter
+from metrics import MetricsServer, PipelineMetrics
+from model_cache import ModelCache
+from pipeline import FramePipeline
+from process_pipeline import ProcessPipeline
+from recorder import PredictionRecorder
+from regions import Region, capture_bbox, load_regions, relative_boxes, save_regions
+from scheduler import FrameScheduler
+
+# 预测记录（默认关闭）：设为 True 时每次开始捕获在 RECORDINGS_DIR 下新建一个会话目录，异步写入每帧的结果和各阶段耗时
+RECORD_PREDICTIONS = False
+RECORDINGS_DIR = "recordings"
+
+# 帧录制：设为文件路径时把捕获到的每一帧写入该环形文件（写满后覆盖最旧的帧），
+# 之后可用 headless.py --source replay:路径 在相同的输入上重复测试；None 表示不录制
+FRAME_RECORDING_FILE = None
+FRAME_RECORDING_CODEC = "jpeg"  # raw / png / jpeg
+FRAME_RECORDING_MB = 512
+
+# 多区域：启动时自动加载的区域文件，存在时默认使用"多区域"捕获
+REGIONS_FILE = "regions.json"
+
+# 模型级联：top-1置信度低于阈值或top-1与top-2之差小于最小差值时交给下一级更慢的模型
+CASCADE_THRESHOLD = 0.6
+CASCADE_MARGIN = 0.1
+
+# 帧率调度：目标帧率；按截止时间安排捕获，处理耗时计入帧间隔
+TARGET_FPS = 10.0
+# CPU预算模式：CPU占用（0-1）超过预算时自动降低帧率，最低降到 MIN_FPS；None 表示不限制
+CPU_BUDGET = None
+MIN_FPS = 2.0
+# 空闲模式：预测结果连续稳定 IDLE_AFTER 秒后降低到 IDLE_FPS，结果变化时立即恢复；None 表示不启用
+IDLE_AFTER = 5.0
+IDLE_FPS = 2.0
+
+# 画面变化检测：缩略图平均差低于阈值时复用上一次结果，且至少每隔一段时间重新分类一次
+CHANGE_THRESHOLD = 2.0
+CHANGE_REFRESH_INTERVAL = 2.0  # 秒
+
+# 全屏分块模式的网格 (行, 列) 和相邻块的重叠比例
+TILE_GRID = (2, 2)
+TILE_OVERLAP = 0.1
+
+# 模型缓存容量：最多缓存的模型数量和内存预算（字节）
+MODEL_CACHE_SIZE = 4
+MODEL_CACHE_BYTES = 512 * 1024 * 1024
+# 低内存模式：缓存中的模型超过该时间（秒）未使用时释放其解释器（保留模型信息，下次使用时重新创建），None 表示不释放
+LOW_MEMORY_IDLE_TIMEOUT = None
+# 模型加载方式：None 使用环境变量 MODEL_LOADING（默认 mmap），可选 "mmap" / "content"，见 model_memory.py
+MODEL_LOADING = None
+
+# 截图方式：imagegrab（PIL.ImageGrab）、xshm（Linux X11共享内存，只抓取所选区域）、auto（可用时使用xshm）
+CAPTURE_BACKEND = "imagegrab"
+
+# 运行方式：threads（捕获、预处理、推理在本进程的线程中运行）或 processes（捕获和推理各自在独立进程中运行，
+# 帧通过共享内存传递，界面进程只接收预测结果；只使用当前模型，不支持多模型并行和级联）
+EXECUTION_MODE = "threads"
+
+# 预览图尺寸 (宽, 高)
+DISPLAY_SIZE = (400, 300)
+
+# 性能统计：记录各阶段耗时直方图并在界面上显示；设为 False 时流水线不做任何计时
+METRICS_ENABLED = True
+# 本地Prometheus指标端口（例如 9108），None 表示不启动端点
+METRICS_PORT = None
 
 class RealTimeImageClassifier:
     def __init__(self):
-        try:
-            ######## 加载TFLite模型#############
-            model_path = "model/model.tflite"
-            ######## 加载TFLite模型#############    
-            self.interpreter = Interpreter(model_path=model_path)
-            self.interpreter.allocate_tensors()
-        except Exception as e:
-            print(f"模型加载失败: {e}")
-            # 创建一个简单的错误提示窗口
-            error_root = tk.Tk()
-            error_root.title("错误")
-            error_root.geometry("400x200")
-            ttk.Label(error_root, text=f"模型加载失败:\n{e}", font=("Arial", 12)).pack(pady=20)
-            ttk.Button(error_root, text="确定", command=error_root.destroy).pack()
-            error_root.mainloop()
-            raise e
-        
-        # 获取模型输入输出信息
-        self.input_details = self.interpreter.get_input_details()
-        self.output_details = self.interpreter.get_output_details()
-        self.input_shape = self.input_details[0]['shape']
-        
         # 自动搜索模型文件
         self.models = self.auto_discover_models()
         
         # 当前模型
         self.current_model = list(self.models.keys())[0] if self.models else 'default'
-        self.labels = self.models[self.current_model]['labels'] if self.models else ['未知']
+        labels = self.models[self.current_model]['labels'] if self.models else ['未知']
+        
+        ######## 加载TFLite模型#############
+        model_path = "model/model.tflite"
+        ######## 加载TFLite模型#############    
+        # 模型（以及TFLite运行时）在窗口显示之后于后台加载
+        self.model_cache = ModelCache(MODEL_CACHE_SIZE, MODEL_CACHE_BYTES, idle_timeout=LOW_MEMORY_IDLE_TIMEOUT,
+                                      model_loading=MODEL_LOADING)
+        self.engine = None
         
         # 创建GUI窗口
         self.root = tk.Tk()
@@ -55,83 +111,56 @@ class RealTimeImageClassifier:
         except:
             pass
         
+        # 屏幕帧源 - 捕获区域由GUI在主线程中更新
+        self.frame_source = create_screen_source(CAPTURE_BACKEND)
+        
         # 创建控件
         self.setup_gui()
         
         # 控制变量
         self.is_running = False
-        self.capture_thread = None
+        self.pipeline = None
+        self.fanout = None
+        self.recorder = None
+        self.frame_writer = None
+        
+        # 界面更新合并：工作线程只保留最新一帧的预览图，Tk事件队列中最多有一个待执行的更新
+        self._gui_lock = threading.Lock()
+        self._pending_update = None
+        self._update_scheduled = False
+        self.coalesced_updates = 0
+        # 预览图缩放和颜色转换的缓冲区（只在显示线程中使用）
+        self._thumb_resized = np.empty((DISPLAY_SIZE[1], DISPLAY_SIZE[0], 3), dtype=np.uint8)
+        self._thumb_rgb = np.empty_like(self._thumb_resized)
+        
+        # 性能统计和可选的本地指标端点
+        self.metrics = PipelineMetrics() if METRICS_ENABLED else None
+        self.metrics_server = None
+        if self.metrics is not None and METRICS_PORT is not None:
+            try:
+                self.metrics_server = MetricsServer(self.render_metrics, port=METRICS_PORT)
+                print(f"指标端点: http://127.0.0.1:{self.metrics_server.port}/metrics")
+            except OSError as e:
+                print(f"指标端点启动失败: {e}")
+        
+        # 部署时预先配置的区域文件
+        if os.path.exists(REGIONS_FILE):
+            self.load_regions_file(REGIONS_FILE)
         
-        # 屏幕捕获器 - 使用PIL的ImageGrab替代mss
-        self.sct = None
+        # 在后台加载初始模型，加载完成前不能开始捕获
+        self.start_btn.config(state="disabled")
+        self.status_var.set("正在加载模型...")
+        self.model_cache.get_async(
+            model_path, labels,
+            callback=lambda engine, error: self.root.after(0, self.on_initial_model_loaded, engine, error))
         
     def auto_discover_models(self):
         """自动发现模型目录中的模型文件"""
-        import os
-        import glob
-        
-        models = {}
-        model_dir = r"C:\Users\AI_LAB_Student\image_classifier - Copy\model"
-        
-        try:
-            # 检查模型目录是否存在
-            if not os.path.exists(model_dir):
-                print(f"模型目录不存在: {model_dir}")
-                # 尝试使用相对路径
-                model_dir = "model"
-                if not os.path.exists(model_dir):
-                    print(f"相对路径也不存在: {model_dir}")
-                    return {}
-            
-            # 搜索所有.tflite文件
-            tflite_files = glob.glob(os.path.join(model_dir, "*.tflite"))
-            
-            if not tflite_files:
-                print(f"在目录 {model_dir} 中未找到.tflite文件")
-                return {}
-            
-            print(f"找到 {len(tflite_files)} 个模型文件:")
-            
-            for model_file in tflite_files:
-                # 获取文件名（不含扩展名）作为模型键
-                model_name = os.path.splitext(os.path.basename(model_file))[0]
-                
-                # 根据文件名生成标签（这里可以根据需要自定义）
-                labels = self.generate_labels_for_model(model_name)
-                
-                # 使用相对路径存储
-                relative_path = os.path.relpath(model_file, os.getcwd())
-                
-                models[model_name] = {
-                    'path': relative_path,
-                    'labels': labels,
-                    'name': f'{model_name}模型',
-                    'full_path': model_file
-                }
-                
-                print(f"  - {model_name}: {relative_path} (标签: {len(labels)}个)")
-            
-            return models
-            
-        except Exception as e:
-            print(f"自动发现模型时出错: {e}")
-            return {}
+        return auto_discover_models()
     
     def generate_labels_for_model(self, model_name):
         """根据模型名称生成标签"""
-        # 预定义的标签映射
-        label_mappings = {
-            'model': ['daisy', 'dandelion', 'roses', 'sunflowers', 'tulips'],  # 花朵
-            'model1': ['cats', 'chicken', 'cow', 'dogs', 'elephant'],  # 动物
-        }
-        
-        # 如果找到预定义的标签，使用它
-        if model_name in label_mappings:
-            return label_mappings[model_name]
-        
-        # 否则生成通用标签
-        print(f"模型 {model_name} 没有预定义标签，使用通用标签")
-        return [f'类别{i}' for i in range(5)]  # 默认5个类别
+        return generate_labels_for_model(model_name)
         
     def setup_gui(self):
         # 主框架
@@ -152,7 +181,7 @@ class RealTimeImageClassifier:
         ttk.Label(control_frame, text="捕获区域:").grid(row=0, column=2, padx=(20, 5))
         self.area_var = tk.StringVar(value="全屏")
         area_combo = ttk.Combobox(control_frame, textvariable=self.area_var, 
-                                 values=["全屏", "自定义区域"], state="readonly", width=15)
+                                 values=["全屏", "全屏分块", "自定义区域", "多区域"], state="readonly", width=15)
         area_combo.grid(row=0, column=3)
         
         # 自定义区域调整控件 - 移动到右侧
@@ -206,6 +235,18 @@ class RealTimeImageClassifier:
         self.model_info_label = ttk.Label(model_frame, text=f"当前模型: {self.models[self.current_model]['name']}")
         self.model_info_label.grid(row=0, column=4, padx=(10, 0))
         
+        # 多模型并行：每帧共享捕获和预处理，同时交给所有模型分类
+        self.fanout_var = tk.BooleanVar(value=False)
+        fanout_check = ttk.Checkbutton(model_frame, text="所有模型并行", variable=self.fanout_var,
+                                       command=self.toggle_fanout)
+        fanout_check.grid(row=0, column=5, padx=(10, 0))
+        
+        # 模型级联：最快的模型先分类，置信度不足时才交给更慢的模型（与多模型并行互斥）
+        self.cascade_var = tk.BooleanVar(value=False)
+        cascade_check = ttk.Checkbutton(model_frame, text="置信度级联", variable=self.cascade_var,
+                                        command=self.toggle_cascade)
+        cascade_check.grid(row=0, column=6, padx=(10, 0))
+        
 
         
         # 绑定区域选择变化事件
@@ -217,10 +258,27 @@ class RealTimeImageClassifier:
         self.width_var.trace('w', self.on_custom_area_change)
         self.height_var.trace('w', self.on_custom_area_change)
         
-        # 初始状态：隐藏自定义区域控件
+        # 多区域：用上面的X/Y/宽/高添加命名区域，每帧只截取一次，所有区域一次批量推理
+        self.regions = []
+        self.regions_frame = ttk.Frame(main_frame)
+        self.regions_frame.grid(row=2, column=0, columnspan=2, pady=(0, 10), sticky=tk.W)
+        ttk.Label(self.regions_frame, text="区域:").grid(row=0, column=0, padx=(0, 5))
+        self.region_var = tk.StringVar(value="")
+        self.region_combo = ttk.Combobox(self.regions_frame, textvariable=self.region_var,
+                                         values=[], state="readonly", width=15)
+        self.region_combo.grid(row=0, column=1, padx=(0, 10))
+        ttk.Button(self.regions_frame, text="添加当前区域", command=self.add_region).grid(row=0, column=2, padx=(0, 5))
+        ttk.Button(self.regions_frame, text="删除", command=self.remove_region).grid(row=0, column=3, padx=(0, 5))
+        ttk.Button(self.regions_frame, text="保存区域", command=self.save_regions_file).grid(row=0, column=4, padx=(0, 5))
+        ttk.Button(self.regions_frame, text="加载区域", command=self.load_regions_file).grid(row=0, column=5)
+        
+        # 初始状态：隐藏自定义区域和多区域控件
         self.custom_frame.grid_remove()
+        self.regions_frame.grid_remove()
         
         # 图像显示区域
+        # 预览图只创建一个 PhotoImage，之后每帧原地更新
+        self.photo = ImageTk.PhotoImage("RGB", DISPLAY_SIZE)
         self.image_label = ttk.Label(main_frame, text="等待开始捕获...")
         self.image_label.grid(row=3, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E, tk.N, tk.S))
         
@@ -241,6 +299,15 @@ class RealTimeImageClassifier:
         status_bar = ttk.Label(main_frame, textvariable=self.status_var, relief="sunken")
         status_bar.grid(row=5, column=0, columnspan=2, pady=(10, 0), sticky=(tk.W, tk.E))
         
+        # 性能统计：各阶段 p50/p95 耗时和实际帧率
+        if METRICS_ENABLED:
+            metrics_frame = ttk.Frame(main_frame)
+            metrics_frame.grid(row=6, column=0, columnspan=2, pady=(5, 0), sticky=(tk.W, tk.E))
+            self.metrics_var = tk.StringVar(value="")
+            ttk.Label(metrics_frame, textvariable=self.metrics_var).grid(row=0, column=0, sticky=tk.W)
+            ttk.Button(metrics_frame, text="导出统计", command=self.export_metrics).grid(row=0, column=1, padx=(10, 0))
+            metrics_frame.columnconfigure(0, weight=1)
+        
         # 配置网格权重
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
@@ -256,11 +323,19 @@ class RealTimeImageClassifier:
         
         if selected_area == "自定义区域":
             self.custom_frame.grid()  # 显示自定义区域控件
+            self.regions_frame.grid_remove()
             # 立即更新状态栏
             self.on_custom_area_change()
+        elif selected_area == "多区域":
+            # X/Y/宽/高用于添加新区域
+            self.custom_frame.grid()
+            self.regions_frame.grid()
+            self.status_var.set(f"多区域: {len(self.regions)} 个区域")
         else:
             self.custom_frame.grid_remove()  # 隐藏自定义区域控件
+            self.regions_frame.grid_remove()
             self.status_var.set("就绪")
+        self.update_capture_area()
         
     def on_custom_area_change(self, *args):
         """当自定义区域参数改变时调用"""
@@ -276,7 +351,108 @@ class RealTimeImageClassifier:
             except (ValueError, tk.TclError):
                 # 如果值无效，不更新状态栏
                 pass
-        
+            self.update_capture_area()
+    
+    def set_capture_bbox(self, bbox):
+        """设置捕获区域；多进程模式下帧源在捕获进程中，同时把区域发送给流水线"""
+        self.frame_source.set_bbox(bbox)
+        if self.pipeline is not None and hasattr(self.pipeline, 'set_bbox'):
+            self.pipeline.set_bbox(bbox)
+    
+    def update_capture_area(self):
+        """根据当前界面设置更新帧源的捕获区域和分块模式（在主线程中调用）"""
+        area = self.area_var.get()
+        if self.pipeline is not None:
+            self.pipeline.tile_grid = TILE_GRID if area == "全屏分块" else None
+            self.pipeline.regions = None
+        if area == "多区域":
+            if not self.regions:
+                self.set_capture_bbox(None)
+                return
+            # 只截取包含所有区域的矩形，各区域按相对位置裁剪
+            bbox = capture_bbox(self.regions)
+            self.set_capture_bbox(bbox)
+            if self.pipeline is not None:
+                self.pipeline.regions = relative_boxes(self.regions, bbox[:2])
+            return
+        if area != "自定义区域":
+            self.set_capture_bbox(None)
+            return
+        try:
+            # 使用用户自定义的区域设置
+            x = self.x_var.get()
+            y = self.y_var.get()
+            width = self.width_var.get()
+            height = self.height_var.get()
+            self.set_capture_bbox((x, y, x + width, y + height))  # (left, top, right, bottom)
+        except (ValueError, tk.TclError):
+            # 如果自定义区域值无效，回退到全屏捕获
+            self.set_capture_bbox(None)
+        
+    def set_regions(self, regions):
+        """替换区域列表并更新下拉框和捕获区域"""
+        self.regions = list(regions)
+        names = [region.name for region in self.regions]
+        self.region_combo.config(values=names)
+        self.region_var.set(names[-1] if names else "")
+        self.update_capture_area()
+    
+    def add_region(self):
+        """把当前X/Y/宽/高添加为一个命名区域"""
+        try:
+            x, y = self.x_var.get(), self.y_var.get()
+            width, height = self.width_var.get(), self.height_var.get()
+        except (ValueError, tk.TclError):
+            self.status_var.set("区域参数无效")
+            return
+        name = simpledialog.askstring("添加区域", "区域名称:", initialvalue=f"区域{len(self.regions) + 1}",
+                                      parent=self.root)
+        if not name:
+            return
+        # 同名区域被替换
+        regions = [region for region in self.regions if region.name != name]
+        regions.append(Region(name, x, y, width, height))
+        self.set_regions(regions)
+        self.status_var.set(f"已添加区域 {name}: X={x}, Y={y}, 宽={width}, 高={height}")
+    
+    def remove_region(self):
+        """删除下拉框中选中的区域"""
+        name = self.region_var.get()
+        self.set_regions([region for region in self.regions if region.name != name])
+        self.status_var.set(f"已删除区域 {name}")
+    
+    def save_regions_file(self):
+        """把区域列表保存为JSON文件"""
+        path = filedialog.asksaveasfilename(title="保存区域", initialfile=REGIONS_FILE,
+                                            defaultextension=".json", filetypes=[("JSON", "*.json")])
+        if not path:
+            return
+        try:
+            save_regions(self.regions, path)
+            self.status_var.set(f"已保存 {len(self.regions)} 个区域: {path}")
+        except OSError as e:
+            error_msg = f"保存区域失败: {e}"
+            print(error_msg)
+            self.status_var.set(error_msg)
+    
+    def load_regions_file(self, path=None):
+        """从JSON文件加载区域列表，path 为 None 时选择文件；成功时切换到多区域捕获"""
+        if path is None:
+            path = filedialog.askopenfilename(title="加载区域", filetypes=[("JSON", "*.json")])
+            if not path:
+                return
+        try:
+            regions = load_regions(path)
+        except (OSError, ValueError, KeyError) as e:
+            error_msg = f"加载区域失败: {e}"
+            print(error_msg)
+            self.status_var.set(error_msg)
+            return
+        self.set_regions(regions)
+        self.area_var.set("多区域")
+        self.on_area_change()
+        print(f"已加载 {len(regions)} 个区域: {path}")
+    
     def reset_custom_area(self):
         """重置自定义区域为默认值"""
         self.x_var.set(400)
@@ -285,49 +461,142 @@ class RealTimeImageClassifier:
         self.height_var.set(300)
         self.status_var.set("已重置为默认区域设置")
         
+    def on_initial_model_loaded(self, engine, error):
+        """初始模型加载完成后在主线程中调用"""
+        if error is not None:
+            print(f"模型加载失败: {error}")
+            self.status_var.set(f"模型加载失败: {error}")
+            messagebox.showerror("错误", f"模型加载失败:\n{error}")
+            return
+        
+        # 加载期间用户已经切换了模型时保留切换后的模型
+        if self.engine is None:
+            self.engine = engine
+        if not self.is_running:
+            self.start_btn.config(state="normal")
+        self.status_var.set("就绪")
+        
+        # 在后台预加载发现的模型，之后切换模型无需等待
+        self.model_cache.preload(self.models.values())
+    
     def switch_model(self):
-        """切换模型"""
+        """切换模型（从缓存获取或在后台加载，不中断正在进行的捕获）"""
         try:
-            # 停止当前捕获
-            if self.is_running:
-                self.stop_capture()
-            
             # 获取选择的模型
             new_model = self.model_var.get()
             if new_model == self.current_model:
                 return
-                
-            # 更新当前模型
-            self.current_model = new_model
-            model_config = self.models[new_model]
-            
-            # 重新加载模型
-            self.interpreter = Interpreter(model_path=model_config['path'])
-            self.interpreter.allocate_tensors()
             
-            # 更新输入输出信息
-            self.input_details = self.interpreter.get_input_details()
-            self.output_details = self.interpreter.get_output_details()
-            self.input_shape = self.input_details[0]['shape']
-            
-            # 更新标签
-            self.labels = model_config['labels']
-            
-            # 更新显示信息
-            self.model_info_label.config(text=f"当前模型: {model_config['name']}")
-            self.status_var.set(f"已切换到{model_config['name']}")
-            
-            # 清除之前的结果
-            self.clear_image_display()
+            model_config = self.models[new_model]
+            self.switch_model_btn.config(state="disabled")
+            if not self.model_cache.contains(model_config['path']):
+                self.status_var.set(f"正在加载{model_config['name']}...")
             
-            print(f"成功切换到模型: {model_config['name']}")
+            # 加载完成后回到主线程应用
+            self.model_cache.get_async(
+                model_config['path'], model_config['labels'],
+                callback=lambda engine, error: self.root.after(0, self.on_model_loaded, new_model, engine, error))
             
         except Exception as e:
-            error_msg = f"模型切换失败: {e}"
+            self.on_model_loaded(self.model_var.get(), None, e)
+    
+    def on_model_loaded(self, model_name, engine, error):
+        """模型加载完成后在主线程中切换"""
+        self.switch_model_btn.config(state="normal")
+        
+        if error is not None:
+            error_msg = f"模型切换失败: {error}"
             print(error_msg)
             self.status_var.set(error_msg)
             # 回退到之前的模型
             self.model_var.set(self.current_model)
+            return
+        
+        # 更新当前模型，正在运行的流水线从下一帧起使用新模型
+        self.current_model = model_name
+        model_config = self.models[model_name]
+        self.engine = engine
+        if self.pipeline is not None:
+            self.pipeline.set_engine(engine)
+        elif not self.is_running:
+            self.start_btn.config(state="normal")
+        
+        # 更新显示信息
+        self.model_info_label.config(text=f"当前模型: {model_config['name']}")
+        self.status_var.set(f"已切换到{model_config['name']}")
+        
+        # 未在捕获时清除之前的结果
+        if not self.is_running:
+            self.clear_image_display()
+        
+        print(f"成功切换到模型: {model_config['name']}")
+    
+    def toggle_fanout(self):
+        """开启或关闭多模型并行分类"""
+        if self.fanout_var.get():
+            self.cascade_var.set(False)
+        self.set_multi_model_mode('fanout' if self.fanout_var.get() else None)
+    
+    def toggle_cascade(self):
+        """开启或关闭模型级联"""
+        if self.cascade_var.get():
+            self.fanout_var.set(False)
+        self.set_multi_model_mode('cascade' if self.cascade_var.get() else None)
+    
+    def set_multi_model_mode(self, mode):
+        """mode 为 'fanout'（所有模型并行）、'cascade'（置信度级联）或 None（单模型）"""
+        if mode is None:
+            self.replace_fanout(None)
+            self.status_var.set(f"已切换到{self.models[self.current_model]['name']}")
+            return
+        
+        self.status_var.set("正在加载所有模型...")
+        models = dict(self.models)
+        
+        def worker():
+            try:
+                engines = {config['name']: self.model_cache.get(config['path'], config['labels'])
+                           for config in models.values()}
+                if mode == 'cascade':
+                    # 创建时测量各模型的推理耗时，按从快到慢排列
+                    fanout = CascadeClassifier(engines, CASCADE_THRESHOLD, CASCADE_MARGIN)
+                else:
+                    fanout = MultiModelClassifier(engines)
+                error = None
+            except Exception as e:
+                fanout, error = None, e
+            self.root.after(0, self.on_fanout_ready, mode, fanout, error)
+        
+        threading.Thread(target=worker, name="fanout-loader", daemon=True).start()
+    
+    def replace_fanout(self, fanout):
+        """替换（或关闭）多模型分类器，并关闭原来的分类器释放其线程池"""
+        old = self.fanout
+        self.fanout = fanout
+        if self.pipeline is not None:
+            self.pipeline.fanout = fanout
+        if old is not None and old is not fanout:
+            old.close()
+    
+    def on_fanout_ready(self, mode, fanout, error):
+        """所有模型加载完成后在主线程中启用多模型模式"""
+        mode_var = self.cascade_var if mode == 'cascade' else self.fanout_var
+        if error is not None:
+            error_msg = f"加载多模型失败: {error}"
+            print(error_msg)
+            self.status_var.set(error_msg)
+            mode_var.set(False)
+            return
+        if not mode_var.get():
+            # 加载期间已经取消
+            fanout.close()
+            return
+        
+        self.replace_fanout(fanout)
+        if mode == 'cascade':
+            self.status_var.set(f"已启用模型级联: {' → '.join(fanout.stage_names)}")
+        else:
+            self.status_var.set(f"已启用多模型并行: {len(fanout.engines)} 个模型")
     
     def refresh_models(self):
         """刷新模型列表"""
@@ -344,12 +613,16 @@ class RealTimeImageClassifier:
                 # 更新当前模型信息
                 if self.current_model not in self.models:
                     self.current_model = model_keys[0] if model_keys else 'default'
-                    self.labels = self.models[self.current_model]['labels'] if self.current_model in self.models else ['未知']
+                    if self.engine is not None:
+                        self.engine.labels = self.models[self.current_model]['labels'] if self.current_model in self.models else ['未知']
                 
                 # 更新显示
                 self.model_info_label.config(text=f"当前模型: {self.models[self.current_model]['name']}")
                 self.status_var.set("模型列表已刷新")
                 
+                # 预加载新增或已修改的模型
+                self.model_cache.preload(self.models.values())
+                
                 print("模型列表刷新成功")
             else:
                 self.status_var.set("未找到任何模型文件")
@@ -367,6 +640,9 @@ class RealTimeImageClassifier:
         
         # 确认是否真的要关闭
         if tk.messagebox.askokcancel("退出", "确定要退出应用程序吗？"):
+            if self.metrics_server is not None:
+                self.metrics_server.close()
+            self.model_cache.close()
             self.root.destroy()
         
     def start_capture(self):
@@ -379,12 +655,71 @@ class RealTimeImageClassifier:
         self.result_text.delete(1.0, tk.END)
         self.result_text.insert(tk.END, "正在捕获，请稍候...")
         
-        # 启动捕获线程
-        self.capture_thread = threading.Thread(target=self.capture_loop, daemon=True)
-        self.capture_thread.start()
+        # 启动捕获/预处理/推理/显示流水线，每次开始捕获重新统计
+        if self.metrics is not None:
+            self.metrics.reset()
+        if RECORD_PREDICTIONS:
+            try:
+                self.recorder = PredictionRecorder.create_session(RECORDINGS_DIR)
+                print(f"预测记录: {self.recorder.directory}")
+            except OSError as e:
+                print(f"无法创建预测记录: {e}")
+                self.recorder = None
+        source = self.frame_source
+        if FRAME_RECORDING_FILE:
+            try:
+                self.frame_writer = FrameRingWriter(FRAME_RECORDING_FILE, FRAME_RECORDING_MB,
+                                                    codec=FRAME_RECORDING_CODEC)
+                source = RecordingFrameSource(self.frame_source, self.frame_writer)
+                print(f"帧录制: {FRAME_RECORDING_FILE}")
+            except (OSError, ValueError) as e:
+                print(f"无法创建帧录制文件: {e}")
+                self.frame_writer = None
+        if EXECUTION_MODE == "processes":
+            if self.fanout is not None:
+                print("多进程模式只使用当前模型，多模型并行和级联已忽略")
+            # 每个共享内存槽位按全屏4通道图像的大小分配
+            frame_bytes = self.root.winfo_screenwidth() * self.root.winfo_screenheight() * 4
+            self.pipeline = ProcessPipeline(self.engine.model_path, self.engine.labels,
+                                            create_screen_source, (CAPTURE_BACKEND,), frame_bytes,
+                                            on_result=self.on_pipeline_result,
+                                            on_error=self.on_pipeline_error,
+                                            scheduler_args=(TARGET_FPS, MIN_FPS, CPU_BUDGET, IDLE_AFTER, IDLE_FPS),
+                                            change_detection=(CHANGE_THRESHOLD, CHANGE_REFRESH_INTERVAL),
+                                            tile_overlap=TILE_OVERLAP,
+                                            metrics=self.metrics,
+                                            recorder=self.recorder,
+                                            frame_writer=self.frame_writer)
+        else:
+            self.pipeline = FramePipeline(self.engine, source,
+                                          on_result=self.on_pipeline_result,
+                                          on_error=self.on_pipeline_error,
+                                          scheduler=FrameScheduler(TARGET_FPS, MIN_FPS, CPU_BUDGET,
+                                                                   IDLE_AFTER, IDLE_FPS),
+                                          change_detector=ChangeDetector(CHANGE_THRESHOLD, CHANGE_REFRESH_INTERVAL),
+                                          tile_overlap=TILE_OVERLAP,
+                                          fanout=self.fanout,
+                                          metrics=self.metrics,
+                                          recorder=self.recorder)
+        
+        # 同步捕获区域和分块设置
+        self.update_capture_area()
+        self.pipeline.start()
         
     def stop_capture(self):
         self.is_running = False
+        if self.pipeline is not None:
+            # 不在主线程中等待工作线程，避免与显示回调互相阻塞
+            self.pipeline.stop(wait=False)
+            self.pipeline = None
+        if self.recorder is not None:
+            # 在后台写入剩余记录，磁盘较慢时也不阻塞界面；非守护线程保证退出前写完
+            threading.Thread(target=self.recorder.close, name="recorder-close").start()
+            self.recorder = None
+        if self.frame_writer is not None:
+            # 捕获线程可能正在写入最后一帧，close 会等它写完；之后的写入直接忽略
+            self.frame_writer.close()
+            self.frame_writer = None
         self.start_btn.config(state="normal")
         self.stop_btn.config(state="disabled")
         self.status_var.set("已停止")
@@ -392,125 +727,129 @@ class RealTimeImageClassifier:
         # 清除图像显示区域，确保状态栏可见
         self.clear_image_display()
         
-    def capture_loop(self):
-        error_count = 0
-        while self.is_running:
-            try:
-                # 捕获屏幕
-                if self.area_var.get() == "全屏":
-                    # 全屏捕获
-                    screenshot = ImageGrab.grab()
-                else:
-                    # 使用用户自定义的区域设置
-                    try:
-                        x = self.x_var.get()
-                        y = self.y_var.get()
-                        width = self.width_var.get()
-                        height = self.height_var.get()
-                        bbox = (x, y, x + width, y + height)  # (left, top, right, bottom)
-                        screenshot = ImageGrab.grab(bbox=bbox)
-                    except (ValueError, tk.TclError):
-                        # 如果自定义区域值无效，回退到全屏捕获
-                        screenshot = ImageGrab.grab()
-                
-                # 转换为numpy数组
-                img = np.array(screenshot)
-                img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-                
-                # 预处理图像
-                processed_img = self.preprocess_image(img)
-                
-                # 进行推理
-                prediction = self.classify_image(processed_img)
-                
-                # 更新GUI（在主线程中）
-                self.root.after(0, self.update_gui, img, prediction)
-                
-                # 重置错误计数
-                error_count = 0
-                
-                # 控制帧率
-                time.sleep(0.1)  # 10 FPS
-                
-            except Exception as e:
-                error_count += 1
-                print(f"捕获错误 #{error_count}: {e}")
-                
-                # 如果连续错误超过5次，尝试恢复
-                if error_count >= 5:
-                    print("连续错误过多，尝试恢复...")
-                    self.root.after(0, lambda: self.status_var.set(f"捕获错误，正在恢复... (错误#{error_count})"))
-                    time.sleep(2)
-                    error_count = 0
-                else:
-                    time.sleep(1)
+    def make_thumbnail(self, frame):
+        """在显示线程中把帧缩放为预览图并转换为RGB的PIL图像"""
+        resized = resize_into(frame.image, self._thumb_resized)
+        if frame.channel_order == "BGR":
+            resized = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=self._thumb_rgb)
+        # PIL会复制像素数据，缓冲区可以立即复用
+        return Image.fromarray(resized)
     
-    def preprocess_image(self, image):
-        # 调整图像大小以匹配模型输入
-        target_size = (self.input_shape[1], self.input_shape[2])
-        resized = cv2.resize(image, target_size)
-        
-        # 标准化
-        normalized = resized.astype(np.float32) / 255.0
-        
-        # 添加batch维度
-        batched = np.expand_dims(normalized, axis=0)
-        
-        return batched
+    def on_pipeline_result(self, frame, prediction):
+        """流水线显示阶段回调（在工作线程中调用）"""
+        # 在工作线程中生成预览图，不把全分辨率帧交给主线程
+        thumbnail = self.make_thumbnail(frame)
+        with self._gui_lock:
+            self._pending_update = (thumbnail, prediction)
+            if self._update_scheduled:
+                # 主线程还没处理上一次更新，直接用最新一帧替换
+                self.coalesced_updates += 1
+                return
+            self._update_scheduled = True
+        # 更新GUI（在主线程中）
+        self.root.after(0, self.flush_gui_update)
     
-    def classify_image(self, image):
+    def flush_gui_update(self):
+        """在主线程中应用最新的一次界面更新"""
+        with self._gui_lock:
+            pending = self._pending_update
+            self._pending_update = None
+            self._update_scheduled = False
+        if pending is not None and self.is_running:
+            self.update_gui(*pending)
+    
+    def on_pipeline_error(self, stage, error, error_count):
+        """流水线阶段出错时调用（在工作线程中调用）"""
+        # 如果连续错误超过5次，提示正在恢复
+        if error_count >= 5:
+            print("连续错误过多，尝试恢复...")
+            self.root.after(0, lambda: self.status_var.set(f"捕获错误，正在恢复... (错误#{error_count})"))
+    
+    def render_metrics(self):
+        """指标端点回调（在HTTP线程中调用）"""
+        pipeline = self.pipeline
+        if pipeline is not None:
+            return pipeline.prometheus_text()
+        return self.metrics.to_prometheus()
+    
+    def export_metrics(self):
+        """把当前性能统计写入JSON文件"""
+        path = time.strftime("metrics_%Y%m%d_%H%M%S.json")
         try:
-            # 设置输入张量
-            self.interpreter.set_tensor(self.input_details[0]['index'], image)
-            
-            # 运行推理
-            self.interpreter.invoke()
-            
-            # 获取输出
-            output_data = self.interpreter.get_tensor(self.output_details[0]['index'])
-            
-            # 获取top-3预测结果
-            top_indices = np.argsort(output_data[0])[-3:][::-1]
-            predictions = []
-            
-            for idx in top_indices:
-                confidence = float(output_data[0][idx])
-                label = self.labels[idx] if idx < len(self.labels) else f"类别{idx}"
-                predictions.append((label, confidence))
-            
-            return predictions
-            
+            pipeline = self.pipeline
+            extra = {'pipeline': pipeline.get_stats()} if pipeline is not None else None
+            self.metrics.write_json(path, extra)
+            self.status_var.set(f"统计已导出: {path}")
         except Exception as e:
-            print(f"推理错误: {e}")
-            return [("错误", 0.0)]
+            error_msg = f"导出统计失败: {e}"
+            print(error_msg)
+            self.status_var.set(error_msg)
     
-    def update_gui(self, image, prediction):
+    def update_gui(self, thumbnail, prediction):
+        gui_start = time.perf_counter()
         try:
-            # 更新图像显示
-            # 调整图像大小以适应显示
-            display_img = cv2.resize(image, (400, 300))
-            display_img = cv2.cvtColor(display_img, cv2.COLOR_BGR2RGB)
-            
-            # 转换为PIL图像
-            pil_img = Image.fromarray(display_img)
-            photo = ImageTk.PhotoImage(pil_img)
-            
-            # 更新标签
-            self.image_label.configure(image=photo, text="")
-            self.image_label.image = photo  # 保持引用
+            # 原地更新预览图
+            self.photo.paste(thumbnail)
+            self.image_label.configure(image=self.photo, text="")
             
             # 更新分类结果
             self.result_text.delete(1.0, tk.END)
             timestamp = time.strftime("%H:%M:%S")
             result_str = f"[{timestamp}] 分类结果:\n\n"
             
+            # 多模型模式：按模型分别显示
+            if isinstance(prediction, dict) and 'models' in prediction:
+                for name, model_prediction in prediction['models'].items():
+                    elapsed_ms = prediction['timings'][name] * 1000
+                    result_str += f"{name} ({elapsed_ms:.1f}ms):\n"
+                    for i, (label, confidence) in enumerate(model_prediction):
+                        result_str += f"  {i+1}. {label}: {confidence:.2%}\n"
+                prediction = []
+            
+            # 级联模式：显示给出结果的模型，再按单模型方式显示预测
+            if isinstance(prediction, dict) and 'stage' in prediction:
+                result_str += (f"级联: {prediction['stage']} (第{prediction['level'] + 1}级, "
+                               f"{prediction['elapsed'] * 1000:.1f}ms)\n\n")
+                prediction = prediction['predictions']
+            
+            # 多区域模式：按区域分别显示
+            if isinstance(prediction, dict) and 'regions' in prediction:
+                for region in prediction['regions']:
+                    result_str += f"{region['name']}:\n"
+                    for i, (label, confidence) in enumerate(region['predictions']):
+                        result_str += f"  {i+1}. {label}: {confidence:.2%}\n"
+                prediction = []
+            
+            # 分块模式：先显示汇总结果，再显示每块的top-1
+            tiles = []
+            if isinstance(prediction, dict):
+                tiles = prediction['tiles']
+                prediction = prediction['aggregate']
+            
             for i, (label, confidence) in enumerate(prediction):
                 result_str += f"{i+1}. {label}: {confidence:.2%}\n"
             
+            if tiles:
+                result_str += "\n各分块:\n"
+                for i, tile in enumerate(tiles):
+                    label, confidence = tile['predictions'][0]
+                    result_str += f"  块{i+1} {tile['box']}: {label} {confidence:.2%}\n"
+            
             self.result_text.insert(tk.END, result_str)
             
-            # 更新状态
-            self.status_var.set(f"最后更新: {timestamp}")
+            # 更新状态，附带各阶段队列深度和丢帧数
+            status = f"最后更新: {timestamp}"
+            if self.pipeline is not None:
+                status += f" | {self.pipeline.format_stats()}"
+            if isinstance(self.fanout, CascadeClassifier):
+                status += f" | {self.fanout.format_stats()}"
+            self.status_var.set(status)
+            
+            if self.metrics is not None:
+                # 记录界面更新本身的耗时（在Tk主线程中执行）
+                gui_end = time.perf_counter()
+                self.metrics.observe('gui', gui_end - gui_start, gui_end)
+                self.metrics_var.set(f"{self.metrics.format_summary()} | 合并更新 {self.coalesced_updates}")
             
         except Exception as e:
             print(f"GUI更新错误: {e}")
@@ -520,7 +859,6 @@ class RealTimeImageClassifier:
         try:
             # 清除图像显示
             self.image_label.configure(image="", text="等待开始捕获...")
-            self.image_label.image = None
             
             # 清除分类结果
             self.result_text.delete(1.0, tk.END)
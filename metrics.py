@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能指标
+记录流水线各阶段的耗时直方图和实际帧率，可生成简短摘要、JSON快照，
+或通过本地HTTP端点以Prometheus文本格式导出；未启用时流水线不做任何计时
+"""
+
+import bisect
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 直方图桶的上界（秒），覆盖 0.5ms ~ 2.5s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class LatencyHistogram:
+    """固定分桶的耗时直方图；每个直方图只由一个阶段线程写入，因此不加锁"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # 最后一个桶记录超过最大上界的样本
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """按桶内线性插值估算分位数（秒）"""
+        if self.count == 0:
+            return 0.0
+        target = q / 100.0 * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            if n and cumulative + n >= target:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                estimate = lower + (upper - lower) * (target - cumulative) / n
+                return min(estimate, self.max)
+            cumulative += n
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class RateMeter:
+    """最近 window 秒内的事件速率"""
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self._times = collections.deque()
+
+    def mark(self, now):
+        self._times.append(now)
+        cutoff = now - self.window
+        while self._times[0] < cutoff:
+            self._times.popleft()
+
+    def rate(self, now=None):
+        now = time.perf_counter() if now is None else now
+        recent = [t for t in list(self._times) if t >= now - self.window]
+        if len(recent) < 2 or recent[-1] <= recent[0]:
+            return 0.0
+        return (len(recent) - 1) / (recent[-1] - recent[0])
+
+
+class PipelineMetrics:
+    """按阶段名称记录耗时直方图和速率"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, rate_window=5.0):
+        self.buckets = buckets
+        self.rate_window = rate_window
+        # 阶段名称 -> (LatencyHistogram, RateMeter)
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def _get(self, stage):
+        entry = self._stages.get(stage)
+        if entry is None:
+            with self._lock:
+                entry = self._stages.setdefault(
+                    stage, (LatencyHistogram(self.buckets), RateMeter(self.rate_window)))
+        return entry
+
+    def observe(self, stage, seconds, now=None):
+        """记录阶段 stage 处理一个元素用时 seconds 秒"""
+        histogram, rate = self._get(stage)
+        histogram.observe(seconds)
+        rate.mark(time.perf_counter() if now is None else now)
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+    def _items(self):
+        with self._lock:
+            return list(self._stages.items())
+
+    def snapshot(self):
+        """返回 {阶段: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms, rate}}"""
+        now = time.perf_counter()
+        stages = {}
+        for stage, (histogram, rate) in self._items():
+            stages[stage] = histogram.snapshot()
+            stages[stage]['rate'] = rate.rate(now)
+        return stages
+
+    def format_summary(self, rate_stage="inference"):
+        """生成一行摘要：rate_stage 阶段的实际帧率和各阶段 p50/p95 耗时"""
+        snapshot = self.snapshot()
+        parts = []
+        if rate_stage in snapshot:
+            parts.append(f"实际 {snapshot[rate_stage]['rate']:.1f} FPS")
+        for stage, stats in snapshot.items():
+            parts.append(f"{stage} {stats['p50_ms']:.1f}/{stats['p95_ms']:.1f}ms")
+        return " | ".join(parts)
+
+    def to_prometheus(self, prefix="classifier", gauges=None):
+        """
+        生成Prometheus文本格式；gauges 为额外的 {(指标名, 阶段): 数值}，
+        例如队列深度和丢帧数
+        """
+        items = self._items()
+        now = time.perf_counter()
+        name = f"{prefix}_stage_seconds"
+        lines = [f"# HELP {name} 流水线各阶段的处理耗时", f"# TYPE {name} histogram"]
+        for stage, (histogram, _) in items:
+            cumulative = 0
+            for bound, n in zip(histogram.buckets, histogram.counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+        rate_name = f"{prefix}_stage_rate"
+        lines += [f"# HELP {rate_name} 最近一段时间内各阶段每秒处理的数量", f"# TYPE {rate_name} gauge"]
+        for stage, (_, rate) in items:
+            lines.append(f'{rate_name}{{stage="{stage}"}} {rate.rate(now)}')
+
+        by_metric = collections.defaultdict(list)
+        for (metric, stage), value in (gauges or {}).items():
+            by_metric[metric].append((stage, value))
+        for metric, values in by_metric.items():
+            lines.append(f"# TYPE {prefix}_{metric} gauge")
+            for stage, value in values:
+                lines.append(f'{prefix}_{metric}{{stage="{stage}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path, extra=None):
+        """把当前快照写入JSON文件"""
+        data = {'time': time.time(), 'stages': self.snapshot()}
+        if extra:
+            data.update(extra)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+class MetricsServer:
+    """
+    在本地端口提供 /metrics（Prometheus文本）和 /metrics.json；
+    render 为返回文本的函数，json_render 为返回字典的函数
+    """
+
+    def __init__(self, render, json_render=None, host="127.0.0.1", port=9108):
+        self.render = render
+        self.json_render = json_render
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = server.render(), "text/plain; version=0.0.4; charset=utf-8"
+                elif self.path == "/metrics.json" and server.json_render is not None:
+                    body = json.dumps(server.json_render(), ensure_ascii=False)
+                    content_type = "application/json; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
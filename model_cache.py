@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型缓存
+缓存已经 allocate_tensors() 的分类引擎，按 模型路径 + 修改时间 索引，
+超出数量或内存预算时按最近最少使用（LRU）淘汰，并支持在后台预加载；
+低内存模式（idle_timeout）下后台释放一段时间未使用的引擎的解释器，下次使用时再重新创建
+"""
+
+import collections
+import os
+import threading
+
+import numpy as np
+
+import model_memory
+from classifier_engine import ClassifierEngine, get_model_runtime_config
+
+
+def estimate_engine_bytes(engine):
+    """估算一个引擎占用的内存：模型文件大小 + 所有张量的大小"""
+    total = os.path.getsize(engine.model_path)
+    for detail in engine.interpreter.get_tensor_details():
+        shape = detail['shape']
+        if len(shape) == 0:
+            continue
+        total += int(np.prod(shape)) * np.dtype(detail['dtype']).itemsize
+    return total
+
+
+class ModelCache:
+    """已加载模型的LRU缓存，线程安全"""
+
+    def __init__(self, max_models=4, max_bytes=None, top_k=3, num_threads=None, use_xnnpack=True,
+                 idle_timeout=None, model_loading=None):
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.top_k = top_k
+        # None 表示每个模型使用自己的运行参数（get_runtime_config 中的 num_threads）
+        self.num_threads = num_threads
+        self.use_xnnpack = use_xnnpack
+        self.idle_timeout = idle_timeout
+        self.model_loading = model_loading
+
+        # key -> (engine, 估算字节数)，按使用时间从旧到新排列
+        self._entries = collections.OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._preload_thread = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.releases = 0
+
+        self._stop_event = threading.Event()
+        self._reaper_thread = None
+        if idle_timeout is not None:
+            self._reaper_thread = threading.Thread(target=self._reap_idle, name="model-reaper", daemon=True)
+            self._reaper_thread.start()
+
+    @staticmethod
+    def make_key(model_path):
+        path = os.path.abspath(model_path)
+        return path, os.path.getmtime(path)
+
+    def get(self, model_path, labels=None):
+        """返回模型对应的引擎，未缓存时在当前线程中加载"""
+        key = self.make_key(model_path)
+
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    engine = entry[0]
+                    break
+                event = self._loading.get(key)
+                if event is None:
+                    # 由当前线程负责加载
+                    self.misses += 1
+                    event = self._loading[key] = threading.Event()
+                    owner = True
+                else:
+                    owner = False
+
+            if not owner:
+                # 其他线程（例如后台预加载）正在加载同一模型，等待其完成后重新查找
+                event.wait()
+                continue
+
+            try:
+                num_threads = self.num_threads or get_model_runtime_config(model_path)['num_threads']
+                engine = ClassifierEngine(model_path, labels, top_k=self.top_k,
+                                          num_threads=num_threads, use_xnnpack=self.use_xnnpack,
+                                          model_loading=self.model_loading)
+                self._store(key, engine)
+            finally:
+                with self._lock:
+                    del self._loading[key]
+                event.set()
+            break
+
+        if labels is not None:
+            engine.labels = labels
+        return engine
+
+    def get_async(self, model_path, labels=None, callback=None):
+        """在后台线程中获取引擎，完成后调用 callback(engine, error)"""
+        def worker():
+            try:
+                engine = self.get(model_path, labels)
+            except Exception as e:
+                if callback is not None:
+                    callback(None, e)
+                return
+            if callback is not None:
+                callback(engine, None)
+
+        thread = threading.Thread(target=worker, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def contains(self, model_path):
+        try:
+            key = self.make_key(model_path)
+        except OSError:
+            return False
+        with self._lock:
+            return key in self._entries
+
+    def preload(self, model_configs):
+        """在后台依次加载 auto_discover_models 返回的模型，最多加载到缓存容量"""
+        configs = list(model_configs)[:self.max_models]
+
+        def worker():
+            for config in configs:
+                try:
+                    self.get(config['path'], config.get('labels'))
+                    print(f"已预加载模型: {config.get('name', config['path'])}")
+                except Exception as e:
+                    print(f"预加载模型失败 {config['path']}: {e}")
+
+        self._preload_thread = threading.Thread(target=worker, name="model-preload", daemon=True)
+        self._preload_thread.start()
+        return self._preload_thread
+
+    def _store(self, key, engine):
+        size = estimate_engine_bytes(engine)
+        with self._lock:
+            # 同一路径的旧版本（文件已修改）直接移除
+            for old_key in [k for k in self._entries if k[0] == key[0] and k != key]:
+                del self._entries[old_key]
+            self._entries[key] = (engine, size)
+            self._evict()
+
+    def _evict(self):
+        """淘汰最久未使用的模型，至少保留最新的一个"""
+        while len(self._entries) > 1 and (
+                len(self._entries) > self.max_models or
+                (self.max_bytes is not None and self.total_bytes() > self.max_bytes)):
+            key, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            print(f"模型缓存已淘汰: {os.path.basename(key[0])}")
+
+    def _reap_idle(self):
+        """低内存模式：定期释放超过 idle_timeout 秒未使用的引擎的解释器（引擎本身仍留在缓存中）"""
+        interval = max(0.5, min(self.idle_timeout / 2, 30.0))
+        while not self._stop_event.wait(interval):
+            with self._lock:
+                engines = [entry[0] for entry in self._entries.values()]
+            for engine in engines:
+                if engine.release(self.idle_timeout):
+                    with self._lock:
+                        self.releases += 1
+                    print(f"已释放空闲模型解释器: {os.path.basename(engine.model_path)}")
+
+    def total_bytes(self):
+        return sum(size for _, size in self._entries.values())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        """停止后台释放线程"""
+        self._stop_event.set()
+
+    def get_stats(self):
+        memory = model_memory.process_memory()
+        with self._lock:
+            return {
+                'models': len(self._entries),
+                'released': sum(1 for engine, _ in self._entries.values() if engine.is_released),
+                'releases': self.releases,
+                'idle_timeout': self.idle_timeout,
+                'rss': memory['rss'],
+                'pss': memory['pss'],
+                'max_models': self.max_models,
+                'bytes': self.total_bytes(),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
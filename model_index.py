@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型索引
+把模型目录中每个 .tflite 文件的输入输出签名、量化参数、类别数量和标签保存在磁盘上的索引文件中，
+按 路径 + 大小 + 修改时间 判断文件是否变化，刷新时只检查新增或修改过的模型；
+内容哈希用于识别只是修改时间变化（例如重新复制）的文件
+"""
+
+import hashlib
+import json
+import os
+import zipfile
+
+INDEX_FILENAME = ".model_index.json"
+INDEX_VERSION = 1
+
+# 标签旁路文件：与模型同名的文本文件，每行一个标签
+LABEL_SIDECAR_SUFFIXES = ("_labels.txt", ".labels.txt", ".labels", ".txt")
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _parse_labels(text):
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def read_embedded_labels(path):
+    """
+    读取TFLite元数据中附带的标签文件：带元数据的模型同时是一个zip文件，
+    附带文件（例如 labels.txt）存放在其中
+    """
+    try:
+        if not zipfile.is_zipfile(path):
+            return None, None
+        with zipfile.ZipFile(path) as archive:
+            names = [name for name in archive.namelist() if name.lower().endswith(".txt")]
+            # 优先使用文件名中带 label 的附带文件
+            names.sort(key=lambda name: "label" not in name.lower())
+            for name in names:
+                labels = _parse_labels(archive.read(name).decode("utf-8", errors="replace"))
+                if labels:
+                    return labels, name
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"读取模型元数据失败 {path}: {e}")
+    return None, None
+
+
+def find_label_sidecar(path):
+    """返回与模型同名的标签文件路径，没有时返回 None"""
+    stem = os.path.splitext(path)[0]
+    for suffix in LABEL_SIDECAR_SUFFIXES:
+        candidate = stem + suffix
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def describe_tensor(detail):
+    """把解释器的张量信息转换为可以写入JSON的字典"""
+    scale, zero_point = detail.get('quantization', (0.0, 0))
+    return {
+        'name': detail['name'],
+        'shape': [int(v) for v in detail['shape']],
+        'dtype': detail['dtype'].__name__,
+        'quantization': [float(scale), int(zero_point)] if scale else None,
+    }
+
+
+def inspect_model(path):
+    """读取模型的输入输出签名（只解析模型，不分配张量）"""
+    import tflite_backend
+
+    interpreter = tflite_backend.create_interpreter(path)
+    inputs = [describe_tensor(detail) for detail in interpreter.get_input_details()]
+    outputs = [describe_tensor(detail) for detail in interpreter.get_output_details()]
+    return {
+        'inputs': inputs,
+        'outputs': outputs,
+        'quantized': any(tensor['quantization'] is not None for tensor in inputs + outputs),
+        'num_classes': outputs[0]['shape'][-1] if outputs else None,
+    }
+
+
+class ModelIndex:
+    """模型目录的持久化索引"""
+
+    def __init__(self, model_dir, index_path=None):
+        self.model_dir = model_dir
+        self.index_path = index_path or os.path.join(model_dir, INDEX_FILENAME)
+        self.entries = {}
+        self.last_refresh = {'reused': 0, 'rehashed': 0, 'inspected': 0, 'removed': 0}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"模型索引无法读取，将重新建立: {e}")
+            return
+        if data.get('version') == INDEX_VERSION:
+            self.entries = data.get('models', {})
+
+    def save(self):
+        """原子地写入索引文件；模型目录不可写时只打印提示"""
+        data = {'version': INDEX_VERSION, 'models': self.entries}
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"模型索引无法保存: {e}")
+
+    def _update_labels(self, entry, path):
+        """标签优先来自模型元数据，其次是同名标签文件；标签文件变化时重新读取"""
+        if entry.get('labels_source') == "metadata":
+            return
+        sidecar = find_label_sidecar(path)
+        sidecar_mtime = os.stat(sidecar).st_mtime_ns if sidecar else None
+        if sidecar == entry.get('labels_file') and sidecar_mtime == entry.get('labels_mtime'):
+            return
+        entry['labels_file'] = sidecar
+        entry['labels_mtime'] = sidecar_mtime
+        entry['labels'] = None
+        entry['labels_source'] = None
+        if sidecar:
+            try:
+                with open(sidecar, "r", encoding="utf-8") as f:
+                    entry['labels'] = _parse_labels(f.read())
+                entry['labels_source'] = "sidecar"
+            except OSError as e:
+                print(f"读取标签文件失败 {sidecar}: {e}")
+
+    def _build_entry(self, path, stat, digest):
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        try:
+            entry.update(inspect_model(path))
+        except Exception as e:
+            entry['error'] = str(e)
+            print(f"无法解析模型 {path}: {e}")
+        labels, labels_file = read_embedded_labels(path)
+        if labels:
+            entry.update({'labels': labels, 'labels_source': "metadata", 'labels_file': labels_file})
+        return entry
+
+    def refresh(self):
+        """扫描模型目录，只检查新增或修改过的文件，返回 {绝对路径: 索引项}"""
+        stats = dict.fromkeys(self.last_refresh, 0)
+        entries = {}
+        by_hash = {entry['sha256']: entry for entry in self.entries.values() if 'sha256' in entry}
+
+        with os.scandir(self.model_dir) as scan:
+            files = sorted((entry.path, entry.stat()) for entry in scan
+                           if entry.is_file() and entry.name.lower().endswith(".tflite"))
+
+        for path, stat in files:
+            key = os.path.abspath(path)
+            entry = self.entries.get(key)
+            unchanged = (entry is not None and entry['size'] == stat.st_size and
+                         entry['mtime_ns'] == stat.st_mtime_ns)
+            if unchanged and 'error' not in entry:
+                stats['reused'] += 1
+            elif unchanged:
+                # 上次解析失败（例如当时缺少运行时），文件没有变化也重新解析
+                entry = self._build_entry(path, stat, entry.get('sha256') or file_hash(path))
+                stats['inspected'] += 1
+            else:
+                digest = file_hash(path)
+                cached = by_hash.get(digest)
+                if cached is not None and 'error' not in cached:
+                    # 内容没有变化（例如只是重新复制），沿用已解析的信息
+                    entry = dict(cached, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                    stats['rehashed'] += 1
+                else:
+                    entry = self._build_entry(path, stat, digest)
+                    stats['inspected'] += 1
+            entry = dict(entry)
+            self._update_labels(entry, path)
+            entries[key] = entry
+
+        stats['removed'] = len(set(self.entries) - set(entries))
+        changed = entries != self.entries
+        self.entries = entries
+        self.last_refresh = stats
+        if changed:
+            self.save()
+        return entries
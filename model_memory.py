@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型内存
+控制解释器加载模型的方式，并测量每个模型实际占用的内存，用于估算部署机器的内存需求
+
+两种加载方式（环境变量 MODEL_LOADING 或 ClassifierEngine 的 model_loading 参数）:
+  mmap     按路径加载（默认），运行时以只读方式映射模型文件；同一模型的所有解释器和所有进程
+           共用页缓存中的同一份数据（RSS会把每个映射重复计算一次，PSS/USS不会）
+  content  每个进程把模型文件读入一次，作为 model_content 交给该进程中这个模型的所有解释器；
+           不依赖文件映射，但每个进程各有一份私有副本
+
+解释器占用的主要部分是XNNPACK重新打包的权重（每个解释器一份，约等于模型大小）和张量内存，
+低内存模式（ModelCache 的 idle_timeout）会释放一段时间未使用的解释器，下次分类时再重新创建
+
+用法（内存报告，每个模型在独立的进程中测量）:
+  python model_memory.py model/ --interpreters 2
+  python model_memory.py model/model.tflite --no-xnnpack --report memory.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+LOAD_MMAP = "mmap"
+LOAD_CONTENT = "content"
+LOADING_MODES = (LOAD_MMAP, LOAD_CONTENT)
+
+MB = 1024 * 1024
+
+
+def default_loading():
+    """默认的模型加载方式：环境变量 MODEL_LOADING，未设置时为 mmap"""
+    mode = os.environ.get("MODEL_LOADING") or LOAD_MMAP
+    if mode not in LOADING_MODES:
+        raise ValueError(f"未知的模型加载方式: {mode}（可选: {', '.join(LOADING_MODES)}）")
+    return mode
+
+
+class ModelBuffer:
+    """一个模型文件的内容，由使用它的引擎持有；没有引擎引用时自动释放"""
+    __slots__ = ('path', 'data', '__weakref__')
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+
+
+_buffers = weakref.WeakValueDictionary()
+_buffers_lock = threading.Lock()
+
+
+def get_model_buffer(model_path):
+    """返回模型文件内容的共享缓冲区，同一进程中同一文件（路径、修改时间、大小都相同）只读取一次"""
+    path = os.path.abspath(model_path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _buffers_lock:
+        buffer = _buffers.get(key)
+        if buffer is None:
+            with open(path, "rb") as f:
+                buffer = ModelBuffer(path, f.read())
+            _buffers[key] = buffer
+        return buffer
+
+
+def shared_buffers():
+    """当前进程中仍被引用的模型缓冲区 {路径: 字节数}"""
+    with _buffers_lock:
+        return {key[0]: len(buffer.data) for key, buffer in _buffers.items()}
+
+
+def process_memory():
+    """
+    当前进程的内存占用（字节）: rss 常驻内存、pss 按共享进程数分摊后的内存、uss 本进程独占的内存；
+    Linux 下读取 /proc/self/smaps_rollup，其他平台使用 psutil（无法取得的项为 None）
+    """
+    memory = {'rss': None, 'pss': None, 'uss': None}
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[-1] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+        memory['rss'] = fields.get('Rss')
+        memory['pss'] = fields.get('Pss')
+        memory['uss'] = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+        return memory
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return memory
+    process = psutil.Process()
+    try:
+        info = process.memory_full_info()
+        memory['uss'] = getattr(info, 'uss', None)
+        memory['pss'] = getattr(info, 'pss', None)
+    except psutil.AccessDenied:
+        info = process.memory_info()
+    memory['rss'] = info.rss
+    return memory
+
+
+def _diff(after, before):
+    return {name: after[name] - before[name] if after[name] is not None and before[name] is not None else None
+            for name in after}
+
+
+def _load_engines(model_path, interpreters, num_threads, use_xnnpack, loading):
+    """为一个模型创建 interpreters 个引擎，各分类一次（XNNPACK在第一次推理前打包权重）"""
+    from classifier_engine import ClassifierEngine
+
+    engines = []
+    for _ in range(interpreters):
+        engine = ClassifierEngine(model_path, num_threads=num_threads, use_xnnpack=use_xnnpack,
+                                  model_loading=loading)
+        engine.classify_image(np.zeros(engine.resized_shape, dtype=np.uint8))
+        engines.append(engine)
+    return engines
+
+
+def measure_models(model_paths, interpreters=1, num_threads=None, use_xnnpack=True, loading=LOAD_MMAP):
+    """
+    在当前进程中加载一组模型并测量内存增量（应在新进程中调用，结果才不受之前加载的影响）；
+    返回运行时基线、加载后的增量，以及 release() 之后剩余的增量
+    """
+    import tflite_backend
+
+    # 先导入运行时，运行时本身的内存作为基线单独报告
+    tflite_backend.load_backend()
+    gc.collect()
+    start = process_memory()
+    engines = []
+    for path in model_paths:
+        engines.extend(_load_engines(path, interpreters, num_threads, use_xnnpack, loading))
+    loaded = process_memory()
+    for engine in engines:
+        engine.release()
+    gc.collect()
+    released = process_memory()
+    return {
+        'baseline': start,
+        'loaded': _diff(loaded, start),
+        'released': _diff(released, start),
+    }
+
+
+def _measure_worker(model_paths, interpreters, num_threads, use_xnnpack, loading):
+    try:
+        return measure_models(model_paths, interpreters, num_threads, use_xnnpack, loading)
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def _measure_isolated(model_paths, args):
+    """在新的子进程中测量，每次测量之间不共享已加载的运行时和模型"""
+    import multiprocessing
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(_measure_worker, model_paths, args.interpreters, args.threads,
+                               not args.no_xnnpack, args.loading).result()
+
+
+def find_models(target):
+    if os.path.isdir(target):
+        return sorted(os.path.join(target, name) for name in os.listdir(target) if name.endswith(".tflite"))
+    return [target]
+
+
+def _mb(value):
+    return f"{value / MB:.1f}" if value is not None else "-"
+
+
+def main():
+    """主函数：逐个模型报告内存占用，以及所有模型在同一进程中加载时的合计"""
+    parser = argparse.ArgumentParser(description="模型内存报告")
+    parser.add_argument("target", nargs="?", default="model", help="模型文件或模型目录")
+    parser.add_argument("--interpreters", type=int, default=1, help="每个模型创建的解释器数量（例如解释器池大小）")
+    parser.add_argument("--threads", type=int, default=None, help="每个解释器的线程数")
+    parser.add_argument("--no-xnnpack", action="store_true", help="禁用XNNPACK委托")
+    parser.add_argument("--loading", choices=LOADING_MODES, default=default_loading(), help="模型加载方式")
+    parser.add_argument("--report", default=None, help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    model_paths = find_models(args.target)
+    if not model_paths:
+        print(f"没有找到模型: {args.target}")
+        return 2
+
+    print(f"加载方式 {args.loading}, 每个模型 {args.interpreters} 个解释器, "
+          f"XNNPACK {'关闭' if args.no_xnnpack else '开启'}（每个模型在独立进程中测量，单位MB）")
+    print()
+    # 中文字符占两列，表头和合计行的宽度相应减小
+    print(f"{'模型':<26}{'文件':>6}{'RSS':>9}{'PSS':>9}{'USS':>9}{'释放后RSS':>8}")
+    results = {}
+    for path in model_paths:
+        result = _measure_isolated([path], args)
+        results[path] = result
+        name = os.path.basename(path)
+        if 'error' in result:
+            print(f"{name:<28}  错误: {result['error']}")
+            continue
+        loaded, released = result['loaded'], result['released']
+        print(f"{name:<28}{_mb(os.path.getsize(path)):>8}{_mb(loaded['rss']):>9}{_mb(loaded['pss']):>9}"
+              f"{_mb(loaded['uss']):>9}{_mb(released['rss']):>11}")
+
+    total = _measure_isolated(model_paths, args)
+    results['total'] = total
+    if 'error' in total:
+        print(f"{'合计':<26}  错误: {total['error']}")
+        return 1
+    loaded, released = total['loaded'], total['released']
+    size = sum(os.path.getsize(path) for path in model_paths)
+    print(f"{'合计（同一进程）':<20}{_mb(size):>8}{_mb(loaded['rss']):>9}{_mb(loaded['pss']):>9}"
+          f"{_mb(loaded['uss']):>9}{_mb(released['rss']):>11}")
+    baseline = total['baseline']
+    print()
+    print(f"运行时基线（导入TFLite运行时后）: RSS {_mb(baseline['rss'])}MB, PSS {_mb(baseline['pss'])}MB")
+    print("PSS/USS 更接近实际占用；mmap 方式下RSS会重复计算同一模型文件的每个映射")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({'loading': args.loading, 'interpreters': args.interpreters,
+                       'use_xnnpack': not args.no_xnnpack, 'models': results}, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入: {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
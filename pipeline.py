@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流水线模块
+捕获、预处理、推理、显示四个阶段各自运行在独立线程中，
+阶段之间通过有界队列连接，队列满时丢弃最旧的帧（最新帧优先）
+传入 metrics（PipelineMetrics）时记录各阶段耗时直方图，未传入时不做计时；
+传入 recorder（PredictionRecorder）时把每帧的结果和各阶段耗时交给记录器异步写入磁盘；
+捕获节奏由 FrameScheduler 按截止时间控制
+"""
+
+import collections
+import functools
+import os
+import threading
+import time
+
+import numpy as np
+
+from classifier_engine import BufferPool
+from metrics import PipelineMetrics
+from scheduler import FrameScheduler
+
+# 流水线结束标记
+_END = object()
+
+
+def _top_label(prediction):
+    """取出预测结果的top-1标签（多模型模式为各模型top-1组成的元组），用于判断结果是否稳定"""
+    if isinstance(prediction, dict) and 'models' in prediction:
+        return tuple(preds[0][0] if preds else None for preds in prediction['models'].values())
+    if isinstance(prediction, dict) and 'regions' in prediction:
+        # 多区域模式：各区域top-1组成的元组
+        return tuple(region['predictions'][0][0] if region['predictions'] else None
+                     for region in prediction['regions'])
+    if isinstance(prediction, dict) and 'stage' in prediction:
+        # 级联模式：最终给出结果的那一级的预测
+        prediction = prediction['predictions']
+        return prediction[0][0] if prediction else None
+    if isinstance(prediction, dict):
+        prediction = prediction['aggregate']
+    return prediction[0][0] if prediction else None
+
+
+class LatestQueue:
+    """有界队列，drop_stale 为 True 时满了丢弃最旧元素（并调用 on_drop(元素)），否则阻塞等待"""
+
+    def __init__(self, name, maxsize=1, drop_stale=True, on_drop=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.drop_stale = drop_stale
+        self.on_drop = on_drop
+        self.put_count = 0
+        self.dropped = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        dropped = None
+        with self._cond:
+            while not self.drop_stale and len(self._items) >= self.maxsize and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return False
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify_all()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+        return True
+
+    def get(self, timeout=None):
+        """取出最早的元素，超时或队列关闭时返回 None"""
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._items:
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        return {'depth': self.qsize(), 'maxsize': self.maxsize,
+                'put': self.put_count, 'dropped': self.dropped}
+
+
+class FramePipeline:
+    """
+    分阶段的分类流水线:
+      capture → [preprocess队列] → preprocess → [inference队列] → inference → [display队列] → display
+    on_result(frame, prediction) 在显示线程中调用
+    """
+
+    STAGES = ('capture', 'preprocess', 'inference', 'display')
+
+    def __init__(self, engine, source, on_result=None, on_error=None,
+                 capture_interval=0.0, queue_size=1, drop_stale=True, max_frames=None,
+                 change_detector=None, tile_grid=None, tile_overlap=0.1, fanout=None, metrics=None,
+                 scheduler=None, regions=None, recorder=None):
+        self.engine = engine
+        self.source = source
+        self.change_detector = change_detector
+        # 分块模式：tile_grid 为 (行, 列) 时整幅画面切块后一次批量推理
+        self.tile_grid = tile_grid
+        self.tile_overlap = tile_overlap
+        # 多区域模式：regions 为 [(名称, (x0, y0, x1, y1)), ...]（相对于帧的坐标），
+        # 各区域从同一帧中裁剪后一次批量推理，优先于分块模式
+        self.regions = regions
+        # 多模型模式：fanout 为 MultiModelClassifier（每帧分发给所有模型）
+        # 或 CascadeClassifier（按置信度逐级升级）时优先于分块模式
+        self.fanout = fanout
+        # 性能指标：为 None 时各阶段不调用计时
+        self.metrics = metrics
+        # 预测记录：不为 None 时每帧记录各阶段耗时，在显示阶段把结果交给记录器（只写入内存缓冲区）
+        self.recorder = recorder
+        self.last_prediction = None
+        # last_prediction 所对应的变化检测参考帧编号
+        self._prediction_reference = None
+        self.on_result = on_result
+        self.on_error = on_error
+        self.capture_interval = capture_interval
+        # 帧率调度：未指定调度器时按 capture_interval 换算为固定目标帧率
+        if scheduler is None and capture_interval > 0:
+            scheduler = FrameScheduler(1.0 / capture_interval)
+        self.scheduler = scheduler
+        self.max_frames = max_frames
+
+        self.queues = {
+            'preprocess': LatestQueue('preprocess', queue_size, drop_stale),
+            'inference': LatestQueue('inference', queue_size, drop_stale, on_drop=self._release_item),
+            'display': LatestQueue('display', queue_size, drop_stale),
+        }
+        # 预处理结果缓冲区：推理阶段读完或帧在推理队列中被丢弃后才归还，不会被正在推理的帧之外的写入覆盖
+        self._buffers = BufferPool(queue_size + 2)
+
+        self.processed = dict.fromkeys(self.STAGES, 0)
+        self.errors = dict.fromkeys(self.STAGES, 0)
+        # 画面未变化、复用上一次结果的帧数（不计入推理阶段的处理数和耗时）
+        self.reused = 0
+
+        self.is_running = False
+        self.threads = []
+        self.start_time = None
+        self.end_time = None
+
+    def start(self):
+        self.is_running = True
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        workers = (
+            ('capture', self._capture_stage),
+            ('preprocess', self._preprocess_stage),
+            ('inference', self._inference_stage),
+            ('display', self._display_stage),
+        )
+        if self.scheduler is not None:
+            self.scheduler.reset()
+        if hasattr(self.source, 'ensure_buffers'):
+            # 帧源复用图像缓冲区时（例如X11共享内存截图），缓冲区数量必须多于同时在途的帧数：
+            # 3个队列 + 3个处理阶段 + 正在捕获的一帧
+            self.source.ensure_buffers(3 * self.queues['preprocess'].maxsize + 4 + 1)
+        self.threads = [threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+                        for name, target in workers]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, wait=True, timeout=2.0):
+        """停止所有阶段；在Tk主线程中调用时应传 wait=False，避免与显示回调互相等待"""
+        self.is_running = False
+        if self.scheduler is not None:
+            self.scheduler.close()
+        for q in self.queues.values():
+            q.close()
+        if wait:
+            for thread in self.threads:
+                if thread is not threading.current_thread():
+                    thread.join(timeout)
+        if self.end_time is None:
+            self.end_time = time.perf_counter()
+
+    def set_engine(self, engine):
+        """运行中切换分类引擎，下一帧起生效"""
+        self.engine = engine
+
+    def wait(self):
+        """等待帧源读完且所有帧处理完毕"""
+        for thread in self.threads:
+            thread.join()
+        self.is_running = False
+
+    def _report_error(self, stage, error, error_count):
+        self.errors[stage] += 1
+        print(f"{stage}阶段错误 #{error_count}: {error}")
+        if self.on_error is not None:
+            self.on_error(stage, error, error_count)
+
+    def _capture_stage(self):
+        error_count = 0
+        out = self.queues['preprocess']
+        metrics = self.metrics
+        timed = metrics is not None or self.recorder is not None
+        scheduler = self.scheduler
+        while self.is_running:
+            try:
+                # 按截止时间等待下一帧，处理耗时已计入帧间隔
+                if scheduler is not None and not scheduler.wait():
+                    break
+                if not timed:
+                    frame = self.source.read()
+                else:
+                    start = time.perf_counter()
+                    frame = self.source.read()
+                    end = time.perf_counter()
+                    if metrics is not None:
+                        metrics.observe('capture', end - start, end)
+                    if frame is not None:
+                        frame.timings = {'capture': end - start}
+                if frame is None:
+                    break
+                out.put(frame)
+                self.processed['capture'] += 1
+
+                # 重置错误计数
+                error_count = 0
+
+                if self.max_frames is not None and self.processed['capture'] >= self.max_frames:
+                    break
+
+            except Exception as e:
+                error_count += 1
+                self._report_error('capture', e, error_count)
+
+                # 如果连续错误超过5次，等待更长时间再恢复
+                if error_count >= 5:
+                    time.sleep(2)
+                    error_count = 0
+                else:
+                    time.sleep(1)
+        out.put(_END)
+
+    def _run_stage(self, name, inq, outq, work, reuse=None):
+        """
+        通用阶段循环：从 inq 取出元素，处理后放入 outq；
+        reuse(item) 返回非 None 时直接使用该结果，这一帧只计入 self.reused，不计时也不计入本阶段的处理数
+        """
+        metrics = self.metrics
+        timed = metrics is not None or self.recorder is not None
+        while True:
+            item = inq.get()
+            if item is None or item is _END:
+                break
+            try:
+                result = reuse(item) if reuse is not None else None
+                if result is not None:
+                    self.reused += 1
+                    if outq is not None:
+                        outq.put(result)
+                    continue
+                if not timed:
+                    result = work(item)
+                else:
+                    start = time.perf_counter()
+                    result = work(item)
+                    end = time.perf_counter()
+                    if metrics is not None:
+                        metrics.observe(name, end - start, end)
+                    # 预处理阶段的元素是帧本身，之后的阶段为 (帧, ...)
+                    frame = item if name == 'preprocess' else item[0]
+                    if frame.timings is not None:
+                        frame.timings[name] = end - start
+                self.processed[name] += 1
+                if outq is not None:
+                    outq.put(result)
+            except Exception as e:
+                self._report_error(name, e, self.errors[name] + 1)
+        if outq is not None:
+            outq.put(_END)
+
+    @staticmethod
+    def _release_item(item):
+        """归还推理队列元素 (帧, 模式, 数据, 参考帧, 归还函数) 占用的预处理缓冲区"""
+        if isinstance(item, tuple) and item[4] is not None:
+            item[4]()
+
+    def _prepare(self, frame, engine, fanout, use_buffers=True):
+        """
+        按当前模式预处理一帧，返回 (模式, 数据, 归还函数)，模式为 single / regions / tiles / fanout；
+        归还函数在数据用完后调用，把缓冲区交还给缓冲区池（不使用缓冲区池时为 None）
+        """
+        if fanout is not None:
+            data = fanout.preprocess(frame.image)
+            return 'fanout', (fanout, data), functools.partial(fanout.release, data)
+        regions = self.regions
+        tile_grid = self.tile_grid
+        if regions:
+            shape = (len(regions),) + engine.resized_shape
+        elif tile_grid is not None:
+            shape = (tile_grid[0] * tile_grid[1],) + engine.resized_shape
+        else:
+            shape = engine.resized_shape
+        out = self._buffers.acquire(shape) if use_buffers else None
+        release = functools.partial(self._buffers.release, out) if out is not None else None
+        if regions:
+            boxes = [box for _, box in regions]
+            return 'regions', (regions, engine.preprocess_boxes(frame.image, boxes, out)), release
+        if tile_grid is not None:
+            return 'tiles', engine.preprocess_tiles(frame.image, tile_grid, self.tile_overlap, out=out), release
+        return 'single', engine.preprocess_image(frame.image, out=out), release
+
+    def _preprocess_stage(self):
+        """
+        预处理阶段输出 (帧, 模式, 数据, 参考帧, 归还函数)，模式为 skip / single / regions / tiles / fanout；
+        参考帧为变化检测的 check() 结果，推理阶段据此提交新的参考帧或确认可以复用；
+        归还函数在推理阶段读完数据（或帧在推理队列中被丢弃）后调用
+        """
+        def work(frame):
+            engine = self.engine
+            fanout = self.fanout
+            reference = None
+            if self.change_detector is not None:
+                key = id(fanout) if fanout is not None else id(engine)
+                changed, reference = self.change_detector.check(frame.image, key=key)
+                if not changed:
+                    # 画面与参考帧相比没有明显变化，跳过预处理，推理阶段确认后复用结果
+                    return frame, 'skip', None, reference, None
+            mode, data, release = self._prepare(frame, engine, fanout)
+            return frame, mode, data, reference, release
+        self._run_stage('preprocess', self.queues['preprocess'], self.queues['inference'], work)
+
+    def _inference_stage(self):
+        def reuse(item):
+            frame, mode, _, reference, _ = item
+            # 只复用由所匹配的参考帧分类得到的结果；参考帧之后又分类过别的画面时重新分类
+            if mode != 'skip' or self.last_prediction is None or reference != self._prediction_reference:
+                return None
+            if self.scheduler is not None:
+                self.scheduler.observe(_top_label(self.last_prediction))
+            return frame, self.last_prediction
+
+        def work(item):
+            frame, mode, input_data, reference, release = item
+            engine = self.engine
+            try:
+                if mode == 'skip':
+                    # 没有可复用的结果，按当前模式完整分类这一帧（不使用流水线的缓冲区池）
+                    mode, input_data, release = self._prepare(frame, engine, self.fanout, use_buffers=False)
+                if mode == 'fanout':
+                    fanout, resized = input_data
+                    self.last_prediction = fanout.classify(resized, frame.channel_order)
+                elif mode == 'regions':
+                    self.last_prediction = self._classify_regions(engine, frame, *input_data)
+                elif mode == 'tiles':
+                    self.last_prediction = self._classify_tiles(engine, frame, *input_data)
+                else:
+                    if input_data is None or input_data.shape != engine.resized_shape:
+                        # 预处理之后切换了模型，按新模型的输入尺寸重新缩放
+                        input_data = engine.preprocess_image(frame.image)
+                    self.last_prediction = engine.classify_image(input_data, frame.channel_order)
+            finally:
+                if release is not None:
+                    release()
+            if isinstance(reference, tuple):
+                # 这一帧已经分类，才把它设为变化检测的参考帧；在推理之前被丢弃的帧不会成为参考帧
+                reference = self.change_detector.commit(reference)
+            self._prediction_reference = reference
+            if self.scheduler is not None:
+                self.scheduler.observe(_top_label(self.last_prediction))
+            return frame, self.last_prediction
+        self._run_stage('inference', self.queues['inference'], self.queues['display'], work, reuse)
+
+    def _classify_regions(self, engine, frame, regions, batch):
+        """多区域批量推理，预处理之后切换了模型时重新裁剪缩放"""
+        if batch.shape[1:] != engine.resized_shape:
+            batch = engine.preprocess_boxes(frame.image, [box for _, box in regions])
+        scores = engine.classify_batch(batch, frame.channel_order)
+        return engine.summarize_regions(regions, scores)
+
+    def _classify_tiles(self, engine, frame, boxes, batch):
+        """分块批量推理，预处理之后切换了模型时重新切块缩放"""
+        if batch.shape[1:] != engine.resized_shape:
+            boxes, batch = engine.preprocess_tiles(frame.image, self.tile_grid or (1, 1), self.tile_overlap)
+        scores = engine.classify_batch(batch, frame.channel_order)
+        return engine.summarize_tiles(boxes, scores)
+
+    def _display_stage(self):
+        def work(item):
+            frame, prediction = item
+            if self.recorder is not None:
+                self.recorder.record(frame, prediction, os.path.basename(self.engine.model_path), frame.timings)
+            if self.is_running and self.on_result is not None:
+                self.on_result(frame, prediction)
+        self._run_stage('display', self.queues['display'], None, work)
+        self.end_time = time.perf_counter()
+
+    def get_stats(self):
+        """
+        返回各阶段的队列深度、丢帧数、处理帧数以及帧率：fps 为输出的帧数（包括复用结果的帧），
+        inference_fps 只计实际推理的帧
+        """
+        end = self.end_time or time.perf_counter()
+        elapsed = end - self.start_time if self.start_time else 0.0
+        stages = {}
+        for name in self.STAGES:
+            stage = {'processed': self.processed[name], 'errors': self.errors[name]}
+            if name in self.queues:
+                stage.update(self.queues[name].stats())
+            stages[name] = stage
+        stages['inference']['reused'] = self.reused
+        stats = {
+            'elapsed': elapsed,
+            'fps': self.processed['display'] / elapsed if elapsed > 0 else 0.0,
+            'inference_fps': self.processed['inference'] / elapsed if elapsed > 0 else 0.0,
+            'stages': stages,
+        }
+        if self.change_detector is not None:
+            stats['change_detection'] = self.change_detector.get_stats()
+        if self.metrics is not None:
+            stats['latency'] = self.metrics.snapshot()
+        if self.scheduler is not None:
+            stats['scheduler'] = self.scheduler.get_stats()
+        return stats
+
+    def prometheus_text(self, prefix="classifier"):
+        """以Prometheus文本格式导出耗时直方图、队列深度、处理数和丢帧数"""
+        gauges = {}
+        for name in self.STAGES:
+            gauges[('frames_processed', name)] = self.processed[name]
+            gauges[('errors', name)] = self.errors[name]
+            if name in self.queues:
+                queue_stats = self.queues[name].stats()
+                gauges[('queue_depth', name)] = queue_stats['depth']
+                gauges[('frames_dropped', name)] = queue_stats['dropped']
+        gauges[('frames_reused', 'inference')] = self.reused
+        metrics = self.metrics if self.metrics is not None else PipelineMetrics()
+        return metrics.to_prometheus(prefix, gauges)
+
+    def format_stats(self):
+        """生成一行简短的队列状态文本，便于在状态栏显示"""
+        stats = self.get_stats()
+        parts = [f"{stats['fps']:.1f} FPS"]
+        if self.scheduler is not None:
+            parts.append(self.scheduler.format_stats())
+        for name in ('preprocess', 'inference', 'display'):
+            stage = stats['stages'][name]
+            parts.append(f"{name} {stage['depth']}/{stage['maxsize']} 丢{stage['dropped']}")
+        if 'change_detection' in stats:
+            change = stats['change_detection']
+            parts.append(f"复用 {change['hits']}/{change['hits'] + change['misses']}")
+        return " | ".join(parts)
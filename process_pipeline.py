@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程流水线
+捕获和推理各自运行在独立的工作进程中，主进程（Tk界面）只接收很小的预测记录，
+Python层的截图转换、预处理和后处理不再与界面争用同一个GIL
+
+帧通过 multiprocessing.shared_memory 中的一组定长槽位传递，图像数组不经过pickle：
+  捕获进程   从空闲槽位队列取一个槽位 → 把帧复制进槽位 → 发送 (槽位, 帧信息)
+  推理进程   只处理最新的一帧（较旧的帧直接归还槽位）→ 预处理和分类 → 发送 (槽位, 预测结果, 各阶段耗时)
+  主进程     显示线程直接用槽位中的图像生成预览、调用 on_result，然后归还槽位
+接口与 FramePipeline 相同（start / stop / wait / set_engine / get_stats / format_stats），
+分类引擎在推理进程中按模型路径重新创建，多模型并行和级联只在线程流水线中支持
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from change_detector import ChangeDetector
+from classifier_engine import ClassifierEngine
+from metrics import PipelineMetrics
+from pipeline import _top_label
+from scheduler import FrameScheduler
+
+# 工作进程之间的结束标记
+_END = None
+
+# 捕获进程附带调度器统计的最短间隔（秒）
+STATS_INTERVAL = 0.5
+
+
+class _SharedFrame:
+    """主进程中交给 on_result 的帧：图像引用共享内存槽位，回调返回后槽位即被复用"""
+    __slots__ = ('image', 'index', 'timestamp', 'channel_order', 'source', 'timings')
+
+    def __init__(self, image, index, timestamp, channel_order, source, timings):
+        self.image = image
+        self.index = index
+        self.timestamp = timestamp
+        self.channel_order = channel_order
+        self.source = source
+        self.timings = timings
+
+
+def _slot_view(shm, slot, slot_bytes, shape):
+    """共享内存中某个槽位上的图像视图"""
+    return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+
+
+def _close_shm(shm):
+    try:
+        shm.close()
+    except BufferError:
+        # 还有视图引用槽位（例如回调保存了 frame.image），由垃圾回收释放映射
+        pass
+
+
+def _capture_worker(shm_name, slot_bytes, source_factory, source_args, scheduler_args, max_frames,
+                    free_slots, frames, results, control, stop_event):
+    """捕获进程：创建帧源，把每帧复制到空闲槽位后发送槽位编号和帧信息"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    source = None
+    scheduler = None
+    captured = 0
+    waited = 0
+    last_stats = 0.0
+    error_count = 0
+    try:
+        source = source_factory(*source_args)
+        if scheduler_args is not None:
+            scheduler = FrameScheduler(*scheduler_args)
+        while not stop_event.is_set():
+            # 处理主进程的控制消息：捕获区域变化、用于空闲模式的最新预测
+            while True:
+                try:
+                    command, value = control.get_nowait()
+                except queue.Empty:
+                    break
+                if command == 'bbox' and hasattr(source, 'set_bbox'):
+                    source.set_bbox(value)
+                elif command == 'observe' and scheduler is not None:
+                    scheduler.observe(value)
+            if scheduler is not None and not scheduler.wait():
+                break
+            try:
+                slot = free_slots.get(timeout=0.1)
+            except queue.Empty:
+                # 所有槽位都在使用中（推理或显示较慢），跳过这一帧
+                waited += 1
+                continue
+            try:
+                start = time.perf_counter()
+                frame = source.read()
+                if frame is None:
+                    free_slots.put(slot)
+                    break
+                image = frame.image
+                if image.nbytes > slot_bytes:
+                    raise ValueError(f"帧大小 {image.shape} 超过共享内存槽位 ({slot_bytes} 字节)")
+                np.copyto(_slot_view(shm, slot, slot_bytes, image.shape), image)
+                capture_time = time.perf_counter() - start
+            except Exception as e:
+                free_slots.put(slot)
+                error_count += 1
+                results.put(('error', 'capture', str(e), error_count))
+                time.sleep(2 if error_count >= 5 else 1)
+                if error_count >= 5:
+                    error_count = 0
+                continue
+            error_count = 0
+            captured += 1
+            stats = None
+            now = time.perf_counter()
+            if now - last_stats >= STATS_INTERVAL:
+                last_stats = now
+                stats = {'captured': captured, 'waited': waited,
+                         'scheduler': scheduler.get_stats() if scheduler is not None else None}
+            frames.put((slot, frame.index, frame.timestamp, image.shape, frame.channel_order, frame.source,
+                        capture_time, stats))
+            if max_frames is not None and captured >= max_frames:
+                break
+    except Exception as e:
+        results.put(('error', 'capture', str(e), 1))
+    finally:
+        frames.put(_END)
+        if source is not None:
+            source.close()
+        _close_shm(shm)
+
+
+def _inference_worker(shm_name, slot_bytes, model_path, labels, engine_args, settings, drop_stale,
+                      free_slots, frames, results, control, stop_event):
+    """推理进程：只处理最新的一帧，结果和各阶段耗时以小记录发回主进程，图像留在槽位中"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    engine = None
+    change_detector = None
+    last_prediction = None
+    dropped = 0
+    try:
+        engine = ClassifierEngine(model_path, labels, **engine_args)
+        if settings.get('change_detection') is not None:
+            change_detector = ChangeDetector(*settings['change_detection'])
+        results.put(('ready', os.getpid()))
+        ended = False
+        while not ended and not stop_event.is_set():
+            while True:
+                try:
+                    command, value = control.get_nowait()
+                except queue.Empty:
+                    break
+                if command == 'model':
+                    path, new_labels = value
+                    try:
+                        engine = ClassifierEngine(path, new_labels, **engine_args)
+                        last_prediction = None
+                    except Exception as e:
+                        # 新模型无法加载时报告错误，继续使用原来的模型
+                        results.put(('error', 'inference', f"切换模型失败 {path}: {e}", 1))
+                    # 告诉主进程实际使用的模型（切换失败时为原来的模型）
+                    results.put(('model', engine.model_path, engine.labels))
+                elif command == 'settings':
+                    settings.update(value)
+            try:
+                item = frames.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _END:
+                break
+            if drop_stale:
+                # 只保留最新的一帧，较旧的帧直接归还槽位
+                while True:
+                    try:
+                        newer = frames.get_nowait()
+                    except queue.Empty:
+                        break
+                    if newer is _END:
+                        ended = True
+                        break
+                    free_slots.put(item[0])
+                    dropped += 1
+                    item = newer
+
+            slot, index, timestamp, shape, channel_order, source, capture_time, capture_stats = item
+            try:
+                image = _slot_view(shm, slot, slot_bytes, shape)
+                timings = {'capture': capture_time}
+                start = time.perf_counter()
+                if change_detector is not None and last_prediction is not None and \
+                        not change_detector.should_classify(image, key=engine.model_path):
+                    prediction = last_prediction
+                    timings['preprocess'] = time.perf_counter() - start
+                else:
+                    prediction, preprocess_time = _classify(engine, image, channel_order, settings)
+                    timings['preprocess'] = preprocess_time
+                    timings['inference'] = time.perf_counter() - start - preprocess_time
+                    last_prediction = prediction
+                del image
+                results.put(('result', slot, index, timestamp, shape, channel_order, source, prediction, timings,
+                             {'dropped': dropped, 'capture': capture_stats}))
+            except Exception as e:
+                free_slots.put(slot)
+                results.put(('error', 'inference', str(e), 1))
+    except Exception as e:
+        results.put(('error', 'inference', str(e), 1))
+    finally:
+        results.put(('end',))
+        _close_shm(shm)
+
+
+def _classify(engine, image, channel_order, settings):
+    """按当前模式（多区域 / 分块 / 整帧）分类，返回 (预测结果, 预处理耗时)"""
+    start = time.perf_counter()
+    regions = settings.get('regions')
+    tile_grid = settings.get('tile_grid')
+    if regions:
+        batch = engine.preprocess_boxes(image, [box for _, box in regions])
+        preprocess_time = time.perf_counter() - start
+        return engine.summarize_regions(regions, engine.classify_batch(batch, channel_order)), preprocess_time
+    if tile_grid is not None:
+        boxes, batch = engine.preprocess_tiles(image, tile_grid, settings.get('tile_overlap', 0.1))
+        preprocess_time = time.perf_counter() - start
+        return engine.summarize_tiles(boxes, engine.classify_batch(batch, channel_order)), preprocess_time
+    resized = engine.preprocess_image(image)
+    preprocess_time = time.perf_counter() - start
+    return engine.classify_image(resized, channel_order), preprocess_time
+
+
+class ProcessPipeline:
+    """
+    多进程分类流水线:
+      捕获进程 → [共享内存槽位] → 推理进程 → [预测记录] → 主进程显示线程 → on_result(frame, prediction)
+    source_factory(*source_args) 在捕获进程中创建帧源（必须是可以按名称导入的函数，例如 create_screen_source）；
+    frame_bytes 为最大一帧的字节数（例如屏幕宽 x 高 x 4），决定每个槽位的大小
+    """
+
+    STAGES = ('capture', 'preprocess', 'inference', 'display')
+
+    def __init__(self, model_path, labels, source_factory, source_args=(), frame_bytes=1920 * 1080 * 4,
+                 on_result=None, on_error=None, slots=4, drop_stale=True, max_frames=None,
+                 scheduler_args=None, change_detection=None, tile_grid=None, tile_overlap=0.1, regions=None,
+                 num_threads=None, use_xnnpack=True, metrics=None, recorder=None, frame_writer=None):
+        self.model_path = model_path
+        self.labels = labels
+        self.source_factory = source_factory
+        self.source_args = tuple(source_args)
+        self.slot_bytes = int(frame_bytes)
+        self.slots = slots
+        self.drop_stale = drop_stale
+        self.max_frames = max_frames
+        self.scheduler_args = scheduler_args
+        self.engine_args = {'num_threads': num_threads, 'use_xnnpack': use_xnnpack}
+        self._settings = {'tile_grid': tile_grid, 'tile_overlap': tile_overlap, 'regions': regions,
+                          'change_detection': change_detection}
+        self.on_result = on_result
+        self.on_error = on_error
+        self.metrics = metrics
+        self.recorder = recorder
+        # 帧录制：在显示线程中把槽位里的帧写入录制文件（只包含实际分类过的帧）
+        self.frame_writer = frame_writer
+        self.bbox = None
+        self.last_prediction = None
+
+        # 工作进程使用 spawn 方式启动，不继承Tk和已加载的解释器
+        self._context = multiprocessing.get_context("spawn")
+        self._shm = None
+        self._processes = []
+        self._display_thread = None
+        self.is_running = False
+        self.processed = dict.fromkeys(self.STAGES, 0)
+        self.errors = dict.fromkeys(self.STAGES, 0)
+        self.dropped = 0
+        self.reused = 0
+        self.waited = 0
+        self.scheduler_stats = None
+        self.worker_pids = {}
+        self.start_time = None
+        self.end_time = None
+
+    # 与 FramePipeline 相同的可写属性，运行中修改时发送给推理进程
+    @property
+    def tile_grid(self):
+        return self._settings['tile_grid']
+
+    @tile_grid.setter
+    def tile_grid(self, value):
+        self._update_settings(tile_grid=value)
+
+    @property
+    def regions(self):
+        return self._settings['regions']
+
+    @regions.setter
+    def regions(self, value):
+        self._update_settings(regions=value)
+
+    @property
+    def fanout(self):
+        return None
+
+    @fanout.setter
+    def fanout(self, value):
+        if value is not None:
+            print("多进程流水线不支持多模型并行和级联，继续使用当前模型")
+
+    def _update_settings(self, **values):
+        self._settings.update(values)
+        if self.is_running:
+            self._inference_control.put(('settings', values))
+
+    def set_bbox(self, bbox):
+        """设置捕获区域 (left, top, right, bottom)，None 表示全屏；运行中发送给捕获进程"""
+        self.bbox = bbox
+        if self.is_running:
+            self._capture_control.put(('bbox', bbox))
+
+    def set_engine(self, engine):
+        """运行中切换模型：推理进程按模型路径重新创建引擎，下一帧起生效"""
+        self.model_path = engine.model_path
+        self.labels = engine.labels
+        if self.is_running:
+            self._inference_control.put(('model', (engine.model_path, engine.labels)))
+
+    def start(self):
+        ctx = self._context
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+        self._free_slots = ctx.Queue()
+        for slot in range(self.slots):
+            self._free_slots.put(slot)
+        self._frames = ctx.Queue()
+        self._results = ctx.Queue()
+        self._capture_control = ctx.Queue()
+        self._inference_control = ctx.Queue()
+        self._stop_event = ctx.Event()
+        if self.bbox is not None:
+            self._capture_control.put(('bbox', self.bbox))
+
+        self.is_running = True
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        capture = ctx.Process(
+            target=_capture_worker, name="pipeline-capture", daemon=True,
+            args=(self._shm.name, self.slot_bytes, self.source_factory, self.source_args, self.scheduler_args,
+                  self.max_frames, self._free_slots, self._frames, self._results, self._capture_control,
+                  self._stop_event))
+        inference = ctx.Process(
+            target=_inference_worker, name="pipeline-inference", daemon=True,
+            args=(self._shm.name, self.slot_bytes, self.model_path, self.labels, self.engine_args,
+                  dict(self._settings), self.drop_stale, self._free_slots, self._frames, self._results,
+                  self._inference_control, self._stop_event))
+        self._processes = [capture, inference]
+        for process in self._processes:
+            process.start()
+        self.worker_pids = {'capture': capture.pid, 'inference': inference.pid}
+        self._display_thread = threading.Thread(target=self._display_stage, name="pipeline-display", daemon=True)
+        self._display_thread.start()
+
+    def _report_error(self, stage, message, error_count):
+        self.errors[stage] += 1
+        print(f"{stage}阶段错误 #{error_count}: {message}")
+        if self.on_error is not None:
+            self.on_error(stage, message, error_count)
+
+    def _display_stage(self):
+        """主进程中的显示线程：接收预测记录，用槽位中的图像调用 on_result 后归还槽位"""
+        metrics = self.metrics
+        while True:
+            try:
+                message = self._results.get(timeout=0.2)
+            except queue.Empty:
+                if not any(process.is_alive() for process in self._processes):
+                    break
+                continue
+            kind = message[0]
+            if kind == 'end':
+                break
+            if kind == 'ready':
+                continue
+            if kind == 'model':
+                _, self.model_path, self.labels = message
+                continue
+            if kind == 'error':
+                _, stage, text, error_count = message
+                self._report_error(stage, text, error_count)
+                continue
+
+            _, slot, index, timestamp, shape, channel_order, source, prediction, timings, stats = message
+            self.dropped = stats['dropped']
+            if stats['capture'] is not None:
+                self.waited = stats['capture']['waited']
+                self.processed['capture'] = stats['capture']['captured']
+                self.scheduler_stats = stats['capture']['scheduler']
+            else:
+                self.processed['capture'] = max(self.processed['capture'], index + 1)
+            now = time.perf_counter()
+            if metrics is not None:
+                for stage, seconds in timings.items():
+                    metrics.observe(stage, seconds, now)
+            # 复用上一次结果的帧没有推理耗时，单独计数，与线程流水线一致
+            self.processed['preprocess'] += 1
+            if 'inference' in timings:
+                self.processed['inference'] += 1
+            else:
+                self.reused += 1
+            self.last_prediction = prediction
+            if self.scheduler_args is not None and self.is_running:
+                self._capture_control.put(('observe', _top_label(prediction)))
+
+            frame = _SharedFrame(_slot_view(self._shm, slot, self.slot_bytes, shape), index, timestamp,
+                                 channel_order, source, timings)
+            try:
+                start = time.perf_counter()
+                if self.frame_writer is not None:
+                    self.frame_writer.write(frame)
+                if self.recorder is not None:
+                    self.recorder.record(frame, prediction, os.path.basename(self.model_path), timings)
+                if self.is_running and self.on_result is not None:
+                    self.on_result(frame, prediction)
+                end = time.perf_counter()
+                if metrics is not None:
+                    metrics.observe('display', end - start, end)
+                self.processed['display'] += 1
+            except Exception as e:
+                self._report_error('display', e, self.errors['display'] + 1)
+            finally:
+                # 回调返回后不再引用槽位，交还给捕获进程
+                frame.image = None
+                self._free_slots.put(slot)
+        self.end_time = time.perf_counter()
+
+    def stop(self, wait=True, timeout=2.0):
+        """停止工作进程；在Tk主线程中调用时应传 wait=False，进程在后台线程中回收"""
+        if not self.is_running and self._shm is None:
+            return
+        self.is_running = False
+        self._stop_event.set()
+        if wait:
+            self._shutdown(timeout)
+        else:
+            threading.Thread(target=self._shutdown, args=(timeout,), name="pipeline-shutdown").start()
+
+    def _shutdown(self, timeout):
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        if self._display_thread is not None and self._display_thread is not threading.current_thread():
+            self._display_thread.join(timeout)
+        if self.end_time is None:
+            self.end_time = time.perf_counter()
+        self._release()
+
+    def _release(self):
+        shm = self._shm
+        if shm is None:
+            return
+        self._shm = None
+        _close_shm(shm)
+        shm.unlink()
+
+    def wait(self):
+        """等待帧源读完且所有帧处理完毕"""
+        self._display_thread.join()
+        for process in self._processes:
+            process.join()
+        self.is_running = False
+        self._release()
+
+    def get_stats(self):
+        """返回与 FramePipeline 相同结构的统计：各阶段处理数、丢帧数以及整体帧率"""
+        end = self.end_time or time.perf_counter()
+        elapsed = end - self.start_time if self.start_time else 0.0
+        stages = {name: {'processed': self.processed[name], 'errors': self.errors[name]} for name in self.STAGES}
+        stages['inference'].update({'depth': 0, 'maxsize': self.slots, 'put': self.processed['capture'],
+                                    'dropped': self.dropped, 'reused': self.reused})
+        stages['capture'].update({'depth': 0, 'maxsize': self.slots, 'put': self.processed['capture'],
+                                  'dropped': self.waited})
+        stats = {
+            'elapsed': elapsed,
+            'fps': self.processed['display'] / elapsed if elapsed > 0 else 0.0,
+            'inference_fps': self.processed['inference'] / elapsed if elapsed > 0 else 0.0,
+            'stages': stages,
+            'processes': dict(self.worker_pids),
+        }
+        if self.metrics is not None:
+            stats['latency'] = self.metrics.snapshot()
+        if self.scheduler_stats is not None:
+            stats['scheduler'] = self.scheduler_stats
+        return stats
+
+    def prometheus_text(self, prefix="classifier"):
+        gauges = {}
+        for name in self.STAGES:
+            gauges[('frames_processed', name)] = self.processed[name]
+            gauges[('errors', name)] = self.errors[name]
+        gauges[('frames_dropped', 'inference')] = self.dropped
+        gauges[('frames_dropped', 'capture')] = self.waited
+        gauges[('frames_reused', 'inference')] = self.reused
+        metrics = self.metrics if self.metrics is not None else PipelineMetrics()
+        return metrics.to_prometheus(prefix, gauges)
+
+    def format_stats(self):
+        """生成一行简短的状态文本，便于在状态栏显示"""
+        stats = self.get_stats()
+        parts = [f"{stats['fps']:.1f} FPS (多进程)"]
+        scheduler = self.scheduler_stats
+        if scheduler is not None:
+            parts.append(f"目标 {scheduler['target_fps']:.1f} / 实际 {scheduler['achieved_fps']:.1f} FPS")
+        parts.append(f"旧帧丢弃 {self.dropped}")
+        parts.append(f"槽位等待 {self.waited}")
+        return " | ".join(parts)
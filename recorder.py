@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预测记录
+把每帧的预测结果（时间、模型、区域、top-k类别和置信度、各阶段耗时）异步写入磁盘：
+记录时只在预分配的环形缓冲区中写一行（持锁时间只是一次内存复制），后台线程批量追加到按列存放的文件中；
+磁盘变慢导致缓冲区写满时丢弃新记录并计数，而不是阻塞调用方
+
+会话目录结构（每列一个文件，按行追加，可用 numpy.memmap 直接映射）:
+  schema.json     列的数据类型和形状、模型/区域/标签字典、已提交的行数
+  time.bin        float64，记录时间（Unix时间，单调不减）
+  frame.bin       int64，帧序号
+  model.bin       int16，模型字典编码
+  region.bin      int16，区域字典编码，-1 表示整帧
+  top_k.bin       int16 x K，标签字典编码，-1 表示空位
+  conf.bin        float32 x K，置信度
+  stage_ms.bin    float32 x S，各阶段耗时（毫秒），NaN 表示未测量
+
+用法（查询）:
+  python recorder.py recordings/20261018_101500 --last 60
+  python recorder.py recordings/20261018_101500 --start "2026-10-18 10:15:00" --end "2026-10-18 10:16:00"
+"""
+
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+SCHEMA_FILENAME = "schema.json"
+SCHEMA_VERSION = 1
+
+# 记录耗时的阶段
+RECORD_STAGES = ('capture', 'preprocess', 'inference')
+
+
+def _columns(top_k, stages):
+    """列名 -> (数据类型, 每行形状)"""
+    return {
+        'time': ('<f8', ()),
+        'frame': ('<i8', ()),
+        'model': ('<i2', ()),
+        'region': ('<i2', ()),
+        'top_k': ('<i2', (top_k,)),
+        'conf': ('<f4', (top_k,)),
+        'stage_ms': ('<f4', (len(stages),)),
+    }
+
+
+def prediction_rows(prediction, model_name):
+    """
+    把一帧的预测结果展开为 [(模型, 区域, 预测列表), ...]：
+    多模型模式每个模型一行，多区域模式每个区域一行，分块模式为汇总结果和每块各一行，级联模式记录给出结果的模型
+    """
+    if isinstance(prediction, dict) and 'models' in prediction:
+        return [(name, None, predictions) for name, predictions in prediction['models'].items()]
+    if isinstance(prediction, dict) and 'stage' in prediction:
+        return [(prediction['stage'], None, prediction['predictions'])]
+    if isinstance(prediction, dict) and 'regions' in prediction:
+        return [(model_name, region['name'], region['predictions']) for region in prediction['regions']]
+    if isinstance(prediction, dict):
+        rows = [(model_name, "汇总", prediction['aggregate'])]
+        rows += [(model_name, f"块{i + 1}", tile['predictions']) for i, tile in enumerate(prediction['tiles'])]
+        return rows
+    return [(model_name, None, prediction)]
+
+
+class PredictionRecorder:
+    """
+    异步预测记录器
+    record() 只写入内存中的环形缓冲区，后台线程每 flush_interval 秒或积累 flush_rows 行时批量写入磁盘
+    """
+
+    def __init__(self, directory, top_k=3, capacity=8192, flush_interval=1.0, flush_rows=1024,
+                 stages=RECORD_STAGES):
+        self.directory = directory
+        self.top_k = top_k
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.stages = tuple(stages)
+        if os.path.exists(os.path.join(directory, SCHEMA_FILENAME)):
+            raise FileExistsError(f"目录中已有记录，请使用新的目录: {directory}")
+        os.makedirs(directory, exist_ok=True)
+
+        self.columns = _columns(top_k, self.stages)
+        self._ring = {name: np.empty((capacity,) + shape, dtype=dtype)
+                      for name, (dtype, shape) in self.columns.items()}
+        # 环形缓冲区中待写入的行为 [_tail, _head)
+        self._head = 0
+        self._tail = 0
+        self._last_time = 0.0
+        # 字典编码：模型、区域和标签字符串 -> 整数
+        self._dicts = {'model': {}, 'region': {}, 'label': {}}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+        self.recorded = 0
+        self.dropped = 0
+        self.rows_written = 0
+        self.flushes = 0
+        self.flush_time = 0.0
+        self.write_errors = 0
+
+        self._files = {name: open(os.path.join(directory, f"{name}.bin"), "ab") for name in self.columns}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="prediction-recorder", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def create_session(cls, root, **kwargs):
+        """在 root 下按当前时间创建一个新的会话目录"""
+        name = time.strftime("%Y%m%d_%H%M%S")
+        directory = os.path.join(root, name)
+        suffix = 1
+        while os.path.exists(directory):
+            directory = os.path.join(root, f"{name}_{suffix}")
+            suffix += 1
+        return cls(directory, **kwargs)
+
+    def _code(self, kind, value):
+        codes = self._dicts[kind]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+    def record(self, frame, prediction, model_name=None, timings=None):
+        """
+        记录一帧的预测结果，不进行任何磁盘操作；缓冲区已满时丢弃并返回 False
+        timings 为 {阶段: 秒}
+        """
+        rows = prediction_rows(prediction, model_name or "")
+        now = time.time()
+        stage_ms = [timings[stage] * 1000 if timings and stage in timings else np.nan for stage in self.stages]
+        with self._lock:
+            if self._closed:
+                return False
+            if self._head - self._tail + len(rows) > self.capacity:
+                self.dropped += len(rows)
+                return False
+            # 时间列保持单调不减，查询时可以直接二分查找
+            now = max(now, self._last_time)
+            self._last_time = now
+            ring = self._ring
+            for model, region, predictions in rows:
+                i = self._head % self.capacity
+                ring['time'][i] = now
+                ring['frame'][i] = frame.index
+                ring['model'][i] = self._code('model', model)
+                ring['region'][i] = -1 if region is None else self._code('region', region)
+                top_k = ring['top_k'][i]
+                conf = ring['conf'][i]
+                top_k.fill(-1)
+                conf.fill(0.0)
+                for j, (label, confidence) in enumerate(predictions[:self.top_k]):
+                    top_k[j] = self._code('label', label)
+                    conf[j] = confidence
+                ring['stage_ms'][i] = stage_ms
+                self._head += 1
+            self.recorded += len(rows)
+            pending = self._head - self._tail
+        if pending >= self.flush_rows:
+            self._wakeup.set()
+        return True
+
+    def _take_pending(self):
+        """在锁内把待写入的行复制出来并释放缓冲区空间，返回 (各列数组, 字典快照)"""
+        with self._lock:
+            start, end = self._tail, self._head
+            if end == start:
+                return None, None
+            first = start % self.capacity
+            count = end - start
+            if first + count <= self.capacity:
+                chunk = {name: column[first:first + count].copy() for name, column in self._ring.items()}
+            else:
+                # 跨越环形缓冲区末尾，分两段复制
+                split = self.capacity - first
+                chunk = {name: np.concatenate((column[first:], column[:count - split]))
+                         for name, column in self._ring.items()}
+            self._tail = end
+            dicts = {kind: list(codes) for kind, codes in self._dicts.items()}
+        return chunk, dicts
+
+    def flush(self):
+        """把缓冲区中的记录追加到磁盘并更新 schema.json（只在后台线程或关闭时调用）"""
+        chunk, dicts = self._take_pending()
+        if chunk is None:
+            return
+        start = time.perf_counter()
+        rows = len(chunk['time'])
+        try:
+            for name, f in self._files.items():
+                f.write(chunk[name].tobytes())
+                f.flush()
+            # 列文件写完之后才提交行数，读取方不会看到写了一半的行；schema 写入成功后才计入已写入的行
+            self._write_schema(dicts, self.rows_written + rows)
+            self.rows_written += rows
+        except (OSError, ValueError) as e:
+            # ValueError：上次回滚后未能重新打开的列文件
+            self.write_errors += 1
+            with self._lock:
+                self.dropped += rows
+            print(f"预测记录写入失败，丢弃 {rows} 行: {e}")
+            self._rollback()
+        self.flushes += 1
+        self.flush_time += time.perf_counter() - start
+
+    def _rollback(self):
+        """
+        把各列文件截断到已提交的行数，避免部分写入导致各列错位：
+        先关闭文件（丢弃写缓冲区中尚未写出的字节，关闭时写出的部分随后被截断），截断后重新打开
+        """
+        for name, f in self._files.items():
+            dtype, shape = self.columns[name]
+            row_bytes = np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64))
+            path = os.path.join(self.directory, f"{name}.bin")
+            try:
+                f.close()
+            except OSError:
+                pass
+            try:
+                os.truncate(path, self.rows_written * row_bytes)
+                self._files[name] = open(path, "ab")
+            except OSError as e:
+                print(f"预测记录列文件恢复失败 {name}: {e}")
+
+    def _write_schema(self, dicts, rows):
+        schema = {
+            'version': SCHEMA_VERSION,
+            'rows': rows,
+            'top_k': self.top_k,
+            'stages': list(self.stages),
+            'columns': {name: {'dtype': dtype, 'shape': list(shape)} for name, (dtype, shape) in self.columns.items()},
+            'models': dicts['model'],
+            'regions': dicts['region'],
+            'labels': dicts['label'],
+        }
+        path = os.path.join(self.directory, SCHEMA_FILENAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(schema, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def get_stats(self):
+        return {
+            'directory': self.directory,
+            'recorded': self.recorded,
+            'dropped': self.dropped,
+            'rows_written': self.rows_written,
+            'pending': self._head - self._tail,
+            'flushes': self.flushes,
+            'mean_flush_ms': self.flush_time / self.flushes * 1000 if self.flushes else 0.0,
+            'write_errors': self.write_errors,
+        }
+
+    def close(self):
+        """停止后台线程，写入剩余的记录并关闭文件"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class RecordingReader:
+    """
+    读取记录会话：各列用 numpy.memmap 映射，按时间查询时在时间列上二分查找，
+    只有查询范围内的行会被读入内存
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, SCHEMA_FILENAME), "r", encoding="utf-8") as f:
+            self.schema = json.load(f)
+        self.models = self.schema['models']
+        self.regions = self.schema['regions']
+        self.labels = self.schema['labels']
+        self.stages = self.schema['stages']
+        self.rows = self.schema['rows']
+        self._columns = {}
+        for name, info in self.schema['columns'].items():
+            path = os.path.join(directory, f"{name}.bin")
+            shape = (self.rows,) + tuple(info['shape'])
+            if self.rows == 0:
+                self._columns[name] = np.empty(shape, dtype=info['dtype'])
+            else:
+                # 只映射已提交的行，写入中的部分不会被读取
+                self._columns[name] = np.memmap(path, dtype=info['dtype'], mode="r", shape=shape)
+
+    def column(self, name):
+        """返回整列的只读映射（不读入内存）"""
+        return self._columns[name]
+
+    def time_range(self):
+        """返回 (最早时间, 最晚时间)，没有记录时返回 None"""
+        if self.rows == 0:
+            return None
+        times = self._columns['time']
+        return float(times[0]), float(times[-1])
+
+    def _slice(self, start, end):
+        times = self._columns['time']
+        first = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+        last = self.rows if end is None else int(np.searchsorted(times, end, side="right"))
+        return first, last
+
+    def query(self, start=None, end=None, model=None, region=None):
+        """
+        查询时间范围 [start, end]（Unix时间）内的记录，返回 {列名: 数组}；
+        model / region 为名称时再按模型或区域过滤
+        """
+        first, last = self._slice(start, end)
+        data = {name: np.array(column[first:last]) for name, column in self._columns.items()}
+        mask = None
+        if model is not None:
+            # 也接受不带目录的模型文件名
+            codes = [i for i, name in enumerate(self.models) if model in (name, os.path.basename(name))]
+            mask = np.isin(data['model'], codes)
+        if region is not None:
+            code = self.regions.index(region) if region in self.regions else -2
+            region_mask = data['region'] == code
+            mask = region_mask if mask is None else mask & region_mask
+        if mask is not None:
+            data = {name: values[mask] for name, values in data.items()}
+        return data
+
+    def iter_records(self, start=None, end=None, model=None, region=None):
+        """逐行返回解码后的记录字典"""
+        data = self.query(start, end, model, region)
+        for i in range(len(data['time'])):
+            region_code = int(data['region'][i])
+            predictions = [(self.labels[code], float(conf))
+                           for code, conf in zip(data['top_k'][i], data['conf'][i]) if code >= 0]
+            yield {
+                'time': float(data['time'][i]),
+                'frame': int(data['frame'][i]),
+                'model': self.models[int(data['model'][i])],
+                'region': self.regions[region_code] if region_code >= 0 else None,
+                'predictions': predictions,
+                'stage_ms': {stage: float(v) for stage, v in zip(self.stages, data['stage_ms'][i]) if not np.isnan(v)},
+            }
+
+
+def format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def parse_time(text):
+    """解析Unix时间或 "YYYY-MM-DD HH:MM:SS" 格式的本地时间"""
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def main():
+    """主函数：按时间范围查询记录会话"""
+    parser = argparse.ArgumentParser(description="查询预测记录")
+    parser.add_argument("directory", help="记录会话目录")
+    parser.add_argument("--start", default=None, help="开始时间（Unix时间或 YYYY-MM-DD HH:MM:SS）")
+    parser.add_argument("--end", default=None, help="结束时间")
+    parser.add_argument("--last", type=float, default=None, help="只查询最后N秒的记录")
+    parser.add_argument("--model", default=None, help="只显示该模型的记录")
+    parser.add_argument("--region", default=None, help="只显示该区域的记录")
+    parser.add_argument("--limit", type=int, default=50, help="最多打印的行数，0 表示不限制")
+    args = parser.parse_args()
+
+    reader = RecordingReader(args.directory)
+    time_range = reader.time_range()
+    if time_range is None:
+        print("没有记录")
+        return
+    first, last = time_range
+    print(f"共 {reader.rows} 行, {format_time(first)} ~ {format_time(last)}, 模型: {', '.join(reader.models)}")
+
+    start = parse_time(args.start) if args.start else None
+    end = parse_time(args.end) if args.end else None
+    if args.last is not None:
+        start = last - args.last
+
+    shown = 0
+    for record in reader.iter_records(start, end, args.model, args.region):
+        if args.limit and shown >= args.limit:
+            print("...")
+            break
+        top = ", ".join(f"{label} {confidence:.2%}" for label, confidence in record['predictions'])
+        region = f" [{record['region']}]" if record['region'] else ""
+        timings = " ".join(f"{stage}={ms:.1f}ms" for stage, ms in record['stage_ms'].items())
+        print(f"{format_time(record['time'])} #{record['frame']} {record['model']}{region}: {top}  {timings}")
+        shown += 1
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多区域捕获
+一组命名的屏幕区域：每次只截取包含所有区域的最小矩形，再按各区域在截图中的位置裁剪（视图，不复制），
+所有区域缩放后一次批量推理；区域可以保存为JSON文件，部署时直接加载
+"""
+
+import json
+import os
+
+REGIONS_VERSION = 1
+
+
+class Region:
+    """命名的屏幕区域，坐标为屏幕像素"""
+    __slots__ = ('name', 'x', 'y', 'width', 'height')
+
+    def __init__(self, name, x, y, width, height):
+        if width <= 0 or height <= 0:
+            raise ValueError(f"区域 {name} 的宽高必须为正数: {width}x{height}")
+        self.name = name
+        self.x = int(x)
+        self.y = int(y)
+        self.width = int(width)
+        self.height = int(height)
+
+    @property
+    def bbox(self):
+        """(left, top, right, bottom)"""
+        return (self.x, self.y, self.x + self.width, self.y + self.height)
+
+    def to_dict(self):
+        return {'name': self.name, 'x': self.x, 'y': self.y, 'width': self.width, 'height': self.height}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(str(data['name']), data['x'], data['y'], data['width'], data['height'])
+
+    def __repr__(self):
+        return f"Region({self.name!r}, {self.x}, {self.y}, {self.width}, {self.height})"
+
+
+def load_regions(path):
+    """从JSON文件读取区域列表"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    regions = [Region.from_dict(item) for item in data.get('regions', [])]
+    names = [region.name for region in regions]
+    if len(set(names)) != len(names):
+        raise ValueError(f"区域名称重复: {names}")
+    return regions
+
+
+def save_regions(regions, path):
+    """原子地把区域列表写入JSON文件"""
+    data = {'version': REGIONS_VERSION, 'regions': [region.to_dict() for region in regions]}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def parse_regions(spec):
+    """解析命令行区域描述 "名称=x,y,w,h;名称=x,y,w,h"，或者是区域JSON文件的路径"""
+    if os.path.isfile(spec):
+        return load_regions(spec)
+    regions = []
+    for part in spec.split(";"):
+        if not part.strip():
+            continue
+        name, _, values = part.partition("=")
+        x, y, width, height = (int(v) for v in values.split(","))
+        regions.append(Region(name.strip(), x, y, width, height))
+    return regions
+
+
+def capture_bbox(regions):
+    """包含所有区域的最小矩形 (left, top, right, bottom)，每次只截取这一块"""
+    boxes = [region.bbox for region in regions]
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def relative_boxes(regions, origin=(0, 0)):
+    """各区域相对于截图左上角 origin 的位置 [(名称, (x0, y0, x1, y1)), ...]"""
+    left, top = origin[0], origin[1]
+    return [(region.name, (region.x - left, region.y - top,
+                           region.x + region.width - left, region.y + region.height - top))
+            for region in regions]
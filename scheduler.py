@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应帧率调度
+按截止时间安排每一帧的捕获（处理耗时计入帧间隔，而不是处理完再固定睡眠），
+可选 CPU预算模式（负载过高时降低帧率）和空闲模式（预测结果持续稳定时降低帧率）
+"""
+
+import os
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from metrics import RateMeter
+
+
+class FrameScheduler:
+    """
+    target_fps  : 目标帧率
+    min_fps     : CPU预算模式下允许降到的最低帧率
+    cpu_budget  : CPU占用上限（0-1，整机所有核心的比例），None 表示不限制；
+                  安装了 psutil 时按整机负载计算，否则按本进程的CPU时间计算
+    idle_after  : 预测结果连续稳定多少秒后进入空闲模式，None 表示不启用
+    idle_fps    : 空闲模式下的帧率
+    """
+
+    def __init__(self, target_fps=10.0, min_fps=1.0, cpu_budget=None,
+                 idle_after=None, idle_fps=2.0, cpu_check_interval=1.0):
+        self.target_fps = target_fps
+        self.min_fps = min_fps
+        self.cpu_budget = cpu_budget
+        self.idle_after = idle_after
+        self.idle_fps = idle_fps
+        self.cpu_check_interval = cpu_check_interval
+
+        self._wakeup = threading.Event()
+        self.reset()
+
+    def reset(self):
+        """重新开始调度（开始新一轮捕获时调用）"""
+        self._wakeup.clear()
+        self._next = None
+        # CPU预算模式下对帧率的缩放系数
+        self.throttle = 1.0
+        self.cpu_load = None
+        self._cpu_checked = time.perf_counter()
+        self._cpu_process_time = time.process_time()
+        if psutil is not None:
+            # 第一次调用只建立基准
+            psutil.cpu_percent(interval=None)
+        self.idle = False
+        self._last_label = None
+        self._stable_since = None
+        self._meter = RateMeter()
+
+    def close(self):
+        """唤醒正在等待的捕获线程"""
+        self._wakeup.set()
+
+    @property
+    def current_fps(self):
+        """当前生效的帧率设定值"""
+        base = min(self.idle_fps, self.target_fps) if self.idle else self.target_fps
+        return max(min(self.min_fps, base), base * self.throttle)
+
+    @property
+    def mode(self):
+        if self.idle:
+            return "idle"
+        if self.throttle < 1.0:
+            return "throttled"
+        return "active"
+
+    def _measure_cpu(self, now):
+        """返回上次测量以来的CPU占用（0-1）"""
+        if psutil is not None:
+            return psutil.cpu_percent(interval=None) / 100.0
+        process_time = time.process_time()
+        elapsed = now - self._cpu_checked
+        load = (process_time - self._cpu_process_time) / (elapsed * (os.cpu_count() or 1))
+        self._cpu_process_time = process_time
+        return load
+
+    def _update_throttle(self, now):
+        if self.cpu_budget is None or now - self._cpu_checked < self.cpu_check_interval:
+            return
+        self.cpu_load = self._measure_cpu(now)
+        self._cpu_checked = now
+        if self.cpu_load > self.cpu_budget:
+            # 超出预算时成倍降低，低于预算一定余量时缓慢恢复
+            self.throttle = max(self.min_fps / self.target_fps, self.throttle * 0.8)
+        elif self.cpu_load < self.cpu_budget * 0.8:
+            self.throttle = min(1.0, self.throttle * 1.1)
+
+    def wait(self):
+        """等待到下一帧的截止时间；返回 False 表示调度已关闭"""
+        now = time.perf_counter()
+        self._update_throttle(now)
+        interval = 1.0 / self.current_fps
+        if self._next is None or now >= self._next + interval:
+            # 落后超过一个周期时不补帧，从当前时间重新开始
+            self._next = now
+        delay = self._next - now
+        if delay > 0 and self._wakeup.wait(delay):
+            return False
+        self._next += interval
+        self._meter.mark(time.perf_counter())
+        return not self._wakeup.is_set()
+
+    def observe(self, label, now=None):
+        """记录最新的预测结果（top-1标签），用于判断是否进入空闲模式"""
+        if self.idle_after is None:
+            return
+        now = time.perf_counter() if now is None else now
+        if label != self._last_label or self._stable_since is None:
+            self._last_label = label
+            self._stable_since = now
+            self.idle = False
+        elif now - self._stable_since >= self.idle_after:
+            self.idle = True
+
+    def get_stats(self):
+        return {
+            'target_fps': self.target_fps,
+            'current_fps': self.current_fps,
+            'achieved_fps': self._meter.rate(),
+            'mode': self.mode,
+            'throttle': self.throttle,
+            'cpu_load': self.cpu_load,
+        }
+
+    def format_stats(self):
+        stats = self.get_stats()
+        text = f"目标 {stats['target_fps']:.1f} / 设定 {stats['current_fps']:.1f} / 实际 {stats['achieved_fps']:.1f} FPS"
+        if stats['mode'] != "active":
+            text += f" ({'空闲' if stats['mode'] == 'idle' else '降频'})"
+        return text
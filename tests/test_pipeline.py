@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流水线测试：使用假的引擎和帧源，不需要TFLite运行时
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from change_detector import ChangeDetector
+from frame_sources import Frame
+from pipeline import FramePipeline
+
+
+class SlowEngine:
+    """每次分类耗时 delay 秒，按画面亮度给出 scene0 / scene1"""
+    resized_shape = (8, 8, 3)
+    model_path = "slow.tflite"
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = 0
+
+    def preprocess_image(self, image, out=None):
+        if out is None or out.shape != self.resized_shape:
+            out = np.empty(self.resized_shape, dtype=np.uint8)
+        out[:] = image[:8, :8, :3]
+        return out
+
+    def classify_image(self, image, channel_order="BGR"):
+        time.sleep(self.delay)
+        self.calls += 1
+        return [("scene1" if image.mean() > 100 else "scene0", 1.0)]
+
+
+class SceneSource:
+    """前 change_at 帧为黑色画面，之后为白色画面，每帧间隔 interval 秒"""
+
+    def __init__(self, frames, change_at, interval=0.002):
+        self.frames = frames
+        self.change_at = change_at
+        self.interval = interval
+        self.index = 0
+
+    def read(self):
+        if self.index >= self.frames:
+            return None
+        time.sleep(self.interval)
+        value = 255 if self.index >= self.change_at else 0
+        frame = Frame(np.full((32, 32, 3), value, dtype=np.uint8), self.index)
+        self.index += 1
+        return frame
+
+    def close(self):
+        pass
+
+
+def test_change_detection_with_dropped_frames():
+    """队列容量为1、推理较慢时，画面变化后的帧被丢弃也不能一直复用变化前的结果"""
+    results = []
+    engine = SlowEngine()
+    detector = ChangeDetector(threshold=2.0, refresh_interval=100.0)
+    pipeline = FramePipeline(engine, SceneSource(60, change_at=2, interval=0.01), queue_size=1, drop_stale=True,
+                             change_detector=detector,
+                             on_result=lambda frame, prediction: results.append((frame.index, prediction[0][0])))
+    pipeline.start()
+    pipeline.wait()
+
+    after_change = [label for index, label in results if index >= 10]
+    assert after_change, "画面变化之后没有输出任何帧"
+    assert set(after_change) == {"scene1"}
+    # 画面只变化了一次，大部分帧应复用结果
+    assert engine.calls <= 10
+    assert pipeline.reused > 0
+
+
+class CheckingEngine(SlowEngine):
+    """分类期间检查输入缓冲区是否被下一帧的预处理覆盖"""
+
+    def __init__(self, delay=0.02):
+        super().__init__(delay)
+        self.overwritten = 0
+
+    def classify_image(self, image, channel_order="BGR"):
+        value = int(image[0, 0, 0])
+        time.sleep(self.delay)
+        self.calls += 1
+        if not (image == value).all():
+            self.overwritten += 1
+        return [(f"frame{value}", 1.0)]
+
+
+class CountingSource(SceneSource):
+    """每帧画面的值为帧序号（按256取模）"""
+
+    def read(self):
+        if self.index >= self.frames:
+            return None
+        time.sleep(self.interval)
+        frame = Frame(np.full((32, 32, 3), self.index % 256, dtype=np.uint8), self.index)
+        self.index += 1
+        return frame
+
+
+def test_preprocess_buffers_not_overwritten_during_inference():
+    """丢弃旧帧时预处理阶段不能覆盖推理阶段正在读取的缓冲区"""
+    results = []
+    engine = CheckingEngine()
+    pipeline = FramePipeline(engine, CountingSource(200, change_at=0, interval=0.001), queue_size=1,
+                             drop_stale=True,
+                             on_result=lambda frame, prediction: results.append((frame.index, prediction[0][0])))
+    pipeline.start()
+    pipeline.wait()
+
+    assert engine.calls > 0
+    assert engine.overwritten == 0
+    assert all(label == f"frame{index % 256}" for index, label in results)
+    # 缓冲区归还后重复使用，不会每帧新分配
+    assert pipeline._buffers.allocated <= 4
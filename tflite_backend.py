@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TFLite运行时选择
+优先使用轻量的解释器包（ai_edge_litert / tflite_runtime），都不可用时回退到完整的TensorFlow；
+导入推迟到第一次创建解释器时进行，程序启动时不加载任何推理运行时。
+环境变量 TFLITE_BACKEND 可以指定使用的运行时
+"""
+
+import os
+import threading
+import time
+
+# 按优先顺序排列的运行时
+BACKENDS = ("ai_edge_litert", "tflite_runtime", "tensorflow")
+
+
+class Backend:
+    """已导入的运行时：名称、Interpreter 类、OpResolverType（旧版本可能没有）和导入耗时"""
+
+    def __init__(self, name, interpreter_class, op_resolver_type, import_seconds):
+        self.name = name
+        self.Interpreter = interpreter_class
+        self.OpResolverType = op_resolver_type
+        self.import_seconds = import_seconds
+
+
+_backend = None
+_lock = threading.Lock()
+
+
+def _import_backend(name):
+    if name == "ai_edge_litert":
+        from ai_edge_litert import interpreter as module
+    elif name == "tflite_runtime":
+        from tflite_runtime import interpreter as module
+    elif name == "tensorflow":
+        from tensorflow.lite.python import interpreter as module
+    else:
+        raise ValueError(f"未知的TFLite运行时: {name}")
+    return module.Interpreter, getattr(module, "OpResolverType", None)
+
+
+def load_backend(name=None):
+    """
+    导入并返回运行时；name 为 None 时使用环境变量 TFLITE_BACKEND，
+    仍未指定时按 BACKENDS 的顺序选择第一个可以导入的运行时
+    """
+    global _backend
+    name = name or os.environ.get("TFLITE_BACKEND") or None
+    with _lock:
+        if _backend is not None and name in (None, _backend.name):
+            return _backend
+
+        errors = []
+        for candidate in ([name] if name else BACKENDS):
+            start = time.perf_counter()
+            try:
+                interpreter_class, op_resolver_type = _import_backend(candidate)
+            except ImportError as e:
+                errors.append(f"{candidate}: {e}")
+                continue
+            backend = Backend(candidate, interpreter_class, op_resolver_type, time.perf_counter() - start)
+            if _backend is None:
+                _backend = backend
+            print(f"TFLite运行时: {candidate} (导入耗时 {backend.import_seconds:.2f}s)")
+            return backend
+        raise ImportError("没有可用的TFLite运行时，请安装 ai-edge-litert、tflite-runtime 或 tensorflow: "
+                          + "; ".join(errors))
+
+
+def create_interpreter(model_path=None, model_content=None, num_threads=None, use_xnnpack=True, backend=None):
+    """创建解释器；use_xnnpack 为 False 时不应用默认委托（运行时支持 OpResolverType 时）"""
+    backend = backend or load_backend()
+    kwargs = {'model_path': model_path, 'model_content': model_content, 'num_threads': num_threads}
+    if backend.OpResolverType is not None:
+        kwargs['experimental_op_resolver_type'] = (
+            backend.OpResolverType.AUTO if use_xnnpack
+            else backend.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES)
+    elif not use_xnnpack:
+        print(f"{backend.name} 不支持关闭默认委托，仍使用XNNPACK")
+    return backend.Interpreter(**kwargs)
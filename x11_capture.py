@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+X11共享内存截图（Linux）
+通过 ctypes 调用 libX11 / libXext 的 MIT-SHM 扩展：保持与X服务器的连接和共享内存段，
+每次只抓取指定区域，直接返回引用共享内存的numpy数组，不经过PIL也不做额外复制
+"""
+
+import ctypes
+import ctypes.util
+import os
+
+import numpy as np
+
+ZPIXMAP = 2
+ALL_PLANES = 0xFFFFFFFFFFFFFFFF if ctypes.sizeof(ctypes.c_ulong) == 8 else 0xFFFFFFFF
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ('shmseg', ctypes.c_ulong),
+        ('shmid', ctypes.c_int),
+        ('shmaddr', ctypes.c_void_p),
+        ('readOnly', ctypes.c_int),
+    ]
+
+
+class XImage(ctypes.Structure):
+    # 只声明用到的前几个字段，结构体由Xlib分配，不会按此大小创建
+    _fields_ = [
+        ('width', ctypes.c_int),
+        ('height', ctypes.c_int),
+        ('xoffset', ctypes.c_int),
+        ('format', ctypes.c_int),
+        ('data', ctypes.c_void_p),
+        ('byte_order', ctypes.c_int),
+        ('bitmap_unit', ctypes.c_int),
+        ('bitmap_bit_order', ctypes.c_int),
+        ('bitmap_pad', ctypes.c_int),
+        ('depth', ctypes.c_int),
+        ('bytes_per_line', ctypes.c_int),
+        ('bits_per_pixel', ctypes.c_int),
+        ('red_mask', ctypes.c_ulong),
+        ('green_mask', ctypes.c_ulong),
+        ('blue_mask', ctypes.c_ulong),
+    ]
+
+
+class XErrorEvent(ctypes.Structure):
+    _fields_ = [
+        ('type', ctypes.c_int),
+        ('display', ctypes.c_void_p),
+        ('resourceid', ctypes.c_ulong),
+        ('serial', ctypes.c_ulong),
+        ('error_code', ctypes.c_ubyte),
+        ('request_code', ctypes.c_ubyte),
+        ('minor_code', ctypes.c_ubyte),
+    ]
+
+
+_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XErrorEvent))
+
+_libs = None
+
+
+def _load_libraries():
+    """加载并声明 libX11 / libXext / libc 中用到的函数，只执行一次"""
+    global _libs
+    if _libs is not None:
+        return _libs
+
+    def load(name):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            raise OSError(f"找不到库: lib{name}")
+        return ctypes.CDLL(path)
+
+    xlib, xext, libc = load("X11"), load("Xext"), ctypes.CDLL(None, use_errno=True)
+    display_p = ctypes.c_void_p
+    ximage_p = ctypes.POINTER(XImage)
+    shminfo_p = ctypes.POINTER(XShmSegmentInfo)
+
+    signatures = (
+        (xlib.XOpenDisplay, [ctypes.c_char_p], display_p),
+        (xlib.XCloseDisplay, [display_p], ctypes.c_int),
+        (xlib.XDefaultScreen, [display_p], ctypes.c_int),
+        (xlib.XDefaultRootWindow, [display_p], ctypes.c_ulong),
+        (xlib.XDefaultVisual, [display_p, ctypes.c_int], ctypes.c_void_p),
+        (xlib.XDefaultDepth, [display_p, ctypes.c_int], ctypes.c_int),
+        (xlib.XDisplayWidth, [display_p, ctypes.c_int], ctypes.c_int),
+        (xlib.XDisplayHeight, [display_p, ctypes.c_int], ctypes.c_int),
+        (xlib.XSync, [display_p, ctypes.c_int], ctypes.c_int),
+        (xlib.XDestroyImage, [ximage_p], ctypes.c_int),
+        (xlib.XSetErrorHandler, [ctypes.c_void_p], ctypes.c_void_p),
+        (xext.XShmQueryExtension, [display_p], ctypes.c_int),
+        (xext.XShmCreateImage, [display_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                                ctypes.c_void_p, shminfo_p, ctypes.c_uint, ctypes.c_uint], ximage_p),
+        (xext.XShmAttach, [display_p, shminfo_p], ctypes.c_int),
+        (xext.XShmDetach, [display_p, shminfo_p], ctypes.c_int),
+        (xext.XShmGetImage, [display_p, ctypes.c_ulong, ximage_p, ctypes.c_int, ctypes.c_int,
+                             ctypes.c_ulong], ctypes.c_int),
+        (libc.shmget, [ctypes.c_int, ctypes.c_size_t, ctypes.c_int], ctypes.c_int),
+        (libc.shmat, [ctypes.c_int, ctypes.c_void_p, ctypes.c_int], ctypes.c_void_p),
+        (libc.shmdt, [ctypes.c_void_p], ctypes.c_int),
+        (libc.shmctl, [ctypes.c_int, ctypes.c_int, ctypes.c_void_p], ctypes.c_int),
+    )
+    for func, argtypes, restype in signatures:
+        func.argtypes = argtypes
+        func.restype = restype
+
+    _libs = (xlib, xext, libc)
+    return _libs
+
+
+class _ShmImage:
+    """一个共享内存段及其对应的XImage"""
+
+    def __init__(self, grabber, width, height):
+        xlib, xext, libc = grabber.libs
+        self.grabber = grabber
+        self.width = width
+        self.height = height
+        self.shminfo = XShmSegmentInfo()
+        self.attached = False
+        self.shmaddr = None
+
+        self.ximage = xext.XShmCreateImage(grabber.display, grabber.visual, grabber.depth, ZPIXMAP,
+                                           None, ctypes.byref(self.shminfo), width, height)
+        if not self.ximage:
+            raise RuntimeError("XShmCreateImage 失败")
+        image = self.ximage.contents
+        if image.bits_per_pixel != 32:
+            self.release()
+            raise RuntimeError(f"不支持的像素格式: {image.bits_per_pixel} 位/像素")
+        size = image.bytes_per_line * image.height
+
+        shmid = libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if shmid < 0:
+            self.release()
+            raise OSError(ctypes.get_errno(), "shmget 失败")
+        address = libc.shmat(shmid, None, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            libc.shmctl(shmid, IPC_RMID, None)
+            self.release()
+            raise OSError(ctypes.get_errno(), "shmat 失败")
+        self.shmaddr = address
+        self.shminfo.shmid = shmid
+        self.shminfo.shmaddr = address
+        self.shminfo.readOnly = 0
+        image.data = address
+
+        try:
+            grabber.checked(lambda: xext.XShmAttach(grabber.display, ctypes.byref(self.shminfo)), "XShmAttach")
+            self.attached = True
+        finally:
+            # 标记删除：所有使用者分离后自动释放，进程异常退出也不会遗留共享内存段
+            libc.shmctl(shmid, IPC_RMID, None)
+            if not self.attached:
+                self.release()
+
+        buffer = (ctypes.c_ubyte * size).from_address(address)
+        # 每个像素4字节（B, G, R, 填充），行宽可能大于 width
+        self.array = np.frombuffer(buffer, dtype=np.uint8).reshape(
+            height, image.bytes_per_line // 4, 4)[:, :width]
+
+    def release(self):
+        xlib, xext, libc = self.grabber.libs
+        if self.attached:
+            xext.XShmDetach(self.grabber.display, ctypes.byref(self.shminfo))
+            xlib.XSync(self.grabber.display, 0)
+            self.attached = False
+        if self.shmaddr is not None:
+            libc.shmdt(self.shmaddr)
+            self.shmaddr = None
+        if self.ximage:
+            # 数据指向共享内存，不能由 XDestroyImage 释放
+            self.ximage.contents.data = None
+            xlib.XDestroyImage(self.ximage)
+            self.ximage = None
+        self.array = None
+
+
+class XShmGrabber:
+    """
+    X11共享内存截图器
+    grab() 返回 (高, 宽, 4) 的uint8数组，直接引用共享内存（第4通道为填充）；
+    共享内存段按 buffers 个轮转使用，返回的数组在之后 buffers-1 次抓取内保持有效
+    """
+
+    def __init__(self, display=None, buffers=4):
+        self.libs = _load_libraries()
+        xlib, xext, _ = self.libs
+        name = (display or os.environ.get("DISPLAY") or "").encode() or None
+        self.display = xlib.XOpenDisplay(name)
+        if not self.display:
+            raise RuntimeError(f"无法连接X服务器: {display or os.environ.get('DISPLAY')}")
+        if not xext.XShmQueryExtension(self.display):
+            xlib.XCloseDisplay(self.display)
+            self.display = None
+            raise RuntimeError("X服务器不支持MIT-SHM扩展")
+
+        screen = xlib.XDefaultScreen(self.display)
+        self.root = xlib.XDefaultRootWindow(self.display)
+        self.visual = xlib.XDefaultVisual(self.display, screen)
+        self.depth = xlib.XDefaultDepth(self.display, screen)
+        self.screen_size = (xlib.XDisplayWidth(self.display, screen), xlib.XDisplayHeight(self.display, screen))
+
+        self.buffers = max(2, buffers)
+        self._ring = []
+        self._index = 0
+        self._size = None
+        # 尺寸变化后旧的共享内存段：[(剩余抓取次数, 段列表)]，仍可能被下游引用，延迟释放
+        self._retired = []
+
+        # 通过第一个共享内存段确认通道顺序
+        probe = _ShmImage(self, 1, 1)
+        red_mask = probe.ximage.contents.red_mask
+        probe.release()
+        self.channel_order = "RGB" if red_mask == 0xFF else "BGR"
+
+    def checked(self, call, name):
+        """执行一次X请求并同步，把X错误转换为异常，而不是由Xlib默认处理函数退出进程"""
+        xlib = self.libs[0]
+        errors = []
+
+        def handler(display, event):
+            errors.append(event.contents.error_code)
+            return 0
+
+        callback = _ERROR_HANDLER(handler)
+        previous = xlib.XSetErrorHandler(ctypes.cast(callback, ctypes.c_void_p))
+        try:
+            result = call()
+            xlib.XSync(self.display, 0)
+        finally:
+            xlib.XSetErrorHandler(previous)
+        if errors or not result:
+            raise RuntimeError(f"{name} 失败 (X错误码 {errors})")
+        return result
+
+    def ensure_buffers(self, count):
+        """保证至少有 count 个轮转的共享内存段（新增的段在第一次使用时分配）"""
+        if count > self.buffers:
+            if self._ring:
+                self._ring[self._index:self._index] = [None] * (count - self.buffers)
+            self.buffers = count
+
+    def _clamp(self, bbox):
+        """把 (left, top, right, bottom) 限制在屏幕范围内，超出屏幕的 XShmGetImage 会产生X错误"""
+        width, height = self.screen_size
+        if bbox is None:
+            return 0, 0, width, height
+        left, top, right, bottom = (int(v) for v in bbox)
+        left = min(max(left, 0), width - 1)
+        top = min(max(top, 0), height - 1)
+        right = min(max(right, left + 1), width)
+        bottom = min(max(bottom, top + 1), height)
+        return left, top, right, bottom
+
+    def _next_image(self, width, height):
+        if self._size != (width, height):
+            # 区域尺寸变化：旧的段再经过 buffers 次抓取后释放
+            if self._ring:
+                self._retired.append([self.buffers, self._ring])
+            self._ring = [None] * self.buffers
+            self._index = 0
+            self._size = (width, height)
+        for entry in self._retired:
+            entry[0] -= 1
+        for entry in [entry for entry in self._retired if entry[0] <= 0]:
+            self._retired.remove(entry)
+            for image in entry[1]:
+                if image is not None:
+                    image.release()
+
+        i = self._index
+        self._index = (i + 1) % self.buffers
+        if self._ring[i] is None:
+            self._ring[i] = _ShmImage(self, width, height)
+        return self._ring[i]
+
+    def grab(self, bbox=None):
+        """抓取 bbox 区域 (left, top, right, bottom)，None 表示全屏"""
+        left, top, right, bottom = self._clamp(bbox)
+        image = self._next_image(right - left, bottom - top)
+        if not self.libs[1].XShmGetImage(self.display, self.root, image.ximage, left, top, ALL_PLANES):
+            raise RuntimeError("XShmGetImage 失败")
+        return image.array
+
+    def close(self):
+        """释放共享内存段并断开连接；之后不能再访问 grab() 返回的数组"""
+        if self.display is None:
+            return
+        for image in self._ring:
+            if image is not None:
+                image.release()
+        for _, images in self._retired:
+            for image in images:
+                if image is not None:
+                    image.release()
+        self._ring = []
+        self._retired = []
+        self.libs[0].XCloseDisplay(self.display)
+        self.display = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()